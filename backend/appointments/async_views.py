@@ -0,0 +1,225 @@
+"""
+Async variants of the hot appointment endpoints, served under /api/async/.
+
+They accept the same token and return the same JSON as the DRF views, but
+read through the async ORM so an ASGI worker does not hold a thread per
+in-flight request. Writes need a transaction, which the ORM only offers
+synchronously, so booking and cancelling run in asgiref's sync thread.
+"""
+import asyncio
+import base64
+import json
+from datetime import datetime
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import serializers
+
+from . import availability, booking, events, schedules
+from .authentication import aauthenticate
+from .models import Appointment, Doctor
+from .serializers import AppointmentSerializer
+
+# The stream only works under ASGI, so deployments opt in to it
+SLOT_STREAM_ENABLED = getattr(settings, 'SLOT_STREAM_ENABLED', False)
+# Streams end after this long and the client reconnects, which re-sends the
+# snapshot and re-checks the token
+SLOT_STREAM_SECONDS = getattr(settings, 'SLOT_STREAM_SECONDS', 300)
+# A comment line keeps proxies from closing a quiet stream
+SLOT_STREAM_KEEPALIVE = getattr(settings, 'SLOT_STREAM_KEEPALIVE', 15)
+SLOT_STREAM_RETRY_MS = getattr(settings, 'SLOT_STREAM_RETRY_MS', 3000)
+
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def token_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await aauthenticate(request)
+        if user is None:
+            response = JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+            response['WWW-Authenticate'] = 'Token'
+            return response
+        request.user = user
+        return await view(request, *args, **kwargs)
+    # Token authentication only, so there is no session cookie to protect
+    return csrf_exempt(wrapper)
+
+
+def _encode_cursor(appointment):
+    raw = f'{appointment.date.isoformat()}|{appointment.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    date, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(date), int(pk)
+
+
+@token_required
+async def appointments(request):
+    if request.method == 'GET':
+        return await _list_appointments(request)
+    if request.method == 'POST':
+        return await _create_appointment(request)
+    return _error(f'Method "{request.method}" not allowed.', 405)
+
+
+async def _list_appointments(request):
+    """The patient's appointments newest first, keyset-paginated on (date, id)."""
+    try:
+        page_size = min(int(request.GET.get('page_size', settings.API_PAGE_SIZE)), settings.API_MAX_PAGE_SIZE)
+        cursor = _decode_cursor(request.GET['cursor']) if request.GET.get('cursor') else None
+    except (ValueError, TypeError):
+        return _error('Invalid cursor or page_size', 400)
+    if page_size < 1:
+        return _error('Invalid cursor or page_size', 400)
+
+    queryset = AppointmentSerializer.setup_eager_loading(
+        Appointment.objects.filter(patient=request.user)
+    ).order_by('-date', '-id')
+    if cursor:
+        date, pk = cursor
+        queryset = queryset.filter(Q(date__lt=date) | Q(date=date, id__lt=pk))
+    page = [appointment async for appointment in queryset[:page_size + 1]]
+
+    next_url = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        query = request.GET.copy()
+        query['cursor'] = _encode_cursor(page[-1])
+        next_url = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+    return JsonResponse({
+        'next': next_url,
+        'previous': None,
+        'results': AppointmentSerializer(page, many=True).data,
+    })
+
+
+async def _create_appointment(request):
+    try:
+        data = json.loads(request.body or b'{}')
+        doctor_id = data['doctor']
+        date = serializers.DateTimeField().to_internal_value(data['date'])
+    except (ValueError, KeyError, TypeError):
+        return _error('doctor and date are required as JSON', 400)
+    except serializers.ValidationError as e:
+        return JsonResponse({'date': e.detail}, status=400)
+
+    try:
+        doctor = await Doctor.objects.aget(pk=doctor_id)
+    except (Doctor.DoesNotExist, ValueError, TypeError):
+        return JsonResponse({'doctor': [f'Invalid pk "{doctor_id}" - object does not exist.']}, status=400)
+    schedule = (await schedules.aload([doctor]))[doctor.id]
+    if not availability.is_slot_start(doctor, date, schedule):
+        return JsonResponse({'date': ["Appointments must start on one of the doctor's slots."]}, status=400)
+    if date < timezone.now():
+        return _error('Cannot create appointments in the past', 400)
+
+    try:
+        appointment = await sync_to_async(booking.book)(request.user, doctor, date, data.get('notes', ''))
+    except IntegrityError:
+        return _error('This time slot is already booked', 409)
+    return JsonResponse(AppointmentSerializer(appointment).data, status=201)
+
+
+@token_required
+async def cancel_appointment(request, pk):
+    if request.method != 'POST':
+        return _error(f'Method "{request.method}" not allowed.', 405)
+    try:
+        appointment = await Appointment.objects.select_related('doctor', 'patient').aget(pk=pk, patient=request.user)
+    except Appointment.DoesNotExist:
+        return JsonResponse({'detail': 'No Appointment matches the given query.'}, status=404)
+
+    error = booking.cancellation_error(appointment)
+    if error:
+        return _error(error, 400)
+    await sync_to_async(booking.cancel)(appointment)
+    return JsonResponse({'message': 'Appointment cancelled successfully', 'status': 'cancelled'})
+
+
+async def _doctor_day(request):
+    """The ``doctor_id`` and ``date`` query parameters, or an error response."""
+    if request.method != 'GET':
+        return _error(f'Method "{request.method}" not allowed.', 405)
+    doctor_id = request.GET.get('doctor_id')
+    date = request.GET.get('date')
+    if not doctor_id or not date:
+        return _error('Both doctor_id and date are required', 400)
+    try:
+        doctor = await Doctor.objects.aget(id=doctor_id)
+        day = datetime.strptime(date, '%Y-%m-%d').date()
+    except (Doctor.DoesNotExist, ValueError):
+        return _error('Invalid doctor_id or date format', 400)
+    return doctor, day
+
+
+@token_required
+async def available_slots(request):
+    result = await _doctor_day(request)
+    if isinstance(result, JsonResponse):
+        return result
+    doctor, day = result
+    schedule = (await schedules.aload([doctor]))[doctor.id]
+    minutes = await availability.abooked_minutes(doctor.id, day)
+    return JsonResponse(availability.day_slots(doctor, day, minutes, schedule), safe=False)
+
+
+def _sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+async def _slot_events(doctor, day):
+    # Subscribe before reading the snapshot so no change can fall in between
+    subscription = events.broker.subscribe(events.slot_channel(doctor.id, day))
+    try:
+        yield f'retry: {SLOT_STREAM_RETRY_MS}\n\n'
+        schedule = (await schedules.aload([doctor]))[doctor.id]
+        event = events.RESYNC
+        deadline = asyncio.get_running_loop().time() + SLOT_STREAM_SECONDS
+        while True:
+            if event is None:
+                yield ': keep-alive\n\n'
+            elif event is events.RESYNC:
+                minutes = await availability.abooked_minutes(doctor.id, day)
+                yield _sse('snapshot', availability.day_slots(doctor, day, minutes, schedule))
+            else:
+                yield _sse(event['type'], event['data'])
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                return
+            event = await subscription.get(min(SLOT_STREAM_KEEPALIVE, remaining))
+    finally:
+        subscription.close()
+
+
+@token_required
+async def slot_stream(request):
+    """
+    Server-sent events for one doctor's day: a ``snapshot`` of every slot, then
+    ``taken``/``freed`` as bookings on that day commit.
+
+    The stream holds no thread while idle, so it needs an ASGI server; under
+    WSGI Django would buffer it to the end. It is a 404 unless
+    ``SLOT_STREAM_ENABLED`` is set.
+    """
+    if not SLOT_STREAM_ENABLED:
+        return _error('Live slot updates are not enabled; poll available_slots instead', 404)
+    result = await _doctor_day(request)
+    if isinstance(result, JsonResponse):
+        return result
+    doctor, day = result
+    response = StreamingHttpResponse(_slot_events(doctor, day), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
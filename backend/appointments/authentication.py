@@ -0,0 +1,183 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.authtoken.models import Token
+
+
+class TokenCache:
+    """
+    Two-tier token -> user cache.
+
+    The first tier is a per-process LRU with a short TTL, the second the shared
+    Django cache. Evictions delete the shared entry and bump a shared
+    generation; every process re-reads the generation at most once per
+    ``check_interval`` seconds and empties its local tier when it moved, so a
+    logout or deactivation reaches all workers within that interval.
+    """
+    generation_key = 'auth-token-generation'
+
+    def __init__(self, max_size, ttl, shared_ttl, check_interval):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared_ttl = shared_ttl
+        self.check_interval = check_interval
+        self._generation = None
+        self._checked_until = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _shared_key(key):
+        # Never put raw tokens into a cache other processes can read
+        return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+    def _due(self, now):
+        return now >= self._checked_until
+
+    def _sync(self, generation, now):
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+            self._checked_until = now + self.check_interval
+
+    def _get_local(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.copy(entry[1])
+                del self._entries[key]
+        return None
+
+    def _record_shared(self, key, user, now):
+        with self._lock:
+            if user is None:
+                self.misses += 1
+            else:
+                self.shared_hits += 1
+                self._store(key, user, now)
+
+    def get(self, key):
+        now = time.monotonic()
+        if self._due(now):
+            self._sync(cache.get(self.generation_key), now)
+        user = self._get_local(key, now)
+        if user is None:
+            user = cache.get(self._shared_key(key))
+            self._record_shared(key, user, now)
+        return user
+
+    async def aget(self, key):
+        now = time.monotonic()
+        if self._due(now):
+            self._sync(await cache.aget(self.generation_key), now)
+        user = self._get_local(key, now)
+        if user is None:
+            user = await cache.aget(self._shared_key(key))
+            self._record_shared(key, user, now)
+        return user
+
+    def set(self, key, user):
+        cache.set(self._shared_key(key), user, self.shared_ttl)
+        with self._lock:
+            self._store(key, user, time.monotonic())
+
+    async def aset(self, key, user):
+        await cache.aset(self._shared_key(key), user, self.shared_ttl)
+        with self._lock:
+            self._store(key, user, time.monotonic())
+
+    def _store(self, key, user, now):
+        self._entries[key] = (now + self.ttl, copy.copy(user))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def evict(self, key):
+        cache.delete(self._shared_key(key))
+        cache.add(self.generation_key, 0, None)
+        cache.incr(self.generation_key)
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation = None
+            self._checked_until = 0
+            self.hits = self.shared_hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
+
+
+token_cache = TokenCache(
+    max_size=getattr(settings, 'TOKEN_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'TOKEN_CACHE_TTL', 60),
+    shared_ttl=getattr(settings, 'TOKEN_CACHE_SHARED_TTL', 300),
+    check_interval=getattr(settings, 'TOKEN_CACHE_CHECK_INTERVAL', 1),
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that skips the Token/User join for recently seen tokens."""
+
+    def authenticate_credentials(self, key):
+        user = token_cache.get(key)
+        if user is not None:
+            # Deactivations made without a save (queryset updates) are not evicted
+            if not user.is_active:
+                raise AuthenticationFailed('User inactive or deleted.')
+            return user, Token(key=key, user=user)
+
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user)
+        return user, token
+
+
+async def aauthenticate(request):
+    """
+    Resolve an ``Authorization: Token <key>`` header for the async views.
+
+    Shares the token cache with CachedTokenAuthentication. Returns the active
+    user, or None when the header is missing or the token is unknown.
+    """
+    parts = request.headers.get('Authorization', '').split()
+    if len(parts) != 2 or parts[0].lower() != 'token':
+        return None
+    key = parts[1]
+    user = await token_cache.aget(key)
+    if user is not None and not user.is_active:
+        return None
+    if user is None:
+        try:
+            token = await Token.objects.select_related('user').aget(key=key)
+        except Token.DoesNotExist:
+            return None
+        user = token.user
+        if not user.is_active:
+            return None
+        await token_cache.aset(key, user)
+    return user
@@ -0,0 +1,234 @@
+from datetime import datetime, time, timedelta
+from time import time_ns
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import caching, schedules
+from .models import Appointment
+
+CACHE_TIMEOUT = getattr(settings, 'AVAILABILITY_CACHE_TIMEOUT', 60 * 60)
+MAX_RANGE_DAYS = getattr(settings, 'AVAILABILITY_MAX_RANGE_DAYS', 31)
+# Doctors one range query may cover; the result is doctors x days
+MAX_RANGE_DOCTORS = getattr(settings, 'AVAILABILITY_MAX_RANGE_DOCTORS', 100)
+
+
+GENERATION_KEY = 'availability:generation'
+
+
+def _generation():
+    return cache.get_or_set(GENERATION_KEY, time_ns, None)
+
+
+async def _ageneration():
+    return await cache.aget_or_set(GENERATION_KEY, time_ns, None)
+
+
+def _cache_key(doctor_id, day, generation=None):
+    if generation is None:
+        generation = _generation()
+    return f'availability:{generation}:{doctor_id}:{day.isoformat()}'
+
+
+def day_range(day):
+    """Return the aware [start, end) datetimes covering a local calendar day."""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(day, time.min), tz)
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def _midnights(start_day, end_day):
+    """
+    Aware local midnights from start_day through the day after end_day.
+
+    Time zone rules are applied once per day here; rows are then placed and
+    converted by plain datetime arithmetic instead of a conversion each.
+    """
+    tz = timezone.get_current_timezone()
+    return [
+        timezone.make_aware(datetime.combine(start_day + timedelta(days=offset), time.min), tz)
+        for offset in range((end_day - start_day).days + 2)
+    ]
+
+
+def _minute_of_day(value, midnight, next_midnight):
+    if midnight.utcoffset() == next_midnight.utcoffset():
+        return int((value - midnight).total_seconds()) // 60
+    # The clocks change during this day, so elapsed time is not wall-clock time
+    return schedules.minute_of_day(timezone.localtime(value))
+
+
+def _scheduled_dates(doctor_id, day):
+    start, end = day_range(day)
+    return Appointment.objects.filter(
+        doctor_id=doctor_id,
+        status='scheduled',
+        date__gte=start,
+        date__lt=end,
+    ).order_by().values_list('date', flat=True)
+
+
+def booked_minutes(doctor_id, day):
+    """
+    Sorted minute-of-day offsets of a doctor's scheduled appointments on a day.
+
+    The tuple is cached per (doctor, day) and dropped by the appointment signals
+    whenever a booking on that day is created, moved or cancelled. In a
+    process-local cache the drop reaches this worker only, so entries there
+    live for ``caching.LOCAL_TIMEOUT`` seconds at most.
+    """
+    key = _cache_key(doctor_id, day)
+    minutes = cache.get(key)
+    if minutes is None:
+        midnight, next_midnight = _midnights(day, day)
+        dates = _scheduled_dates(doctor_id, day)
+        minutes = tuple(sorted(_minute_of_day(d, midnight, next_midnight) for d in dates))
+        cache.set(key, minutes, caching.shared_timeout(CACHE_TIMEOUT))
+    return minutes
+
+
+async def abooked_minutes(doctor_id, day):
+    """booked_minutes for async views; reads and fills the same cache entries."""
+    key = _cache_key(doctor_id, day, await _ageneration())
+    minutes = await cache.aget(key)
+    if minutes is None:
+        midnight, next_midnight = _midnights(day, day)
+        dates = _scheduled_dates(doctor_id, day)
+        minutes = tuple(sorted([_minute_of_day(d, midnight, next_midnight) async for d in dates]))
+        await cache.aset(key, minutes, caching.shared_timeout(CACHE_TIMEOUT))
+    return minutes
+
+
+def is_slot_start(doctor, date, schedule=None):
+    local = timezone.localtime(date)
+    if local.second or local.microsecond:
+        return False
+    if schedule is None:
+        schedule = schedules.for_doctor(doctor)
+    return schedules.minute_of_day(local) in schedule.starts(local.date())
+
+
+def day_slots(doctor, day, minutes=None, schedule=None):
+    if minutes is None:
+        minutes = booked_minutes(doctor.id, day)
+    if schedule is None:
+        schedule = schedules.for_doctor(doctor)
+    return [{'time': schedules.hhmm(start), 'is_available': free} for start, free in schedule.slots(day, minutes)]
+
+
+def invalidate(doctor_id, date):
+    cache.delete(_cache_key(doctor_id, timezone.localdate(date)))
+
+
+def invalidate_days(doctor_days):
+    """Drop the cached ``(doctor_id, day)`` pairs in one cache call."""
+    generation = _generation()
+    cache.delete_many([_cache_key(doctor_id, day, generation) for doctor_id, day in doctor_days])
+
+
+def invalidate_all():
+    """Drop every cached day at once, for bulk writes that bypass the model signals."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, time_ns(), None)
+
+
+def _booked_by_day(doctor_ids, start_day, end_day):
+    """
+    Yield ``(day, {doctor_id: minutes})`` for each day in [start_day, end_day].
+
+    All days come from a single date-ordered query that is consumed lazily, so
+    callers that stop early never read the remaining rows.
+    """
+    midnights = _midnights(start_day, end_day)
+    rows = Appointment.objects.filter(
+        doctor_id__in=doctor_ids,
+        status='scheduled',
+        date__gte=midnights[0],
+        date__lt=midnights[-1],
+    ).order_by('date').values_list('doctor_id', 'date').iterator()
+
+    pending = next(rows, None)
+    for offset in range(len(midnights) - 1):
+        midnight, next_midnight = midnights[offset], midnights[offset + 1]
+        booked = {}
+        while pending is not None and pending[1] < next_midnight:
+            booked.setdefault(pending[0], []).append(_minute_of_day(pending[1], midnight, next_midnight))
+            pending = next(rows, None)
+        yield start_day + timedelta(days=offset), {doctor_id: tuple(minutes) for doctor_id, minutes in booked.items()}
+
+
+def range_matrix(doctors, start_day, end_day):
+    """Free slot times per doctor per day, also warming the per-day cache."""
+    matrix = {doctor.id: {} for doctor in doctors}
+    loaded = schedules.load(doctors)
+    warmed = {}
+    generation = _generation()
+    for day, booked in _booked_by_day(list(matrix), start_day, end_day):
+        for doctor in doctors:
+            minutes = booked.get(doctor.id, ())
+            warmed[_cache_key(doctor.id, day, generation)] = minutes
+            matrix[doctor.id][day.isoformat()] = [
+                schedules.hhmm(start) for start, free in loaded[doctor.id].slots(day, minutes) if free
+            ]
+    cache.set_many(warmed, caching.shared_timeout(CACHE_TIMEOUT))
+    return matrix
+
+
+def _future_free(schedule, day, minutes, now):
+    for start, free in schedule.slots(day, minutes):
+        if free and (day > now.date() or start >= schedules.minute_of_day(now)):
+            yield start
+
+
+def first_free(doctors, start_day, end_day, limit):
+    """The earliest ``limit`` free, future slots across the doctors, in time order."""
+    now = timezone.localtime()
+    loaded = schedules.load(doctors)
+    found = []
+    for day, booked in _booked_by_day([doctor.id for doctor in doctors], start_day, end_day):
+        if day < now.date():
+            continue
+        candidates = [
+            (start, doctor)
+            for doctor in doctors
+            for start in _future_free(loaded[doctor.id], day, booked.get(doctor.id, ()), now)
+        ]
+        candidates.sort(key=lambda candidate: (candidate[0], candidate[1].id))
+        for start, doctor in candidates[:limit - len(found)]:
+            found.append({
+                'doctor_id': doctor.id,
+                'doctor_name': doctor.name,
+                'date': day.isoformat(),
+                'time': schedules.hhmm(start),
+            })
+        if len(found) >= limit:
+            break
+    return found
+
+
+def next_free(doctors, start_day, end_day):
+    """
+    Each doctor's earliest free, future slot in [start_day, end_day] as
+    ``{doctor_id: (day, minute)}``; doctors without one are left out.
+
+    Stops reading appointments as soon as every doctor has a slot.
+    """
+    now = timezone.localtime()
+    waiting = {doctor.id: doctor for doctor in doctors}
+    loaded = schedules.load(doctors)
+    found = {}
+    for day, booked in _booked_by_day(list(waiting), start_day, end_day):
+        if day < now.date():
+            continue
+        for doctor_id in list(waiting):
+            start = next(_future_free(loaded[doctor_id], day, booked.get(doctor_id, ()), now), None)
+            if start is not None:
+                found[doctor_id] = (day, start)
+                del waiting[doctor_id]
+        if not waiting:
+            break
+    return found
@@ -0,0 +1,152 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp')
+# Square edge lengths in pixels; the largest one is stored on User.avatar
+SIZES = tuple(sorted(getattr(settings, 'AVATAR_SIZES', (64, 256))))
+MAX_UPLOAD_BYTES = getattr(settings, 'AVATAR_MAX_UPLOAD_BYTES', 10 * 1024 * 1024)
+WORKERS = getattr(settings, 'AVATAR_WORKERS', 2)
+
+if features.check('webp'):
+    FORMAT, EXTENSION, SAVE_OPTIONS = 'WEBP', 'webp', {'quality': 85, 'method': 4}
+else:
+    FORMAT, EXTENSION, SAVE_OPTIONS = 'JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}
+# avatars/<first two hex digits>/<sha256>_<size>.<ext>
+NAME_RE = re.compile(r'^avatars/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})_(?P<size>\d+)\.(?P<ext>webp|jpg)$')
+
+_executor = None
+
+
+class InvalidAvatar(ValueError):
+    pass
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='avatars')
+    return _executor
+
+
+def _process_in_worker(user_id, path, digest):
+    try:
+        return process(user_id, path, digest)
+    finally:
+        # Worker threads outlive requests, so nothing else closes their connection
+        connection.close()
+
+
+def thumbnail_name(digest, size, ext=EXTENSION):
+    return f'avatars/{digest[:2]}/{digest}_{size}.{ext}'
+
+
+def thumbnail_names(name):
+    """Map each configured size to its storage name, or {} for legacy uploads."""
+    match = NAME_RE.match(name or '')
+    if not match:
+        return {}
+    return {size: thumbnail_name(match['digest'], size, match['ext']) for size in SIZES}
+
+
+def stage(upload):
+    """
+    Copy an upload to a private temp file chunk by chunk, hashing as it goes.
+
+    Returns ``(path, digest)``. Raises InvalidAvatar for oversized files,
+    decompression bombs or anything Pillow cannot identify; only the header is
+    read for that check.
+    """
+    if upload.content_type not in ALLOWED_TYPES:
+        raise InvalidAvatar('Unsupported file type. Please upload JPEG, PNG, GIF or WebP')
+    if upload.size > MAX_UPLOAD_BYTES:
+        raise InvalidAvatar(f'Avatar must be smaller than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB')
+
+    digest = hashlib.sha256()
+    fd, path = tempfile.mkstemp(prefix='avatar-', dir=settings.FILE_UPLOAD_TEMP_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in upload.chunks():
+                digest.update(chunk)
+                out.write(chunk)
+        with Image.open(path) as image:
+            image.verify()
+    except Image.DecompressionBombError as exc:
+        os.remove(path)
+        raise InvalidAvatar('The image has too many pixels') from exc
+    except (UnidentifiedImageError, OSError, SyntaxError) as exc:
+        os.remove(path)
+        raise InvalidAvatar('The uploaded file is not a valid image') from exc
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
+
+
+def render(path, digest):
+    """Decode the staged file once and store every missing thumbnail size."""
+    names = {size: thumbnail_name(digest, size) for size in SIZES}
+    missing = [size for size, name in names.items() if not default_storage.exists(name)]
+    if not missing:
+        return names
+
+    with Image.open(path) as image:
+        # Let the JPEG decoder downscale while decoding instead of afterwards
+        image.draft('RGB', (SIZES[-1], SIZES[-1]))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for size in sorted(missing, reverse=True):
+            image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, FORMAT, **SAVE_OPTIONS)
+            default_storage.save(names[size], ContentFile(buffer.getvalue()))
+    return names
+
+
+def process(user_id, path, digest):
+    try:
+        names = render(path, digest)
+        user = User.objects.filter(pk=user_id).only('id', 'avatar').first()
+        if user is None:
+            return None
+        previous = user.avatar.name if user.avatar else ''
+        user.avatar = names[SIZES[-1]]
+        user.save(update_fields=['avatar'])
+        # Content-addressed files can be shared by several users, legacy ones cannot
+        if previous and previous != user.avatar.name and not NAME_RE.match(previous):
+            default_storage.delete(previous)
+        return user.avatar.name
+    except Exception:
+        logger.exception('Failed to process avatar for user %s', user_id)
+        raise
+    finally:
+        os.remove(path)
+
+
+def submit(user, upload):
+    """
+    Validate and stage an avatar upload, then resize it off the request thread.
+
+    Returns a future resolving to the new avatar name. With the
+    AVATAR_PROCESS_SYNC setting the work is done in the calling thread and the
+    future is already resolved, which is what tests and scripts want.
+    """
+    path, digest = stage(upload)
+    if getattr(settings, 'AVATAR_PROCESS_SYNC', False):
+        future = Future()
+        future.set_result(process(user.pk, path, digest))
+        return future
+    return _pool().submit(_process_in_worker, user.pk, path, digest)
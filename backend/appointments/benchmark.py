@@ -0,0 +1,421 @@
+"""
+Data generator and load driver behind ``manage.py bench_api``.
+
+Everything is derived from a seed, so two runs with the same arguments build
+the same doctors, patients and appointments and replay the same requests.
+"""
+import asyncio
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date as calendar_date, datetime, time as clock, timedelta
+
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import schedules, search, stats
+from .models import Appointment, DailyStats, Doctor, DoctorSearchTerm, User
+
+SPECIALIZATIONS = (
+    'Cardiology', 'Dermatology', 'Family Medicine', 'Neurology', 'Oncology',
+    'Orthopedics', 'Pediatrics', 'Psychiatry', 'Radiology', 'Urology',
+)
+FIRST_NAMES = (
+    'Amelia', 'Ben', 'Carlos', 'Dana', 'Elif', 'Farah', 'Gregory', 'Hana', 'Ivan', 'José',
+    'Kenji', 'Lena', 'Mateo', 'Nadia', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sven', 'Tariq',
+)
+LAST_NAMES = (
+    'Abbott', 'Brennan', 'Chen', 'Delgado', 'Eriksen', 'Fischer', 'García', 'House', 'Ibrahim',
+    'Jensen', 'Kowalski', 'Lindqvist', 'Moreau', 'Nakamura', 'Okafor', 'Petrov', 'Quintero',
+    'Rossi', 'Schmidt', 'Tanaka', 'Underwood', 'Varga', 'Wilson', 'Yilmaz', 'Zhou',
+)
+# Generated doctors keep the default weekday hours; 2024-01-01 is a Monday
+SLOT_STARTS = schedules.Schedule(Doctor(), ()).starts(calendar_date(2024, 1, 1))
+SLOTS_PER_DAY = len(SLOT_STARTS)
+BATCH_SIZE = 5000
+
+
+def _workdays(start, count):
+    """The first ``count`` days from ``start`` on which generated doctors work."""
+    day = start
+    while count > 0:
+        if day.weekday() in schedules.DEFAULT_WEEKDAYS:
+            yield day
+            count -= 1
+        day += timedelta(days=1)
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+class Dataset:
+    """Sizes of a generated dataset and the date window its bookings cover."""
+
+    def __init__(self, seed=42, doctors=2000, patients=20000, appointments=1000000, fill=0.5, start=None):
+        self.seed = seed
+        self.doctors = doctors
+        self.patients = patients
+        self.appointments = appointments
+        self.fill = fill
+        slots_per_day = doctors * SLOTS_PER_DAY * fill
+        # Working days the bookings are spread over
+        self.days = max(1, math.ceil(appointments / slots_per_day)) if appointments else 0
+        # Bookings straddle the day they are generated so lists hold past and
+        # upcoming appointments; five working days take seven calendar days
+        self.start = start or timezone.localdate() - timedelta(days=self.days * 7 // 10)
+        self.workdays = list(_workdays(self.start, self.days))
+        self.end = self.workdays[-1] + timedelta(days=1) if self.workdays else self.start
+
+    def as_dict(self):
+        return {
+            'seed': self.seed,
+            'doctors': self.doctors,
+            'patients': self.patients,
+            'appointments': self.appointments,
+            'fill': self.fill,
+            'days': self.days,
+            'start': self.start.isoformat(),
+        }
+
+    def kept(self):
+        """
+        This dataset over the window of the bookings already in the database,
+        so a kept database is measured on the days it was generated for.
+        """
+        first = Appointment.objects.order_by('date').values_list('date', flat=True).first()
+        if first is None:
+            return self
+        return Dataset(self.seed, self.doctors, self.patients, self.appointments, self.fill, timezone.localdate(first))
+
+    def _outside_window(self):
+        if not self.workdays:
+            return Appointment.objects.all()
+        start = timezone.make_aware(datetime.combine(self.workdays[0], clock()))
+        end = timezone.make_aware(datetime.combine(self.end, clock()))
+        return Appointment.objects.exclude(date__gte=start, date__lt=end)
+
+    def is_loaded(self):
+        return (
+            Doctor.objects.count() == self.doctors
+            and DoctorSearchTerm.objects.exists() == bool(self.doctors)
+            and User.objects.filter(username__startswith='bench').count() == self.patients
+            and Appointment.objects.count() == self.appointments
+            and not self._outside_window().exists()
+            and DailyStats.objects.exists() == bool(self.appointments)
+        )
+
+    def generate(self):
+        """Bulk insert the dataset into an empty database."""
+        rng = random.Random(self.seed)
+        Doctor.objects.bulk_create(
+            (
+                Doctor(
+                    name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}',
+                    specialization=SPECIALIZATIONS[i % len(SPECIALIZATIONS)],
+                    email=f'doctor{i}@bench.example.com',
+                    phone=f'555-{i:07d}',
+                )
+                for i in range(self.doctors)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        search.reindex()
+        # Unusable passwords skip hashing; clients authenticate with tokens
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'bench{i}',
+                    email=f'patient{i}@bench.example.com',
+                    first_name='Patient',
+                    last_name=str(i),
+                    password='!',
+                )
+                for i in range(self.patients)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        doctor_ids = list(Doctor.objects.order_by('id').values_list('id', flat=True))
+        patient_ids = list(User.objects.filter(username__startswith='bench').order_by('id').values_list('id', flat=True))
+        for batch in _batched(self._appointments(rng, doctor_ids, patient_ids), BATCH_SIZE):
+            Appointment.objects.bulk_create(batch)
+        stats.rebuild()
+
+    def _appointments(self, rng, doctor_ids, patient_ids):
+        now = timezone.now()
+        starts = [clock(minutes // 60, minutes % 60) for minutes in SLOT_STARTS]
+        remaining = self.appointments
+        slots_left = self.days * len(doctor_ids) * len(starts)
+        for day in self.workdays:
+            slots = [timezone.make_aware(datetime.combine(day, start)) for start in starts]
+            for doctor_id in doctor_ids:
+                for date in slots:
+                    # Selection sampling: books exactly `appointments` slots, spread evenly
+                    slots_left -= 1
+                    if rng.random() * (slots_left + 1) >= remaining:
+                        continue
+                    remaining -= 1
+                    if date < now:
+                        status = 'completed'
+                    else:
+                        status = 'cancelled' if rng.random() < 0.1 else 'scheduled'
+                    yield Appointment(
+                        doctor_id=doctor_id,
+                        patient_id=rng.choice(patient_ids),
+                        date=date,
+                        status=status,
+                    )
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Call:
+    """One request a scenario wants sent; ``path`` is relative to the API root."""
+
+    __slots__ = ('method', 'path', 'data', 'token', 'on_response')
+
+    def __init__(self, method, path, data=None, token=None, on_response=None):
+        self.method = method
+        self.path = path
+        self.data = data
+        self.token = token
+        self.on_response = on_response
+
+
+class Runner:
+    """
+    Replays a scenario against the real URLconf through Django's test clients.
+
+    Scenarios are methods named ``scenario_<name>`` that take a per-worker
+    random generator and return the next Call, or None when they run out.
+    The ``wsgi`` transport sends them with a thread per concurrent client
+    through the DRF views; ``asgi`` sends them as concurrent tasks on one
+    event loop through the async views in /api/async/.
+    """
+
+    SCENARIOS = ('doctor_list', 'doctor_search', 'available_slots', 'appointment_list', 'create', 'cancel')
+    ASYNC_SCENARIOS = ('available_slots', 'appointment_list', 'create', 'cancel')
+    PREFIXES = {'wsgi': '/api/', 'asgi': '/api/async/'}
+
+    def __init__(self, dataset, clients=100, seed=None):
+        self.dataset = dataset
+        self.seed = dataset.seed if seed is None else seed
+        self.doctor_ids = list(Doctor.objects.order_by('id').values_list('id', flat=True))
+        patients = User.objects.filter(username__startswith='bench').order_by('id')[:clients]
+        self.tokens = [Token.objects.get_or_create(user=user)[0].key for user in patients]
+        self.created = []
+        self._next_slot = itertools.count()
+        self._lock = threading.Lock()
+
+    def scenario_doctor_list(self, rng):
+        return Call('get', 'doctors/')
+
+    def scenario_doctor_search(self, rng):
+        # A typed prefix, sometimes narrowed to one specialization
+        params = {'q': rng.choice(LAST_NAMES)[:rng.randint(2, 5)]}
+        if rng.random() < 0.3:
+            params['specialization'] = rng.choice(SPECIALIZATIONS)
+        return Call('get', 'doctors/', params)
+
+    def scenario_available_slots(self, rng):
+        day = rng.choice(self.dataset.workdays or [self.dataset.start])
+        return Call('get', 'appointments/available_slots/', {
+            'doctor_id': rng.choice(self.doctor_ids),
+            'date': day.isoformat(),
+        })
+
+    def scenario_appointment_list(self, rng):
+        return Call('get', 'appointments/')
+
+    def scenario_create(self, rng):
+        # Walk a grid of slots after the generated window so bookings never collide
+        with self._lock:
+            index = next(self._next_slot)
+        doctor_id = self.doctor_ids[index % len(self.doctor_ids)]
+        index //= len(self.doctor_ids)
+        minutes = SLOT_STARTS[index % SLOTS_PER_DAY]
+        *_, day = _workdays(self.dataset.end + timedelta(days=1), 1 + index // SLOTS_PER_DAY)
+        date = timezone.make_aware(datetime.combine(day, clock(minutes // 60, minutes % 60)))
+        token = rng.choice(self.tokens)
+
+        def remember(response):
+            if response.status_code == 201:
+                with self._lock:
+                    self.created.append((response.json()['id'], token))
+
+        return Call('post', 'appointments/', {'doctor': doctor_id, 'date': date.isoformat()}, token, remember)
+
+    def scenario_cancel(self, rng):
+        # Cancels what the create scenario booked, each appointment once
+        with self._lock:
+            if not self.created:
+                return None
+            appointment_id, token = self.created.pop()
+        return Call('post', f'appointments/{appointment_id}/cancel/', token=token)
+
+    @staticmethod
+    def _send(client, prefix, call, token):
+        headers = {'Authorization': f'Token {call.token or token}'}
+        if call.method == 'post':
+            return client.post(prefix + call.path, json.dumps(call.data or {}), content_type='application/json', headers=headers)
+        return client.get(prefix + call.path, call.data, headers=headers)
+
+    def _rng(self, scenario, transport, concurrency, worker):
+        return random.Random(f'{self.seed}:{scenario}:{transport}:{concurrency}:{worker}')
+
+    def run(self, scenario, requests, concurrency=1, transport='wsgi'):
+        """Send ``requests`` requests over ``concurrency`` clients and summarize them."""
+        if transport == 'asgi' and scenario not in self.ASYNC_SCENARIOS:
+            raise ValueError(f'{scenario} has no async endpoint')
+        build = getattr(self, f'scenario_{scenario}')
+        prefix = self.PREFIXES[transport]
+        per_worker = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+        started = time.perf_counter()
+        if transport == 'asgi':
+            samples, queries = self._run_asgi(build, prefix, scenario, concurrency, per_worker)
+        else:
+            samples, queries = self._run_wsgi(build, prefix, scenario, concurrency, per_worker), None
+        elapsed = time.perf_counter() - started
+        return summarize(samples, elapsed, concurrency, total_queries=queries)
+
+    def _run_wsgi(self, build, prefix, scenario, concurrency, per_worker):
+        def worker(index, count):
+            rng = self._rng(scenario, 'wsgi', concurrency, index)
+            client = Client()
+            token = rng.choice(self.tokens)
+            samples = []
+            queries = 0
+
+            def count_queries(execute, sql, params, many, context):
+                nonlocal queries
+                queries += 1
+                return execute(sql, params, many, context)
+
+            try:
+                for _ in range(count):
+                    call = build(rng)
+                    if call is None:
+                        break
+                    queries = 0
+                    started = time.perf_counter()
+                    with connection.execute_wrapper(count_queries):
+                        response = self._send(client, prefix, call, token)
+                    samples.append((time.perf_counter() - started, queries, response.status_code))
+                    if call.on_response:
+                        call.on_response(response)
+            finally:
+                if concurrency > 1:
+                    connection.close()
+            return samples
+
+        if concurrency == 1:
+            return worker(0, per_worker[0])
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return [sample for result in pool.map(worker, range(concurrency), per_worker) for sample in result]
+
+    def _run_asgi(self, build, prefix, scenario, concurrency, per_worker):
+        async def worker(index, count):
+            rng = self._rng(scenario, 'asgi', concurrency, index)
+            client = AsyncClient()
+            token = rng.choice(self.tokens)
+            samples = []
+            for _ in range(count):
+                call = build(rng)
+                if call is None:
+                    break
+                started = time.perf_counter()
+                response = await self._send(client, prefix, call, token)
+                samples.append((time.perf_counter() - started, None, response.status_code))
+                if call.on_response:
+                    call.on_response(response)
+            return samples
+
+        async def main():
+            results = await asyncio.gather(*(worker(i, count) for i, count in enumerate(per_worker)))
+            return [sample for result in results for sample in result]
+
+        # async_to_sync runs the ORM's thread-sensitive calls on this thread, so
+        # one wrapper sees every query; requests overlap, so only totals are known.
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            samples = async_to_sync(main)()
+        return samples, queries
+
+    def cleanup(self):
+        """Remove appointments booked by the create scenario."""
+        after = timezone.make_aware(datetime.combine(self.dataset.end + timedelta(days=1), clock()))
+        Appointment.objects.filter(date__gte=after).delete()
+        self.created.clear()
+
+
+def summarize(samples, elapsed, concurrency, total_queries=None):
+    latencies = sorted(seconds for seconds, _, _ in samples)
+    if total_queries is None:
+        queries = [count for _, count, _ in samples]
+    else:
+        # Only a total is known, so spread it evenly
+        queries = [total_queries / len(samples)] * len(samples) if samples else []
+    errors = sum(1 for _, _, code in samples if code >= 400)
+    return {
+        'requests': len(samples),
+        'concurrency': concurrency,
+        'errors': errors,
+        'seconds': round(elapsed, 4),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) * 1000 / len(latencies), 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else 0.0,
+        'max_queries': max(queries, default=0) if total_queries is None else None,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    List regressions of ``results`` against a stored baseline report.
+
+    Latency and throughput may drift by ``tolerance`` (a fraction) before
+    counting; query counts are deterministic and may not grow at all.
+    """
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} req/s")
+        if current['queries_per_request'] > previous['queries_per_request']:
+            regressions.append(
+                f"{name}: queries/request {previous['queries_per_request']} -> {current['queries_per_request']}"
+            )
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{name}: errors {previous['errors']} -> {current['errors']}")
+    return regressions
+
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
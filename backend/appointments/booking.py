@@ -0,0 +1,90 @@
+"""Booking and cancellation steps shared by the sync and async views."""
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import outbox
+from .models import Appointment
+
+# Patients cannot cancel later than this before the appointment starts
+CANCEL_NOTICE = timedelta(hours=1)
+
+
+class SlotTaken(IntegrityError):
+    """
+    Another scheduled booking overlaps the slot. An IntegrityError, so callers
+    answer it like a unique_scheduled_doctor_slot violation.
+    """
+
+
+def check_slot(doctor, date, exclude_id=None):
+    """
+    Raise SlotTaken when a scheduled booking of the doctor overlaps the slot
+    starting at ``date``. The unique constraint only catches identical starts;
+    after schedule or slot length changes, bookings on the old grid can
+    overlap new slots without sharing their start.
+    """
+    length = timedelta(minutes=doctor.slot_minutes)
+    overlapping = Appointment.objects.filter(
+        doctor=doctor, status='scheduled', date__gt=date - length, date__lt=date + length,
+    )
+    if exclude_id is not None:
+        overlapping = overlapping.exclude(pk=exclude_id)
+    if overlapping.exists():
+        raise SlotTaken(f'Doctor {doctor.pk} already has a booking overlapping {date.isoformat()}')
+
+
+def _when(date):
+    return date.strftime("%B %d, %Y at %I:%M %p")
+
+
+def confirm(appointment):
+    """Queue the confirmation email; call inside the transaction that booked it."""
+    outbox.enqueue(
+        'Appointment Confirmation',
+        f'Your appointment with Dr. {appointment.doctor.name} has been scheduled for {_when(appointment.date)}.',
+        [appointment.patient.email],
+    )
+
+
+def book(patient, doctor, date, notes=''):
+    """
+    Insert a scheduled appointment and queue its confirmation in one transaction.
+
+    Raises IntegrityError when the slot was claimed first.
+    """
+    with transaction.atomic():
+        check_slot(doctor, date)
+        appointment = Appointment.objects.create(
+            patient=patient,
+            doctor=doctor,
+            date=date,
+            notes=notes,
+            status='scheduled',
+        )
+        confirm(appointment)
+    return appointment
+
+
+def cancellation_error(appointment, now=None):
+    """Why the appointment cannot be cancelled, or None when it can."""
+    if appointment.status != 'scheduled':
+        return f"Cannot cancel appointment with status '{appointment.status}'"
+    now = now or timezone.now()
+    if appointment.date < now:
+        return "Cannot cancel past appointments"
+    if appointment.date - now < CANCEL_NOTICE:
+        return "Cannot cancel appointments less than 1 hour before the scheduled time"
+    return None
+
+
+def cancel(appointment):
+    with transaction.atomic():
+        appointment.status = 'cancelled'
+        appointment.save(update_fields=['status'])
+        outbox.enqueue(
+            'Appointment Cancelled',
+            f'Your appointment with Dr. {appointment.doctor.name} on {_when(appointment.date)} has been cancelled.',
+            [appointment.patient.email],
+        )
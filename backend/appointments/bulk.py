@@ -0,0 +1,212 @@
+import csv
+import json
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import availability, schedules, stats
+from .caching import appointment_versions
+from .models import Appointment, Doctor, User
+
+FORMATS = ('csv', 'jsonl')
+EXPORT_FIELDS = ['id', 'patient', 'patient_email', 'doctor', 'doctor_name', 'date', 'status', 'notes']
+STATUSES = {value for value, _ in Appointment.STATUS_CHOICES}
+MAX_REPORTED_ERRORS = 100
+
+
+def read_rows(stream, fmt):
+    """Yield ``(line_number, row)`` pairs from a text stream of CSV or JSON Lines."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    yield line_number, None
+    else:
+        raise ValueError(f'Unsupported format {fmt!r}, expected one of {", ".join(FORMATS)}')
+
+
+def _parse(row):
+    if not isinstance(row, dict):
+        raise ValueError('row is not a valid record')
+    if not row.get('doctor'):
+        raise ValueError('doctor is required')
+    if not row.get('patient') and not row.get('patient_email'):
+        raise ValueError('patient or patient_email is required')
+    date = parse_datetime(str(row.get('date') or ''))
+    if date is None:
+        raise ValueError('date must be an ISO 8601 datetime')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    status = row.get('status') or 'scheduled'
+    if status not in STATUSES:
+        raise ValueError(f'status must be one of {", ".join(sorted(STATUSES))}')
+    return {
+        'doctor_id': int(row['doctor']),
+        'patient_id': int(row['patient']) if row.get('patient') else None,
+        'patient_email': (row.get('patient_email') or '').strip().lower(),
+        'date': date,
+        'status': status,
+        'notes': row.get('notes') or '',
+    }
+
+
+def _overlaps(starts, date, length):
+    """Whether a booking at ``date`` overlaps one of the sorted ``starts``."""
+    i = bisect_left(starts, date - length + timedelta(microseconds=1))
+    return i < len(starts) and starts[i] < date + length
+
+
+def _validate_chunk(chunk, report):
+    """
+    Validate a chunk of rows with one query per lookup type rather than per row:
+    doctors and their schedules, patients by id or email, and scheduled bookings
+    in the chunk's window.
+    """
+    parsed = []
+    for line_number, row in chunk:
+        try:
+            parsed.append((line_number, _parse(row)))
+        except (TypeError, ValueError) as e:
+            report.reject(line_number, str(e))
+    if not parsed:
+        return []
+
+    doctor_ids = {row['doctor_id'] for _, row in parsed}
+    doctors = {
+        doctor.id: doctor
+        for doctor in Doctor.objects.filter(id__in=doctor_ids).only('id', 'slot_minutes', 'work_start', 'work_end')
+    }
+    patient_ids = {row['patient_id'] for _, row in parsed if row['patient_id']}
+    known_patients = set(User.objects.filter(id__in=patient_ids).values_list('id', flat=True))
+    emails = {row['patient_email'] for _, row in parsed if not row['patient_id']}
+    # Emails are compared lowercased on both sides, as parsed
+    patients_by_email = dict(
+        User.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=emails).values_list('email_lower', 'id')
+    )
+
+    scheduled = [row for _, row in parsed if row['status'] == 'scheduled' and row['doctor_id'] in doctors]
+    booked = defaultdict(list)
+    if scheduled:
+        # Widened by the longest slot so bookings overlapping the window's edges count
+        reach = timedelta(minutes=max(doctors[row['doctor_id']].slot_minutes for row in scheduled))
+        for doctor_id, date in Appointment.objects.filter(
+            status='scheduled',
+            doctor_id__in={row['doctor_id'] for row in scheduled},
+            date__gt=min(row['date'] for row in scheduled) - reach,
+            date__lt=max(row['date'] for row in scheduled) + reach,
+        ).order_by('date').values_list('doctor_id', 'date'):
+            booked[doctor_id].append(date)
+    doctor_schedules = schedules.load(doctors[doctor_id] for doctor_id in {row['doctor_id'] for row in scheduled})
+
+    valid = []
+    for line_number, row in parsed:
+        patient_id = row['patient_id'] or patients_by_email.get(row['patient_email'])
+        doctor = doctors.get(row['doctor_id'])
+        if doctor is None:
+            report.reject(line_number, f"doctor {row['doctor_id']} does not exist")
+        elif patient_id is None or (row['patient_id'] and patient_id not in known_patients):
+            report.reject(line_number, 'patient does not exist')
+        elif row['status'] == 'scheduled' and not availability.is_slot_start(
+            doctor, row['date'], doctor_schedules[doctor.id]
+        ):
+            report.reject(line_number, "date is not one of the doctor's slots")
+        elif row['status'] == 'scheduled' and _overlaps(
+            booked[doctor.id], row['date'], timedelta(minutes=doctor.slot_minutes)
+        ):
+            report.reject(line_number, 'slot is already booked')
+        else:
+            if row['status'] == 'scheduled':
+                insort(booked[doctor.id], row['date'])
+            valid.append(Appointment(
+                patient_id=patient_id,
+                doctor_id=row['doctor_id'],
+                date=row['date'],
+                status=row['status'],
+                notes=row['notes'],
+            ))
+    return valid
+
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, line_number, message, count=1):
+        self.rejected += count
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def as_dict(self):
+        return {'imported': self.imported, 'rejected': self.rejected, 'errors': self.errors}
+
+
+def import_appointments(rows, chunk_size=1000):
+    """
+    Insert appointments from ``(line_number, row)`` pairs in chunks with bulk_create.
+
+    bulk_create sends no model signals, so no confirmation emails are queued;
+    each chunk adds its own daily stats, and the availability cache and every
+    patient's appointment version are dropped once at the end.
+    """
+    report = ImportReport()
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        valid = _validate_chunk(chunk, report)
+        if not valid:
+            continue
+        try:
+            with transaction.atomic():
+                Appointment.objects.bulk_create(valid, batch_size=chunk_size)
+                stats.apply(stats.changes_of(valid))
+        except IntegrityError as e:
+            # A concurrent booking claimed one of the slots after validation
+            report.reject(chunk[0][0], f'chunk rejected: {e}', count=len(valid))
+        else:
+            report.imported += len(valid)
+    if report.imported:
+        availability.invalidate_all()
+        appointment_versions.bump()
+    return report
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, fmt, chunk_size=2000):
+    """Yield encoded lines for ``queryset`` without materialising it."""
+    rows = (
+        queryset.order_by('id')
+        .values_list('id', 'patient_id', 'patient__email', 'doctor_id', 'doctor__name', 'date', 'status', 'notes')
+        .iterator(chunk_size=chunk_size)
+    )
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            yield writer.writerow(row[:5] + (row[5].isoformat(),) + row[6:])
+    elif fmt == 'jsonl':
+        for row in rows:
+            record = dict(zip(EXPORT_FIELDS, row))
+            record['date'] = record['date'].isoformat()
+            yield json.dumps(record) + '\n'
+    else:
+        raise ValueError(f'Unsupported format {fmt!r}, expected one of {", ".join(FORMATS)}')
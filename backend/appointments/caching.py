@@ -0,0 +1,154 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+# Cap on how long entries live in a process-local cache, which other workers'
+# writes and invalidations never reach. Multi-worker deployments should point
+# CACHE_BACKEND at a shared cache (Redis, Memcached) instead.
+LOCAL_TIMEOUT = getattr(settings, 'PROCESS_LOCAL_CACHE_TIMEOUT', 5)
+
+
+def process_local(alias='default'):
+    """Whether the cache ``alias`` lives in this process only (LocMemCache)."""
+    return isinstance(caches[alias], LocMemCache)
+
+
+def shared_timeout(timeout, alias='default'):
+    """``timeout``, capped at LOCAL_TIMEOUT when the cache is process-local."""
+    if not process_local(alias):
+        return timeout
+    return LOCAL_TIMEOUT if timeout is None else min(timeout, LOCAL_TIMEOUT)
+
+
+def _initial_version():
+    # Start from the clock so an evicted counter never reuses an ETag a client holds
+    return time.time_ns()
+
+
+class VersionedCache:
+    """
+    Read-through cache whose entries are keyed by a version counter.
+
+    Writers call ``bump()`` instead of deleting individual keys; every entry
+    built under the old version becomes unreachable and simply expires. The
+    version doubles as the ETag of the cached responses, and the time of the
+    last bump as their Last-Modified.
+
+    The versions must live in a cache every worker shares. In a process-local
+    one a bump reaches only the bumping worker, so entries there are kept for
+    LOCAL_TIMEOUT at most and responses carry no validators.
+    """
+
+    def __init__(self, namespace, timeout=None, alias=None):
+        self.namespace = namespace
+        self._timeout = timeout
+        self.alias = alias
+
+    @property
+    def _alias(self):
+        return self.alias or getattr(settings, 'API_CACHE_ALIAS', 'default')
+
+    @property
+    def cache(self):
+        return caches[self._alias]
+
+    @property
+    def timeout(self):
+        return shared_timeout(self._timeout, self._alias)
+
+    def _version_key(self, scope):
+        return f'{self.namespace}:version:{scope}'
+
+    def _modified_key(self, scope):
+        return f'{self.namespace}:modified:{scope}'
+
+    def version(self, scope=''):
+        return self.cache.get_or_set(self._version_key(scope), _initial_version, None)
+
+    def bump(self, scope=''):
+        # Stamped first, so a reader of the new version never gets the old time.
+        # Whole seconds, as Last-Modified carries them, and always past the
+        # previous stamp so a second bump within one second still moves it.
+        previous = self.cache.get(self._modified_key(scope)) or 0
+        self.cache.set(self._modified_key(scope), max(math.ceil(time.time()), previous + 1), None)
+        try:
+            self.cache.incr(self._version_key(scope))
+        except ValueError:
+            self.cache.set(self._version_key(scope), _initial_version(), None)
+
+    def validators(self, scopes=('',)):
+        """
+        The ETag over the versions of ``scopes`` and the last time any of them
+        was bumped, read in one cache round trip.
+        """
+        found = self.cache.get_many(
+            [self._version_key(scope) for scope in scopes] + [self._modified_key(scope) for scope in scopes]
+        )
+        versions = []
+        modified = []
+        for scope in scopes:
+            version = found.get(self._version_key(scope))
+            versions.append(self.version(scope) if version is None else version)
+            stamp = found.get(self._modified_key(scope))
+            if stamp is None:
+                # Evicted or never bumped: claim now, which can only cost a full response
+                stamp = math.ceil(time.time())
+                self.cache.add(self._modified_key(scope), stamp, None)
+            modified.append(stamp)
+        return f'"{self.namespace}-{"-".join(map(str, versions))}"', max(modified)
+
+    def get_or_build(self, key, build, scope=''):
+        cache_key = f'{self.namespace}:{self.version(scope)}:{key}'
+        data = self.cache.get(cache_key)
+        if data is None:
+            data = build()
+            self.cache.set(cache_key, data, self.timeout)
+        return data
+
+    def conditional(self, request, respond, scopes=('',), private=False):
+        """
+        ``respond()`` with the validators of ``scopes``, or a 304 without
+        calling it when the client's copy is still current.
+        """
+        headers = {'Cache-Control': 'private, no-cache' if private else 'no-cache'}
+        # Another worker's bump would not move a process-local cache's validators
+        if not process_local(self._alias):
+            etag, modified = self.validators(scopes)
+            headers.update({'ETag': etag, 'Last-Modified': http_date(modified)})
+            if not_modified(request, etag, modified):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        response = respond()
+        if response.status_code == status.HTTP_200_OK:
+            for name, value in headers.items():
+                response[name] = value
+        return response
+
+    def response(self, request, key, build, scope=''):
+        """Serve ``build()`` from cache, or a 304 when the client already has it."""
+        return self.conditional(request, lambda: Response(self.get_or_build(key, build, scope)), (scope,))
+
+
+def not_modified(request, etag, modified=None):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if header:
+        client_etags = parse_etags(header)
+        return '*' in client_etags or etag in client_etags or f'W/{etag}' in client_etags
+    # If-Modified-Since only counts without If-None-Match (RFC 9110 13.1.3)
+    since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return since is not None and modified is not None and modified <= since
+
+
+doctor_directory = VersionedCache(
+    'doctors',
+    timeout=getattr(settings, 'DOCTOR_DIRECTORY_CACHE_TIMEOUT', 60 * 60),
+)
+
+# Scoped per patient and bumped when one of their appointments changes; the
+# '' scope covers writes that may touch anyone's (bulk writes, doctor edits)
+appointment_versions = VersionedCache('appointments')
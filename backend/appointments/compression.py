@@ -0,0 +1,45 @@
+"""
+Content-negotiated compression of large responses.
+
+Brotli is used when the client accepts it and the ``brotli`` package is
+installed, gzip (Django's GZipMiddleware) otherwise. Responses below
+``COMPRESSION_MIN_BYTES`` and streaming responses (server-sent events and the
+exports, which must reach the client as they are produced) go out as they are.
+"""
+import re
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_BYTES = getattr(settings, 'COMPRESSION_MIN_BYTES', 1024)
+# Brotli quality 0-11; the middle of the range compresses JSON well at gzip-like speed
+BROTLI_QUALITY = getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5)
+
+_accepts_brotli = re.compile(r'\bbr\b')
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def process_response(self, request, response):
+        if response.streaming or len(response.content) < MIN_BYTES or response.has_header('Content-Encoding'):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if brotli is None or not _accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return super().process_response(request, response)
+
+        compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        # As GZipMiddleware: the encoded body is no longer byte-identical
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = 'br'
+        return response
@@ -0,0 +1,162 @@
+"""
+Slot availability events for the booking page's live stream.
+
+The broker fans events out to the streams open in this process. Getting an
+event from the process that committed a booking to every process holding
+streams is the backend's job: the default ``LocalBackend`` hands it straight
+back to this process's broker, which is all a single ASGI worker needs. Point
+``SLOT_EVENTS_BACKEND`` at a class with the same ``start``/``publish`` methods
+(for example one relaying through Redis pub/sub) to run several workers.
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import availability, schedules
+from .models import Doctor
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per stream before a slow client is told to resync instead
+QUEUE_SIZE = getattr(settings, 'SLOT_EVENTS_QUEUE_SIZE', 100)
+
+# Queued in place of the dropped events when a stream falls behind
+RESYNC = {'type': 'resync', 'data': None}
+
+
+def slot_channel(doctor_id, day):
+    return f'slots:{doctor_id}:{day.isoformat()}'
+
+
+class LocalBackend:
+    """Delivers events to the broker of the publishing process only."""
+
+    # Nothing outside this process listens, so unwatched channels can be skipped
+    local = True
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, channel, event):
+        self._deliver(channel, event)
+
+
+class Subscription:
+    """One open stream's queue, bound to the event loop that created it."""
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+
+    def _put(self, event):
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = RESYNC
+        self.queue.put_nowait(event)
+
+    def push(self, event):
+        """Queue an event from any thread."""
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    async def get(self, timeout):
+        """The next event, or None when nothing arrives within ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    def __init__(self, backend):
+        self.backend = backend
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+        backend.start(self.deliver)
+
+    def subscribe(self, channel):
+        """Open a subscription; call from the coroutine that will read it."""
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+    def watched(self, channel):
+        """Whether an event on the channel could reach any stream."""
+        if not getattr(self.backend, 'local', False):
+            return True
+        with self._lock:
+            return channel in self._subscriptions
+
+    def publish(self, channel, event):
+        self.backend.publish(channel, event)
+
+    def deliver(self, channel, event):
+        """Hand an event to this process's subscriptions; called by the backend."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.push(event)
+            except RuntimeError:
+                # The stream's event loop has shut down without closing it
+                self.unsubscribe(subscription)
+
+
+broker = Broker(import_string(getattr(settings, 'SLOT_EVENTS_BACKEND', 'appointments.events.LocalBackend'))())
+
+
+def publish_slot_change(doctor_id, date):
+    """
+    Tell the (doctor, day) streams whether the slot holding ``date`` is now taken.
+
+    Call after the write committed: the state is read back rather than taken
+    from the write, so a stale or out-of-order event cannot mark a slot free
+    that another booking holds.
+    """
+    day = timezone.localdate(date)
+    channel = slot_channel(doctor_id, day)
+    if not broker.watched(channel):
+        return
+    try:
+        doctor = Doctor.objects.only('work_start', 'work_end', 'slot_minutes').get(pk=doctor_id)
+    except Doctor.DoesNotExist:
+        return
+    minute = schedules.minute_of_day(timezone.localtime(date))
+    slots = schedules.for_doctor(doctor).slots(day, availability.booked_minutes(doctor_id, day))
+    for start, free in slots:
+        if start <= minute < start + doctor.slot_minutes:
+            break
+    else:
+        return
+    try:
+        broker.publish(channel, {
+            'type': 'freed' if free else 'taken',
+            'data': {
+                'doctor_id': doctor_id,
+                'date': day.isoformat(),
+                'time': schedules.hhmm(start),
+                'is_available': free,
+            },
+        })
+    except Exception:
+        # The booking is committed either way; streams catch up on reconnect
+        logger.exception('Could not publish slot event on %s', channel)
@@ -0,0 +1,137 @@
+"""
+Sparse fieldsets for the read endpoints, and a values() fast path for lists.
+
+``?fields=a,b`` keeps only the named fields of each result and ``?omit=a,b``
+drops the named ones. The selection reaches the query: only the columns the
+remaining fields read are loaded. List actions go further and never build
+model instances or run DRF's field-by-field serialization: they read
+``values()`` rows and convert just the values that are not already their JSON
+form (datetimes, files, computed fields).
+"""
+from functools import lru_cache
+from operator import itemgetter
+
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+# Fields whose database value is already their representation
+PLAIN_FIELDS = (
+    serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+    serializers.ChoiceField, serializers.ReadOnlyField, serializers.PrimaryKeyRelatedField,
+)
+
+
+def _names(value):
+    return [name for name in (part.strip() for part in value.split(',')) if name]
+
+
+def selected_fields(request, available):
+    """
+    The names out of ``available`` that the request's ``?fields=``/``?omit=``
+    keep, in their original order. Raises ValueError naming unknown fields.
+    """
+    fields = _names(request.query_params.get('fields', ''))
+    omit = _names(request.query_params.get('omit', ''))
+    unknown = [name for name in fields + omit if name not in available]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Choose from: {', '.join(available)}")
+    return [name for name in available if (not fields or name in fields) and name not in omit]
+
+
+class SparseFieldsMixin:
+    """
+    Serializer whose fields follow the request's ``?fields=``/``?omit=`` on GET.
+
+    ``field_columns`` names the model columns behind fields that do not map
+    to one column (computed or method fields). A ``value_<field>(row)`` method
+    computes such a field from a values() row for ``represent_values``.
+    """
+    field_columns = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        try:
+            keep = set(selected_fields(request, list(self.fields)))
+        except ValueError:
+            # The view answers with the error
+            return
+        for name in list(self.fields):
+            if name not in keep:
+                self.fields.pop(name)
+
+    def _readable(self):
+        return [(name, field) for name, field in self.fields.items() if not field.write_only]
+
+    def columns(self):
+        """Column paths the selected fields read, for ``only()`` and ``values()``."""
+        columns = []
+        for name, field in self._readable():
+            if name in self.field_columns:
+                found = self.field_columns[name]
+            else:
+                found = () if field.source == '*' else ('__'.join(field.source_attrs),)
+            columns += [column for column in found if column not in columns]
+        return columns
+
+    def represent_values(self, rows):
+        """The representation of ``values(*self.columns())`` rows, as ``data`` would give it."""
+        getters = []
+        for name, field in self._readable():
+            getter = getattr(self, f'value_{name}', None)
+            if getter is None:
+                column = '__'.join(field.source_attrs)
+                if isinstance(field, PLAIN_FIELDS):
+                    getter = itemgetter(column)
+                else:
+                    def getter(row, column=column, convert=field.to_representation):
+                        value = row[column]
+                        return None if value is None else convert(value)
+            getters.append((name, getter))
+        return [{name: getter(row) for name, getter in getters} for row in rows]
+
+
+@lru_cache(maxsize=None)
+def _available(serializer_class):
+    return tuple(name for name, field in serializer_class().fields.items() if not field.write_only)
+
+
+class SparseFieldsViewMixin:
+    """
+    Applies the sparse fieldsets of a SparseFieldsMixin serializer to the
+    ``sparse_actions``: unknown fields are a 400, the query loads only the
+    selected columns, and ``list`` serializes values() rows.
+    """
+    sparse_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action in self.sparse_actions:
+            try:
+                selected_fields(request, _available(self.get_serializer_class()))
+            except ValueError as e:
+                raise ValidationError({'error': str(e)})
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action not in self.sparse_actions:
+            return queryset
+        columns = self.get_serializer().columns()
+        relations = {column.split('__')[0] for column in columns if '__' in column}
+        return queryset.select_related(*relations).only(*columns)
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer()
+        # The cursor is read off the ordering columns, selected or not
+        ordering = [field.lstrip('-') for field in getattr(self.paginator, 'ordering', ())]
+        columns = serializer.columns()
+        queryset = self.filter_queryset(self.get_queryset()).values(
+            *columns, *(field for field in ordering if field not in columns)
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.represent_values(page))
+        return Response(serializer.represent_values(queryset))
@@ -0,0 +1,145 @@
+import json
+import os
+import platform
+import time
+
+import django
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from appointments.benchmark import Dataset, Runner, compare, load_report
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates a deterministic dataset in a separate benchmark database and measures '
+        'the booking API endpoints; prints a JSON report'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42, help='Seed for data and request generation')
+        parser.add_argument('--doctors', type=int, default=2000, help='Number of doctors to generate')
+        parser.add_argument('--patients', type=int, default=20000, help='Number of patients to generate')
+        parser.add_argument('--appointments', type=int, default=1000000, help='Number of appointments to generate')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario and concurrency level')
+        parser.add_argument(
+            '--concurrency',
+            default='1',
+            help='Comma-separated thread counts to run every scenario with, e.g. 1,8',
+        )
+        parser.add_argument(
+            '--scenarios',
+            default=','.join(Runner.SCENARIOS),
+            help=f'Comma-separated subset of: {", ".join(Runner.SCENARIOS)}',
+        )
+        parser.add_argument(
+            '--transport',
+            default='wsgi',
+            help='Comma-separated request paths to measure: wsgi (DRF views, one thread per client), '
+                 'asgi (async views, one task per client) or both',
+        )
+        parser.add_argument('--clients', type=int, default=100, help='Distinct patients sending requests')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--baseline', help='Fail if results regress against this earlier report')
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.25,
+            help='Allowed latency/throughput drift against the baseline, as a fraction',
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Keep the benchmark database so later runs with the same sizes skip generation',
+        )
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(Runner.SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError('--concurrency must be a comma-separated list of integers')
+        transports = [name.strip() for name in options['transport'].split(',') if name.strip()]
+        if not transports or set(transports) - set(Runner.PREFIXES):
+            raise CommandError(f'--transport must be a comma-separated subset of: {", ".join(Runner.PREFIXES)}')
+        if options['doctors'] < 1 or options['patients'] < 1 or min(levels) < 1:
+            raise CommandError('--doctors, --patients and --concurrency must be at least 1')
+
+        dataset = Dataset(
+            seed=options['seed'],
+            doctors=options['doctors'],
+            patients=options['patients'],
+            appointments=options['appointments'],
+        )
+        report = self.run(dataset, scenarios, levels, transports, options)
+
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text + '\n')
+        else:
+            self.stdout.write(text)
+
+        if options['baseline']:
+            regressions = compare(report, load_report(options['baseline']), options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against baseline:\n' + '\n'.join(regressions))
+            self.stderr.write(self.style.SUCCESS('No regressions against baseline'))
+
+    def run(self, dataset, scenarios, levels, transports, options):
+        # Same isolation as the test runner: a separate database, locmem email
+        # and DEBUG off, so the configured database is never touched.
+        setup_test_environment()
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        test_name = test_settings.get('NAME')
+        directory, name = os.path.split(str(test_name or connection.settings_dict['NAME']))
+        test_settings['NAME'] = os.path.join(directory, 'bench_' + name.removeprefix('test_'))
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            generated = 0.0
+            # A kept database is measured on the days it was generated for, not around today
+            kept = dataset.kept() if options['keepdb'] else dataset
+            if kept.is_loaded():
+                dataset = kept
+            else:
+                call_command('flush', interactive=False, verbosity=0)
+                started = time.perf_counter()
+                dataset.generate()
+                generated = time.perf_counter() - started
+            cache.clear()
+
+            runner = Runner(dataset, clients=options['clients'])
+            results = {}
+            try:
+                for transport in transports:
+                    for concurrency in levels:
+                        for scenario in scenarios:
+                            if transport == 'asgi' and scenario not in Runner.ASYNC_SCENARIOS:
+                                continue
+                            # WSGI keys stay unsuffixed so older baselines still compare
+                            name = f'{scenario}@{concurrency}' + ('' if transport == 'wsgi' else f'/{transport}')
+                            self.stderr.write(f'{name}...')
+                            results[name] = runner.run(scenario, options['requests'], concurrency, transport)
+            finally:
+                runner.cleanup()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            test_settings['NAME'] = test_name
+            teardown_test_environment()
+
+        return {
+            'dataset': dataset.as_dict(),
+            'generation_seconds': round(generated, 2),
+            'environment': {
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'scenarios': results,
+        }
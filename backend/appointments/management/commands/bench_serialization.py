@@ -0,0 +1,103 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from appointments.models import Appointment, Doctor, User
+from appointments.serializers import AppointmentSerializer, UserSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Serializes large user and appointment lists through DRF and through the '
+        'values() fast path, with and without a sparse fieldset (rolled back)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=10000,
+            help='Rows per list',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Runs per variant; the fastest is reported',
+        )
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        self.repeat = options['repeat']
+        # Everything runs inside one transaction that is rolled back at the end,
+        # so the benchmark can be pointed at a real database.
+        with transaction.atomic():
+            patient = self.seed(rows)
+            users = User.objects.filter(username__startswith='benchser').order_by('id')
+            appointments = Appointment.objects.filter(patient=patient).order_by('-date', '-id')
+            self.compare('users', UserSerializer, users, 'omit=medical_history,avatar_thumbnails')
+            self.compare('appointments', AppointmentSerializer, appointments, 'omit=notes')
+            transaction.set_rollback(True)
+
+    def seed(self, rows):
+        history = 'Lorem ipsum dolor sit amet. ' * 80
+        users = User.objects.bulk_create(
+            User(username=f'benchser{i}', email=f'benchser{i}@example.com', first_name='Bench', last_name=str(i),
+                 phone='555-0100', medical_history=history, avatar=f'avatars/benchser{i}.png')
+            for i in range(rows)
+        )
+        doctor = Doctor.objects.create(name='Bench', specialization='GP', email='benchser@example.com', phone='1')
+        start = timezone.now()
+        Appointment.objects.bulk_create(
+            Appointment(patient=users[0], doctor=doctor, date=start + timedelta(minutes=30 * i),
+                        notes=history, status='completed')
+            for i in range(rows)
+        )
+        return users[0]
+
+    def best(self, run):
+        timings = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            body = JSONRenderer().render(run())
+            timings.append(time.perf_counter() - started)
+        return min(timings), len(body)
+
+    def compare(self, name, serializer_class, queryset, sparse):
+        def serializer(query):
+            request = Request(RequestFactory(HTTP_HOST='localhost').get(f'/?{query}'))
+            return serializer_class(context={'request': request})
+
+        def drf(query):
+            # Model instances loading just the selected columns, as the views' retrieve does
+            found = serializer(query)
+            columns = found.columns()
+            relations = {column.split('__')[0] for column in columns if '__' in column}
+            return serializer_class(
+                queryset.select_related(*relations).only(*columns), many=True, context=found.context,
+            ).data
+
+        def fast(query):
+            found = serializer(query)
+            return found.represent_values(queryset.values(*found.columns()))
+
+        count = queryset.count()
+        baseline = None
+        for label, run in (
+            ('DRF serializer', lambda: drf('')),
+            (f'DRF serializer, {sparse}', lambda: drf(sparse)),
+            ('values() fast path', lambda: fast('')),
+            (f'values() fast path, {sparse}', lambda: fast(sparse)),
+        ):
+            seconds, size = self.best(run)
+            baseline = baseline or seconds
+            self.stdout.write(
+                f'{name:>12} {count} rows  {label:<58} '
+                f'{seconds * 1000:8.1f} ms  {size / 1024:7.0f} KiB  x{baseline / seconds:.1f}'
+            )
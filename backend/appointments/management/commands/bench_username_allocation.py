@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from appointments.models import User
+
+
+class Command(BaseCommand):
+    help = 'Registers many users sharing an email prefix and reports username allocation cost (rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=10000,
+            help='Number of users to register',
+        )
+        parser.add_argument(
+            '--prefix',
+            default='john',
+            help='Shared email prefix',
+        )
+
+    def handle(self, *args, **options):
+        count = options['count']
+        prefix = options['prefix']
+        allocation_seconds = 0.0
+        allocation_queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal allocation_queries
+            allocation_queries += 1
+            return execute(sql, params, many, context)
+
+        # Everything runs inside one transaction that is rolled back at the end,
+        # so the benchmark can be pointed at a real database.
+        with transaction.atomic():
+            started = time.perf_counter()
+            for i in range(count):
+                allocating = time.perf_counter()
+                with connection.execute_wrapper(count_queries):
+                    username = User.objects.next_username(prefix)
+                allocation_seconds += time.perf_counter() - allocating
+
+                user = User(username=username, email=f'{prefix}.bench{i}@example.com')
+                user.set_unusable_password()
+                user.save()
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Registered {count} users with prefix {prefix!r} in {elapsed:.2f}s '
+                f'({count / elapsed:.0f} users/sec); '
+                f'allocation took {allocation_seconds * 1000 / count:.3f} ms/user '
+                f'using {allocation_queries / count:.1f} queries/user'
+            )
+        )
@@ -1,7 +1,10 @@
 from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Exists, OuterRef
+
+from appointments import availability, stats, transitions
+from appointments.caching import appointment_versions
 from appointments.models import Appointment
-from django.db.models import Count
-from django.utils import timezone
 
 class Command(BaseCommand):
     help = 'Cleans up duplicate appointments and updates past scheduled appointments'
@@ -12,116 +15,80 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be changed without actually making changes',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Maximum number of rows deleted or updated per statement',
+        )
 
     def handle(self, *args, **options):
         self.stdout.write('Starting appointment cleanup...')
-        
-        self.cleanup_duplicates(options['dry_run'])
-        self.update_past_appointments(options['dry_run'])
 
-    def cleanup_duplicates(self, dry_run):
-        # Find duplicates based on patient, doctor, and date
-        duplicates = (
-            Appointment.objects.values('patient', 'doctor', 'date')
-            .annotate(count=Count('id'))
-            .filter(count__gt=1)
-        )
+        removed = self.cleanup_duplicates(options['dry_run'], options['batch_size'])
+        self.update_past_appointments(options['dry_run'], options['batch_size'])
 
-        total_found = 0
-        total_removed = 0
+        # Deleting duplicates bypasses the model signals, so drop cached availability
+        # and every appointment list in one go and recount; completed appointments
+        # announce themselves
+        if removed:
+            availability.invalidate_all()
+            appointment_versions.bump()
+            stats.rebuild()
 
-        for dup in duplicates:
-            # Get all appointments matching these criteria
-            appointments = Appointment.objects.filter(
-                patient=dup['patient'],
-                doctor=dup['doctor'],
-                date=dup['date']
-            ).order_by('id')
-            
-            # Keep the first one, mark others for deletion
-            to_delete = appointments[1:]
-            count = len(to_delete)
-            total_found += count
-            
-            if dry_run:
-                self.stdout.write(
-                    self.style.WARNING(
-                        f"Would remove {count} duplicate appointments for "
-                        f"patient {appointments[0].patient.name} with "
-                        f"doctor {appointments[0].doctor.name} on "
-                        f"{appointments[0].date.strftime('%Y-%m-%d %H:%M')}"
-                    )
-                )
-            else:
-                for appointment in to_delete:
-                    appointment.delete()
-                total_removed += count
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f"Removed {count} duplicate appointments for "
-                        f"patient {appointments[0].patient.name} with "
-                        f"doctor {appointments[0].doctor.name} on "
-                        f"{appointments[0].date.strftime('%Y-%m-%d %H:%M')}"
-                    )
-                )
+    def duplicates(self):
+        # Every row with an older twin for the same patient, doctor and date; the
+        # row with the lowest id in each group is the one that is kept.
+        earlier = Appointment.objects.filter(
+            patient=OuterRef('patient'),
+            doctor=OuterRef('doctor'),
+            date=OuterRef('date'),
+            id__lt=OuterRef('id'),
+        )
+        return Appointment.objects.filter(Exists(earlier)).order_by()
 
+    def cleanup_duplicates(self, dry_run, batch_size):
         if dry_run:
+            total_found = self.duplicates().count()
             self.stdout.write(
                 self.style.SUCCESS(
                     f'Found {total_found} duplicate appointments that would be removed'
                 )
             )
-        else:
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f'Successfully removed {total_removed} duplicate appointments'
-                )
-            )
-
-    def update_past_appointments(self, dry_run):
-        now = timezone.now()
-        past_scheduled = Appointment.objects.filter(
-            date__lt=now,
-            status='scheduled'
-        )
+            return 0
 
-        total_updated = 0
+        table = connection.ops.quote_name(Appointment._meta.db_table)
+        total_removed = 0
+        while True:
+            batch_sql, params = self.duplicates().values('id')[:batch_size].query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {table} WHERE id IN ({batch_sql})', params)
+                removed = cursor.rowcount
+            total_removed += removed
+            if removed < batch_size:
+                break
 
-        for appointment in past_scheduled:
-            if dry_run:
-                self.stdout.write(
-                    self.style.WARNING(
-                        f"Would update past appointment for "
-                        f"patient {appointment.patient.name} with "
-                        f"doctor {appointment.doctor.name} on "
-                        f"{appointment.date.strftime('%Y-%m-%d %H:%M')} "
-                        f"from 'scheduled' to 'completed'"
-                    )
-                )
-            else:
-                appointment.status = 'completed'
-                appointment.save()
-                total_updated += 1
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f"Updated past appointment for "
-                        f"patient {appointment.patient.name} with "
-                        f"doctor {appointment.doctor.name} on "
-                        f"{appointment.date.strftime('%Y-%m-%d %H:%M')} "
-                        f"from 'scheduled' to 'completed'"
-                    )
-                )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully removed {total_removed} duplicate appointments'
+            )
+        )
+        return total_removed
 
+    def update_past_appointments(self, dry_run, batch_size):
         if dry_run:
             self.stdout.write(
                 self.style.SUCCESS(
-                    f'Found {len(past_scheduled)} past scheduled appointments that would be updated'
-                )
-            )
-        else:
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f'Successfully updated {total_updated} past scheduled appointments'
+                    f'Found {transitions.expired().count()} past scheduled appointments that would be updated'
                 )
             )
+            return 0
 
+        total_updated = transitions.complete_past(batch_size=batch_size)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully updated {total_updated} past scheduled appointments'
+            )
+        )
+        return total_updated
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from appointments import transitions
+
+
+class Command(BaseCommand):
+    help = 'Marks scheduled appointments whose start time has passed as completed, in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=transitions.BATCH_SIZE,
+            help='Appointments locked and updated per statement',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running every --interval seconds instead of exiting after one pass',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=transitions.INTERVAL_SECONDS,
+            help='Seconds between passes when running with --loop',
+        )
+
+    def report(self, completed):
+        self.stdout.write(self.style.SUCCESS(f'Completed {completed} past appointments'))
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            transitions.run(options['interval'], options['batch_size'], report=self.report)
+        else:
+            self.report(transitions.complete_past(batch_size=options['batch_size']))
@@ -0,0 +1,49 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments import bulk
+
+
+class Command(BaseCommand):
+    help = 'Streams appointments from a CSV or JSON Lines file into the database in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help="File to import, or '-' to read from stdin",
+        )
+        parser.add_argument(
+            '--format',
+            choices=bulk.FORMATS,
+            help='Input format; defaults to the file extension',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Rows validated and inserted per bulk_create',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if fmt not in bulk.FORMATS:
+            raise CommandError('Cannot infer the format, pass --format csv or --format jsonl')
+
+        if path == '-':
+            report = bulk.import_appointments(bulk.read_rows(sys.stdin, fmt), options['chunk_size'])
+        else:
+            try:
+                with open(path, newline='', encoding='utf-8') as stream:
+                    report = bulk.import_appointments(bulk.read_rows(stream, fmt), options['chunk_size'])
+            except OSError as e:
+                raise CommandError(str(e))
+
+        for error in report.errors:
+            self.stderr.write(self.style.WARNING(f"Line {error['line']}: {error['error']}"))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Imported {report.imported} appointments, rejected {report.rejected}'
+            )
+        )
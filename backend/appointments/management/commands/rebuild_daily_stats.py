@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments import stats
+
+
+class Command(BaseCommand):
+    help = 'Recounts the daily appointment statistics from the appointments table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            help='First day to recount (YYYY-MM-DD); defaults to the earliest appointment',
+        )
+        parser.add_argument(
+            '--end',
+            help='Last day to recount (YYYY-MM-DD); defaults to the latest appointment',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            start, end = (
+                datetime.strptime(options[name], '%Y-%m-%d').date() if options[name] else None
+                for name in ('start', 'end')
+            )
+        except ValueError:
+            raise CommandError('--start and --end must be YYYY-MM-DD')
+
+        rows = stats.rebuild(start, end)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} daily statistics rows'))
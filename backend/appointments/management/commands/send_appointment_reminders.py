@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.reminders import send_reminders
+
+
+class Command(BaseCommand):
+    help = "Emails reminders for tomorrow's scheduled appointments that have not been reminded yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Appointments read per chunk and emails sent per connection batch',
+        )
+        parser.add_argument(
+            '--date',
+            help='Send reminders for this day (YYYY-MM-DD) instead of tomorrow',
+        )
+
+    def handle(self, *args, **options):
+        day = None
+        if options['date']:
+            try:
+                day = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must be in YYYY-MM-DD format')
+
+        stats = send_reminders(day=day, batch_size=options['batch_size'])
+
+        for error in stats['errors']:
+            self.stderr.write(self.style.ERROR(f'Batch failed: {error}'))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Sent {stats['emails']} reminders for {stats['appointments']} appointments "
+                f"in {stats['seconds']:.2f}s "
+                f"({stats['appointments_per_second']:.1f} appointments/sec, "
+                f"{stats['emails_per_second']:.1f} emails/sec, "
+                f"{stats['failed_batches']} failed batches)"
+            )
+        )
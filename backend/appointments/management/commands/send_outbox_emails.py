@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from appointments import outbox
+
+
+class Command(BaseCommand):
+    help = 'Sends queued outbox emails in batches over a single mail connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Number of emails claimed per batch',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the outbox instead of exiting once it is drained',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between polls when running with --loop',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = outbox.drain(batch_size=options['batch_size'])
+            if sent or failed or not options['loop']:
+                self.stdout.write(
+                    self.style.SUCCESS(f'Sent {sent} emails, {failed} failed attempts')
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
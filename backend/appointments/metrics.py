@@ -0,0 +1,284 @@
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+
+from .authentication import token_cache
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = tuple(getattr(settings, 'METRICS_BUCKETS', (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)))
+# Fraction of requests whose individual queries are kept as a detailed trace
+TRACE_SAMPLE_RATE = getattr(settings, 'METRICS_TRACE_SAMPLE_RATE', 0.01)
+# Requests slower than this are always traced
+TRACE_SLOW_SECONDS = getattr(settings, 'METRICS_TRACE_SLOW_SECONDS', 1.0)
+TRACE_HISTORY = getattr(settings, 'METRICS_TRACE_HISTORY', 100)
+
+METRICS = {
+    'http_requests_total': ('counter', 'Requests handled, by route, method and status.'),
+    'http_request_duration_seconds': ('histogram', 'Time spent handling a request.'),
+    'db_queries_total': ('counter', 'Database queries executed while handling requests.'),
+    'db_query_duration_seconds_total': ('counter', 'Time spent in database queries.'),
+    'db_queries_per_request': ('histogram', 'Database queries executed per request.'),
+    'serialization_duration_seconds': ('histogram', 'Time spent rendering API responses.'),
+    'email_send_duration_seconds': ('histogram', 'Time spent handing one batch of emails to the mail backend.'),
+    'emails_sent_total': ('counter', 'Emails handed to the mail backend, by result.'),
+    'token_cache_lookups_total': ('counter', 'Token authentication cache lookups, by result.'),
+}
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class _Shard:
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+
+class Registry:
+    """
+    Counters and histograms kept in one shard per thread.
+
+    Recording only touches the calling thread's shard, so the request path
+    never takes a lock; scrapes add the shards together.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        self._shard().counters[(name, labels)] += value
+
+    def observe(self, name, labels, value, buckets=BUCKETS):
+        histograms = self._shard().histograms
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            # One slot per bucket plus +Inf, then the sum of observed values
+            histogram = histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        histogram[bisect_left(buckets, value)] += 1
+        histogram[-1] += value
+
+    def collect(self):
+        """Return ``(counters, histograms)`` summed over every thread."""
+        counters = defaultdict(float)
+        histograms = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for key, value in shard.counters.copy().items():
+                counters[key] += value
+            for key, histogram in shard.histograms.copy().items():
+                total = histograms.setdefault(key, [0] * len(histogram))
+                for i, value in enumerate(list(histogram)):
+                    total[i] += value
+        return counters, histograms
+
+    def reset(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.counters.clear()
+                shard.histograms.clear()
+
+
+registry = Registry()
+traces = deque(maxlen=TRACE_HISTORY)
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'query_seconds', 'render_seconds', 'trace')
+
+    def __init__(self, trace):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.render_seconds = 0.0
+        # Only sampled requests keep their SQL, everything else just counts
+        self.trace = [] if trace else None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.query_seconds += elapsed
+            if self.trace is not None:
+                self.trace.append((sql, elapsed))
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _bucket_bounds(name):
+    return QUERY_BUCKETS if name == 'db_queries_per_request' else BUCKETS
+
+
+def render():
+    """Everything recorded so far in the Prometheus text exposition format."""
+    counters, histograms = registry.collect()
+    for result, value in _token_cache_counts().items():
+        counters[('token_cache_lookups_total', (('result', result),))] = value
+
+    by_name = defaultdict(list)
+    for (name, labels), value in counters.items():
+        by_name[name].append((labels, value))
+    for (name, labels), histogram in histograms.items():
+        by_name[name].append((labels, histogram))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = METRICS.get(name, ('untyped', ''))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+            if kind != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+            cumulative = 0
+            bounds = [_format_value(bound) for bound in _bucket_bounds(name)] + ['+Inf']
+            for bound, count in zip(bounds, value[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value[-1])}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def _token_cache_counts():
+    stats = token_cache.stats()
+    return {'local_hit': stats['hits'], 'shared_hit': stats['shared_hits'], 'miss': stats['misses']}
+
+
+def record_email_batch(seconds, sent, failed=0):
+    registry.observe('email_send_duration_seconds', (), seconds)
+    if sent:
+        registry.inc('emails_sent_total', (('result', 'sent'),), sent)
+    if failed:
+        registry.inc('emails_sent_total', (('result', 'failed'),), failed)
+
+
+class MetricsMiddleware:
+    """
+    Per-route request counts, latency, query counts and render time.
+
+    Under ASGI the async views' queries run in asgiref's worker thread, out of
+    reach of a per-connection wrapper, so those requests record no DB metrics.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self._acall(request)
+        stats = RequestMetrics(trace=random.random() < TRACE_SAMPLE_RATE)
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(stats):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, stats, time.perf_counter() - started, queries_counted=True)
+        return response
+
+    async def _acall(self, request):
+        stats = RequestMetrics(trace=False)
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, stats, time.perf_counter() - started, queries_counted=False)
+        return response
+
+    def _record(self, request, response, stats, elapsed, queries_counted):
+        route = _route(request)
+        labels = (('route', route), ('method', request.method))
+        registry.inc('http_requests_total', labels + (('status', response.status_code),))
+        registry.observe('http_request_duration_seconds', labels, elapsed)
+        if queries_counted:
+            registry.observe('db_queries_per_request', labels, stats.queries, QUERY_BUCKETS)
+        if stats.queries:
+            registry.inc('db_queries_total', labels, stats.queries)
+            registry.inc('db_query_duration_seconds_total', labels, stats.query_seconds)
+        if stats.render_seconds:
+            registry.observe('serialization_duration_seconds', labels, stats.render_seconds)
+
+        if stats.trace is not None or elapsed >= TRACE_SLOW_SECONDS:
+            trace = {
+                'route': route,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'seconds': elapsed,
+                'render_seconds': stats.render_seconds,
+                'query_seconds': stats.query_seconds,
+                'queries': [{'sql': sql, 'seconds': seconds} for sql, seconds in stats.trace or ()],
+            }
+            traces.append(trace)
+            logger.info('%s %s took %.1f ms with %d queries', request.method, request.path, elapsed * 1000, stats.queries)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer that reports its render time to the metrics middleware."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        started = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            stats.render_seconds += time.perf_counter() - started
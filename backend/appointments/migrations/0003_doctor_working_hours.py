@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:16
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_alter_user_options_user_avatar_alter_doctor_email_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='slot_minutes',
+            field=models.PositiveSmallIntegerField(default=30),
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='work_end',
+            field=models.TimeField(default=datetime.time(17, 0)),
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='work_start',
+            field=models.TimeField(default=datetime.time(9, 0)),
+        ),
+    ]
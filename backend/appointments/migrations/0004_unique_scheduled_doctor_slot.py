@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:18
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def cancel_double_bookings(apps, schema_editor):
+    # Keep the earliest booking of each doctor/slot so the constraint can be added
+    Appointment = apps.get_model('appointments', 'Appointment')
+    clashes = (
+        Appointment.objects.filter(status='scheduled')
+        .values('doctor', 'date')
+        .annotate(count=Count('id'), first=Min('id'))
+        .filter(count__gt=1)
+    )
+    for clash in clashes:
+        Appointment.objects.filter(
+            doctor=clash['doctor'],
+            date=clash['date'],
+            status='scheduled',
+        ).exclude(id=clash['first']).update(status='cancelled')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_doctor_working_hours'),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_double_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'scheduled')), fields=('doctor', 'date'), name='unique_scheduled_doctor_slot'),
+        ),
+    ]
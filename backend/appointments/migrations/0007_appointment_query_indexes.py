@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_appointment_reminder_sent_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_status_8fe9d7_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_patient_94a7ef_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_doctor__649ad1_idx',
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'date'], name='appt_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', '-date', '-id'], name='appt_patient_date_idx'),
+        ),
+    ]
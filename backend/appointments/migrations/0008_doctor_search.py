@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def index_doctors(apps, schema_editor):
+    from appointments.search import terms, trigrams
+
+    Doctor = apps.get_model('appointments', 'Doctor')
+    DoctorSearchTerm = apps.get_model('appointments', 'DoctorSearchTerm')
+    SearchTrigram = apps.get_model('appointments', 'SearchTrigram')
+    vocabulary = set()
+    rows = []
+    for doctor in Doctor.objects.only('name', 'specialization').iterator():
+        for term in terms(doctor):
+            vocabulary.add(term)
+            rows.append(DoctorSearchTerm(doctor_id=doctor.id, term=term))
+    DoctorSearchTerm.objects.bulk_create(rows, batch_size=2000)
+    SearchTrigram.objects.bulk_create(
+        [SearchTrigram(trigram=trigram, word=word) for word in vocabulary for trigram in trigrams(word)],
+        batch_size=2000,
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0007_appointment_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('word', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['specialization', 'id'], name='doctor_specialization_idx'),
+        ),
+        migrations.AddField(
+            model_name='doctorsearchterm',
+            name='doctor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='appointments.doctor'),
+        ),
+        migrations.AddConstraint(
+            model_name='searchtrigram',
+            constraint=models.UniqueConstraint(fields=('trigram', 'word'), name='unique_search_trigram'),
+        ),
+        migrations.AddConstraint(
+            model_name='doctorsearchterm',
+            constraint=models.UniqueConstraint(fields=('term', 'doctor'), name='unique_doctor_search_term'),
+        ),
+        migrations.RunPython(index_doctors, migrations.RunPython.noop),
+    ]
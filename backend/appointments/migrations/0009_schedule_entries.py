@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0008_doctor_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('weekly', 'Weekly hours'), ('extra', 'Extra hours'), ('leave', 'Leave')], max_length=10)),
+                ('weekday', models.PositiveSmallIntegerField(blank=True, help_text='0 is Monday; weekly entries only', null=True)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('start_time', models.TimeField(blank=True, null=True)),
+                ('end_time', models.TimeField(blank=True, null=True)),
+                ('note', models.CharField(blank=True, max_length=100)),
+                ('doctor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='schedule', to='appointments.doctor')),
+            ],
+            options={
+                'ordering': ['doctor_id', 'kind', 'weekday', 'start_date', 'start_time'],
+            },
+        ),
+    ]
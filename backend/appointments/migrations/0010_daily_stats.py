@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def count_appointments(apps, schema_editor):
+    Appointment = apps.get_model('appointments', 'Appointment')
+    DailyStats = apps.get_model('appointments', 'DailyStats')
+    counts = {}
+    grouped = Appointment.objects.order_by().values('doctor_id', 'status', day=TruncDate('date')).annotate(count=Count('id'))
+    for row in grouped:
+        counts.setdefault((row['doctor_id'], row['day']), {})[row['status']] = row['count']
+    DailyStats.objects.bulk_create(
+        [DailyStats(doctor_id=doctor_id, day=day, **found) for (doctor_id, day), found in counts.items()],
+        batch_size=2000,
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0009_schedule_entries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('scheduled', models.PositiveIntegerField(default=0)),
+                ('completed', models.PositiveIntegerField(default=0)),
+                ('cancelled', models.PositiveIntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='appointments.doctor')),
+            ],
+            options={
+                'ordering': ['day', 'doctor_id'],
+                'indexes': [models.Index(fields=['day', 'doctor'], name='daily_stats_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'day'), name='unique_doctor_daily_stats')],
+            },
+        ),
+        migrations.RunPython(count_appointments, migrations.RunPython.noop),
+    ]
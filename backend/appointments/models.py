@@ -1,5 +1,9 @@
+from datetime import time
+
 from django.db import models
+from django.db.models.functions import Length
 from django.contrib.auth.models import AbstractUser, BaseUserManager
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 
 class CustomUserManager(BaseUserManager):
@@ -23,6 +27,34 @@ class CustomUserManager(BaseUserManager):
 
         return self.create_user(email, password, **extra_fields)
 
+    def next_username(self, base):
+        """
+        Return ``base`` if it is free, otherwise ``base`` plus one more than the
+        highest numeric suffix in use, found with a single query.
+
+        The ``[base + '0', base + ':')`` range covers every name that continues
+        with a digit, so the lookup is a range scan on the username index.
+        Ordering by length and then name puts the highest number first; the odd
+        name that merely starts with a digit (``john3x``) is skipped while
+        streaming the result.
+        """
+        base = base[:140]
+        names = (
+            self.filter(
+                models.Q(username=base)
+                | models.Q(username__gte=f'{base}0', username__lt=f'{base}:')
+            )
+            .order_by(Length('username').desc(), '-username')
+            .values_list('username', flat=True)
+        )
+        taken = False
+        for name in names.iterator(chunk_size=100):
+            suffix = name[len(base):]
+            if suffix.isdigit() and suffix.isascii() and not suffix.startswith('0'):
+                return f'{base}{int(suffix) + 1}'
+            taken = taken or name == base
+        return f'{base}1' if taken else base
+
 class User(AbstractUser):
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=20, blank=True)
@@ -49,16 +81,111 @@ class Doctor(models.Model):
     specialization = models.CharField(max_length=100)
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=20)
+    slot_minutes = models.PositiveSmallIntegerField(default=30)
+    work_start = models.TimeField(default=time(9, 0))
+    work_end = models.TimeField(default=time(17, 0))
 
     class Meta:
         indexes = [
             models.Index(fields=['email']),
             models.Index(fields=['name']),
+            # Specialization filter in cursor order, and the facet counts
+            models.Index(fields=['specialization', 'id'], name='doctor_specialization_idx'),
         ]
 
     def __str__(self):
         return f"Dr. {self.name} - {self.specialization}"
 
+class ScheduleEntry(models.Model):
+    """
+    Working hours of a doctor, read by ``appointments.schedules``.
+
+    Weekly entries give the hours of one weekday, optionally only between two
+    dates; extra entries add hours and leave entries remove them on the dates
+    they cover. A leave entry without a doctor closes the whole clinic, and one
+    without times covers whole days.
+    """
+    KIND_CHOICES = [
+        ('weekly', 'Weekly hours'),
+        ('extra', 'Extra hours'),
+        ('leave', 'Leave'),
+    ]
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, null=True, blank=True, related_name='schedule')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    weekday = models.PositiveSmallIntegerField(null=True, blank=True, help_text='0 is Monday; weekly entries only')
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    start_time = models.TimeField(null=True, blank=True)
+    end_time = models.TimeField(null=True, blank=True)
+    note = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        ordering = ['doctor_id', 'kind', 'weekday', 'start_date', 'start_time']
+
+    def clean(self):
+        if self.kind == 'weekly':
+            if self.weekday is None or self.weekday > 6:
+                raise ValidationError({'weekday': 'Weekly hours need a weekday from 0 (Monday) to 6.'})
+            if self.start_time is None or self.end_time is None:
+                raise ValidationError('Weekly hours need a start and an end time.')
+        elif self.start_date is None or self.end_date is None:
+            raise ValidationError('Extra hours and leave need a start and an end date.')
+        if self.kind == 'extra' and (self.start_time is None or self.end_time is None):
+            raise ValidationError('Extra hours need a start and an end time.')
+        if self.doctor_id is None and self.kind != 'leave':
+            raise ValidationError({'doctor': 'Only leave can apply to every doctor.'})
+        if self.start_date and self.end_date and self.end_date < self.start_date:
+            raise ValidationError({'end_date': 'The end date is before the start date.'})
+        if self.start_time and self.end_time and self.end_time <= self.start_time:
+            raise ValidationError({'end_time': 'The end time must be after the start time.'})
+
+    def covers(self, day):
+        return (self.start_date is None or self.start_date <= day) and (self.end_date is None or day <= self.end_date)
+
+    def interval(self):
+        """The entry's hours as minutes of the day; no times means the whole day."""
+        start = self.start_time.hour * 60 + self.start_time.minute if self.start_time else 0
+        end = self.end_time.hour * 60 + self.end_time.minute if self.end_time else 24 * 60
+        return start, end
+
+    def __str__(self):
+        who = f"Dr. {self.doctor.name}" if self.doctor_id else "Clinic"
+        return f"{who}: {self.get_kind_display()}"
+
+class DoctorSearchTerm(models.Model):
+    """
+    One normalized word of a doctor's name or specialization; maintained by
+    ``appointments.search``.
+    """
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='search_terms')
+    term = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            # Prefix searches are range scans on term that also read doctor_id from the index
+            models.UniqueConstraint(fields=['term', 'doctor'], name='unique_doctor_search_term'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.doctor_id}"
+
+class SearchTrigram(models.Model):
+    """
+    A trigram of a word that has appeared in DoctorSearchTerm, used to find
+    words close to a misspelled one. Keyed by word rather than by doctor, so
+    a trigram lists each distinct word once however many doctors share it.
+    """
+    trigram = models.CharField(max_length=3)
+    word = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['trigram', 'word'], name='unique_search_trigram'),
+        ]
+
+    def __str__(self):
+        return f"{self.trigram} -> {self.word}"
+
 class Appointment(models.Model):
     STATUS_CHOICES = [
         ('scheduled', 'Scheduled'),
@@ -70,20 +197,39 @@ class Appointment(models.Model):
     date = models.DateTimeField()
     notes = models.TextField(blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled')
+    reminder_sent_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ['-date']
+        # The foreign keys are indexed on their own, and per-doctor slot lookups
+        # (doctor, scheduled, date range) are served by the partial unique index
+        # behind unique_scheduled_doctor_slot.
         indexes = [
             models.Index(fields=['date']),
-            models.Index(fields=['status']),
-            models.Index(fields=['patient']),
-            models.Index(fields=['doctor']),
+            # Status filters with a date range: reminders, closing past appointments
+            # and multi-doctor availability ranges
+            models.Index(fields=['status', 'date'], name='appt_status_date_idx'),
+            # A patient's appointment list in cursor order
+            models.Index(fields=['patient', '-date', '-id'], name='appt_patient_date_idx'),
+        ]
+        constraints = [
+            # A slot is claimed by inserting the row; the database rejects a second
+            # scheduled booking for the same doctor and start time.
+            models.UniqueConstraint(
+                fields=['doctor', 'date'],
+                condition=models.Q(status='scheduled'),
+                name='unique_scheduled_doctor_slot',
+            ),
         ]
 
-    def save(self, *args, **kwargs):
-        if self.date < timezone.now() and self.status == 'scheduled':
-            self.status = 'completed'
-        super().save(*args, **kwargs)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the slot the row was loaded with so a move can invalidate it too
+        instance._loaded_slot = (instance.__dict__.get('doctor_id'), instance.__dict__.get('date'))
+        # ... and what DailyStats counted it as, so a change moves the count
+        instance._counted_as = instance._loaded_slot + (instance.__dict__.get('status'),)
+        return instance
 
     def __str__(self):
         return f"{self.patient.get_full_name()} with {self.doctor} on {self.date}"
@@ -101,3 +247,54 @@ class Appointment(models.Model):
         time_until = self.date - timezone.now()
         return time_until.total_seconds() >= 3600  # At least 1 hour before appointment
 
+
+class DailyStats(models.Model):
+    """
+    Appointments of one doctor on one local day by status; maintained by
+    ``appointments.stats`` so dashboards never aggregate Appointment itself.
+    """
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    scheduled = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    cancelled = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['day', 'doctor_id']
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'day'], name='unique_doctor_daily_stats'),
+        ]
+        indexes = [
+            # Clinic-wide totals over a date range
+            models.Index(fields=['day', 'doctor'], name='daily_stats_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor_id} on {self.day}: {self.scheduled}/{self.completed}/{self.cancelled}"
+
+
+class OutboxEmail(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    to = models.EmailField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {self.to} ({self.status})"
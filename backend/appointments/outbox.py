@@ -0,0 +1,115 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import OutboxEmail
+
+MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+RETRY_BASE_SECONDS = getattr(settings, 'OUTBOX_RETRY_BASE_SECONDS', 60)
+# How long a worker owns the rows it claimed before another worker may retry them
+CLAIM_SECONDS = getattr(settings, 'OUTBOX_CLAIM_SECONDS', 300)
+
+
+def enqueue(subject, body, recipients, from_email=None):
+    """
+    Queue emails for the outbox worker instead of talking to SMTP in the request.
+
+    Call this inside the transaction that makes the change being announced so
+    the email is only queued if that change commits.
+    """
+    return OutboxEmail.objects.bulk_create([
+        OutboxEmail(
+            subject=subject,
+            body=body,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            to=recipient,
+        )
+        for recipient in recipients
+    ])
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+
+
+def _claim(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('id')[:batch_size]
+        )
+        OutboxEmail.objects.filter(id__in=[email.id for email in batch]).update(
+            next_attempt_at=now + timedelta(seconds=CLAIM_SECONDS)
+        )
+    return batch
+
+
+def _record_failures(failures):
+    now = timezone.now()
+    for email, error in failures:
+        email.attempts += 1
+        email.last_error = error
+        if email.attempts >= MAX_ATTEMPTS:
+            email.status = 'failed'
+        else:
+            email.next_attempt_at = now + retry_delay(email.attempts)
+    OutboxEmail.objects.bulk_update(
+        [email for email, _ in failures],
+        ['attempts', 'last_error', 'status', 'next_attempt_at'],
+    )
+
+
+def send_batch(batch, connection):
+    """Send claimed emails over an already open connection; returns (sent, failed)."""
+    sent_ids = []
+    failures = []
+    started = time.perf_counter()
+    for email in batch:
+        message = EmailMessage(email.subject, email.body, email.from_email, [email.to], connection=connection)
+        try:
+            connection.send_messages([message])
+            sent_ids.append(email.id)
+        except Exception as e:
+            failures.append((email, str(e)))
+    metrics.record_email_batch(time.perf_counter() - started, len(sent_ids), len(failures))
+
+    OutboxEmail.objects.filter(id__in=sent_ids).update(status='sent', sent_at=timezone.now())
+    if failures:
+        _record_failures(failures)
+    return len(sent_ids), len(failures)
+
+
+def drain(batch_size=100, connection=None):
+    """
+    Send every due outbox email in batches over one reused connection.
+
+    Returns the number of emails sent and the number of failed attempts.
+    """
+    connection = connection or get_connection(fail_silently=False)
+    sent = failed = 0
+    batch = _claim(batch_size)
+    if not batch:
+        return sent, failed
+
+    try:
+        connection.open()
+    except Exception as e:
+        _record_failures([(email, str(e)) for email in batch])
+        return sent, len(batch)
+
+    try:
+        while batch:
+            batch_sent, batch_failed = send_batch(batch, connection)
+            sent += batch_sent
+            failed += batch_failed
+            batch = _claim(batch_size)
+    finally:
+        connection.close()
+    return sent, failed
@@ -0,0 +1,18 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+PAGE_SIZE = getattr(settings, 'API_PAGE_SIZE', 20)
+MAX_PAGE_SIZE = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+
+
+class IdCursorPagination(CursorPagination):
+    """Keyset pagination on the primary key; clients may pass ?page_size= up to the cap."""
+    ordering = ('id',)
+    page_size = PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+
+
+class AppointmentCursorPagination(IdCursorPagination):
+    # Newest first, matching Appointment.Meta.ordering, with id breaking ties
+    ordering = ('-date', '-id')
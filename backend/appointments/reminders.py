@@ -0,0 +1,80 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from . import metrics
+from .availability import day_range
+from .models import Appointment
+
+
+def _reminder(appointment, connection):
+    return EmailMessage(
+        'Appointment Reminder',
+        f'You have an appointment with Dr. {appointment.doctor.name} tomorrow at {appointment.date.strftime("%I:%M %p")}.',
+        settings.DEFAULT_FROM_EMAIL,
+        [appointment.patient.email],
+        connection=connection,
+    )
+
+
+def _flush(batch, connection, stats):
+    started = time.perf_counter()
+    try:
+        sent = connection.send_messages([message for _, message in batch])
+    except Exception as e:
+        # Nothing in the batch is marked, so a rerun retries all of it
+        metrics.record_email_batch(time.perf_counter() - started, 0, len(batch))
+        stats['failed_batches'] += 1
+        stats['errors'].append(str(e))
+        return
+    metrics.record_email_batch(time.perf_counter() - started, sent)
+    stats['emails'] += sent
+    Appointment.objects.filter(id__in=[pk for pk, _ in batch]).update(reminder_sent_at=timezone.now())
+
+
+def send_reminders(day=None, batch_size=500, connection=None):
+    """
+    Email every scheduled appointment on ``day`` (tomorrow by default) that has
+    not been reminded yet, in batches over a single mail connection.
+
+    Appointments are streamed with their doctor and patient joined in, and each
+    batch is stamped with ``reminder_sent_at`` once sent so reruns skip it.
+    Returns counters and timings for the run.
+    """
+    day = day or timezone.localdate() + timedelta(days=1)
+    start, end = day_range(day)
+    appointments = (
+        Appointment.objects.filter(
+            status='scheduled',
+            date__gte=start,
+            date__lt=end,
+            reminder_sent_at__isnull=True,
+        )
+        .select_related('doctor', 'patient')
+        .only('id', 'date', 'doctor__name', 'patient__email')
+        .order_by('id')
+        .iterator(chunk_size=batch_size)
+    )
+    connection = connection or get_connection(fail_silently=False)
+    stats = {'appointments': 0, 'emails': 0, 'failed_batches': 0, 'errors': []}
+    started = time.perf_counter()
+
+    with connection:
+        batch = []
+        for appointment in appointments:
+            stats['appointments'] += 1
+            batch.append((appointment.id, _reminder(appointment, connection)))
+            if len(batch) >= batch_size:
+                _flush(batch, connection, stats)
+                batch = []
+        if batch:
+            _flush(batch, connection, stats)
+
+    stats['seconds'] = time.perf_counter() - started
+    elapsed = stats['seconds'] or 1e-9
+    stats['appointments_per_second'] = stats['appointments'] / elapsed
+    stats['emails_per_second'] = stats['emails'] / elapsed
+    return stats
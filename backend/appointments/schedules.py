@@ -0,0 +1,190 @@
+"""
+Doctors' working hours as sorted, disjoint minute-of-day intervals per local day.
+
+Hours come from ScheduleEntry rows: the weekly entries in effect on a day, or
+work_start-work_end Monday to Friday for a doctor without any, plus extra
+hours, minus leave. Availability is interval arithmetic on top of that: the
+working intervals minus the intervals bookings occupy, cut into slots.
+"""
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, Exists, OuterRef, Q
+
+from .caching import VersionedCache
+from .models import Doctor, ScheduleEntry
+
+# Weekdays a doctor without weekly entries works, 0 being Monday
+DEFAULT_WEEKDAYS = range(5)
+
+# Bumped by the ScheduleEntry signals
+entry_cache = VersionedCache('schedules', timeout=getattr(settings, 'SCHEDULE_CACHE_TIMEOUT', 60 * 60))
+
+
+def minute_of_day(value):
+    """Minutes since midnight of a time or (local) datetime."""
+    return value.hour * 60 + value.minute
+
+
+def hhmm(minute):
+    """A minute of the day as 'HH:MM'."""
+    return f'{minute // 60:02d}:{minute % 60:02d}'
+
+
+def merge(intervals):
+    """Sort ``(start, end)`` intervals and coalesce those that overlap or touch."""
+    merged = []
+    for start, end in sorted(intervals):
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract(intervals, removed):
+    """The parts of ``intervals`` not covered by ``removed``; both merged."""
+    result = []
+    i = 0
+    for start, end in intervals:
+        while i < len(removed) and removed[i][1] <= start:
+            i += 1
+        j = i
+        while j < len(removed) and removed[j][0] < end:
+            if removed[j][0] > start:
+                result.append((start, removed[j][0]))
+            start = max(start, removed[j][1])
+            j += 1
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+class Schedule:
+    """One doctor's hours, worked out per day on first use."""
+
+    def __init__(self, doctor, entries):
+        self.slot_minutes = doctor.slot_minutes
+        self._default = [(minute_of_day(doctor.work_start), minute_of_day(doctor.work_end))]
+        self._entries = defaultdict(list)
+        for entry in entries:
+            self._entries[entry.kind].append(entry)
+        self._working = {}
+
+    def working(self, day):
+        """Merged working intervals on a local day."""
+        hours = self._working.get(day)
+        if hours is None:
+            weekly = [entry for entry in self._entries['weekly'] if entry.covers(day)]
+            if weekly:
+                found = [entry.interval() for entry in weekly if entry.weekday == day.weekday()]
+            else:
+                found = list(self._default) if day.weekday() in DEFAULT_WEEKDAYS else []
+            found += [entry.interval() for entry in self._entries['extra'] if entry.covers(day)]
+            leave = merge(entry.interval() for entry in self._entries['leave'] if entry.covers(day))
+            hours = self._working[day] = subtract(merge(found), leave)
+        return hours
+
+    def starts(self, day):
+        """Slot start minutes on a day; each working interval is cut from its start."""
+        length = self.slot_minutes
+        return [
+            minute
+            for start, end in self.working(day)
+            for minute in range(start, end - length + 1, length)
+        ]
+
+    def slots(self, day, booked=()):
+        """
+        ``(start, is_free)`` for every slot on a day, given the sorted start
+        minutes of its bookings. A slot is free when no booking overlaps it.
+        """
+        length = self.slot_minutes
+        free = subtract(self.working(day), merge((minute, minute + length) for minute in booked))
+        result = []
+        i = 0
+        for start in self.starts(day):
+            while i < len(free) and free[i][1] < start + length:
+                i += 1
+            result.append((start, i < len(free) and free[i][0] <= start))
+        return result
+
+
+def _fetch(doctor_ids):
+    """The entries of each doctor and the clinic-wide ones, from cache or one query."""
+    version = entry_cache.version()
+    keys = {doctor_id: f'{entry_cache.namespace}:{version}:{doctor_id}' for doctor_id in doctor_ids}
+    clinic_key = f'{entry_cache.namespace}:{version}:clinic'
+    cached = entry_cache.cache.get_many([*keys.values(), clinic_key])
+    missing = [doctor_id for doctor_id, key in keys.items() if key not in cached]
+    if missing or clinic_key not in cached:
+        rows = ScheduleEntry.objects.filter(Q(doctor_id__in=missing) | Q(doctor__isnull=True)).order_by()
+        fetched = {doctor_id: [] for doctor_id in missing}
+        clinic = []
+        for entry in rows:
+            (clinic if entry.doctor_id is None else fetched[entry.doctor_id]).append(entry)
+        fresh = {keys[doctor_id]: entries for doctor_id, entries in fetched.items()}
+        fresh[clinic_key] = clinic
+        entry_cache.cache.set_many(fresh, entry_cache.timeout)
+        cached.update(fresh)
+    return {doctor_id: cached[key] for doctor_id, key in keys.items()}, cached[clinic_key]
+
+
+def load(doctors):
+    """
+    ``{doctor_id: Schedule}`` for the doctors. Entries are cached per doctor
+    until any entry changes, and read with at most one query otherwise.
+    """
+    doctors = list(doctors)
+    own, clinic = _fetch([doctor.id for doctor in doctors])
+    return {doctor.id: Schedule(doctor, own[doctor.id] + clinic) for doctor in doctors}
+
+
+async def aload(doctors):
+    return await sync_to_async(load)(doctors)
+
+
+def capacity(doctors, days):
+    """
+    ``{doctor_id: [slot count per day]}``. Doctors with no entries of their own
+    and the same default hours share one count, so large sets stay cheap.
+    """
+    doctors = list(doctors)
+    own, clinic = _fetch([doctor.id for doctor in doctors])
+    shared = {}
+    result = {}
+    for doctor in doctors:
+        key = doctor.id if own[doctor.id] else (doctor.slot_minutes, doctor.work_start, doctor.work_end)
+        if key not in shared:
+            schedule = Schedule(doctor, own[doctor.id] + clinic)
+            shared[key] = [len(schedule.starts(day)) for day in days]
+        result[doctor.id] = shared[key]
+    return result
+
+
+def total_capacity(doctors, days):
+    """
+    Slots the doctors of the ``doctors`` queryset work on each day, summed.
+    Doctors on default hours are counted per distinct hours in one query;
+    only those with entries of their own get a Schedule each.
+    """
+    has_entries = Exists(ScheduleEntry.objects.filter(doctor=OuterRef('pk')))
+    _, clinic = _fetch([])
+    totals = [0] * len(days)
+    groups = doctors.filter(~has_entries).order_by().values('slot_minutes', 'work_start', 'work_end').annotate(doctors=Count('id'))
+    for group in groups:
+        count = group.pop('doctors')
+        schedule = Schedule(Doctor(**group), clinic)
+        totals = [total + count * len(schedule.starts(day)) for total, day in zip(totals, days)]
+    own = doctors.filter(has_entries).only('id', 'slot_minutes', 'work_start', 'work_end')
+    for counts in capacity(own, days).values():
+        totals = [total + count for total, count in zip(totals, counts)]
+    return totals
+
+
+def for_doctor(doctor):
+    return load([doctor])[doctor.id]
@@ -0,0 +1,111 @@
+"""
+Doctor search over precomputed, normalized terms.
+
+Every word of a doctor's name and specialization is stored casefolded and
+stripped of accents in DoctorSearchTerm, so a prefix query is a range scan on
+the term index. Each distinct word's trigrams go to SearchTrigram; a query
+word that starts no stored word (usually a typo) is matched against the words
+sharing most of its trigrams instead.
+"""
+import math
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db.models import Count
+
+from .models import Doctor, DoctorSearchTerm, SearchTrigram
+
+# Share of a query word's trigrams a stored word must contain to stand in for it
+MIN_SIMILARITY = getattr(settings, 'DOCTOR_SEARCH_MIN_SIMILARITY', 0.5)
+# ?ordering=next_available ranks at most this many matches, looking this many days ahead
+RANK_LIMIT = getattr(settings, 'DOCTOR_SEARCH_RANK_LIMIT', 500)
+RANK_DAYS = getattr(settings, 'DOCTOR_SEARCH_RANK_DAYS', 14)
+BATCH_SIZE = 2000
+
+_WORD_RE = re.compile(r'[^\W_]+')
+
+
+def normalize(text):
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(_WORD_RE.findall(stripped.casefold()))
+
+
+def words(text):
+    return normalize(text).split()
+
+
+def trigrams(word):
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def terms(doctor):
+    return {word[:100] for word in words(doctor.name) + words(doctor.specialization)}
+
+
+def _store(doctors):
+    found = {doctor.id: terms(doctor) for doctor in doctors}
+    DoctorSearchTerm.objects.bulk_create(
+        (DoctorSearchTerm(doctor_id=doctor_id, term=term) for doctor_id, found_terms in found.items() for term in found_terms),
+        batch_size=BATCH_SIZE,
+    )
+    vocabulary = set().union(*found.values())
+    # Words are never removed from the vocabulary; a stale one matches no doctor
+    SearchTrigram.objects.bulk_create(
+        (SearchTrigram(trigram=trigram, word=word) for word in vocabulary for trigram in trigrams(word)),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def index(doctors):
+    """Rebuild the search terms of the given doctors."""
+    doctors = list(doctors)
+    DoctorSearchTerm.objects.filter(doctor_id__in=[doctor.id for doctor in doctors]).delete()
+    _store(doctors)
+
+
+def reindex():
+    """Rebuild every doctor's search terms, for doctors inserted with bulk_create."""
+    DoctorSearchTerm.objects.all().delete()
+    SearchTrigram.objects.all().delete()
+    doctors = Doctor.objects.only('name', 'specialization').order_by('id')
+    last_id = 0
+    while batch := list(doctors.filter(id__gt=last_id)[:BATCH_SIZE]):
+        _store(batch)
+        last_id = batch[-1].id
+
+
+def _prefixed(word):
+    # A range rather than LIKE, so every backend can use the term index
+    return DoctorSearchTerm.objects.filter(term__gte=word, term__lt=word + '\uffff').values('doctor_id')
+
+
+def _similar(word):
+    wanted = trigrams(word)
+    close_words = (
+        SearchTrigram.objects
+        .filter(trigram__in=wanted)
+        .values('word')
+        .annotate(shared=Count('id'))
+        .filter(shared__gte=math.ceil(len(wanted) * MIN_SIMILARITY))
+        .values('word')
+    )
+    return DoctorSearchTerm.objects.filter(term__in=close_words).values('doctor_id')
+
+
+def filter_doctors(queryset, query):
+    """
+    Doctors matching every word of the query, by prefix or, for a word that
+    starts no stored word, through the stored words closest to it.
+    """
+    for word in words(query):
+        prefixed = _prefixed(word)
+        if prefixed.exists():
+            queryset = queryset.filter(id__in=prefixed)
+        elif len(word) >= 3:
+            queryset = queryset.filter(id__in=_similar(word))
+        else:
+            return queryset.none()
+    return queryset
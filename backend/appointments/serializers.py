@@ -1,47 +1,131 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
-from .models import User, Doctor, Appointment
+from .models import User, Doctor, Appointment, ScheduleEntry
+from . import availability, avatars, booking
+from .fieldsets import SparseFieldsMixin
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    avatar_thumbnails = serializers.SerializerMethodField()
+    field_columns = {'avatar_thumbnails': ('avatar',)}
 
-class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'phone', 'birthday', 'medical_history', 'avatar')
+        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'phone', 'birthday', 'medical_history', 'avatar', 'avatar_thumbnails')
         extra_kwargs = {
             'password': {'write_only': True},
-            'username': {'read_only': True}
+            'username': {'read_only': True},
+            'avatar': {'read_only': True},
         }
 
+    def _url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_avatar_thumbnails(self, obj):
+        # Keyed by edge length in pixels; empty for avatars uploaded before resizing
+        return self.value_avatar_thumbnails({'avatar': obj.avatar.name if obj.avatar else ''})
+
+    def value_avatar(self, row):
+        return self._url(row['avatar']) if row['avatar'] else None
+
+    def value_avatar_thumbnails(self, row):
+        return {str(size): self._url(name) for size, name in avatars.thumbnail_names(row['avatar'] or '').items()}
+
     def create(self, validated_data):
         user = User.objects.create_user(**validated_data)
         return user
 
-class DoctorSerializer(serializers.ModelSerializer):
+    def update(self, instance, validated_data):
+        # Write only the submitted columns so a stale instance cannot undo
+        # concurrent changes to the others (avatar, is_active)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
+class DoctorSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Doctor
-        fields = ('id', 'name', 'specialization', 'email', 'phone')
+        fields = ('id', 'name', 'specialization', 'email', 'phone', 'slot_minutes', 'work_start', 'work_end')
         
     def create(self, validated_data):
         doctor = Doctor.objects.create(**validated_data)
         return doctor
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class ScheduleEntrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ScheduleEntry
+        fields = ('id', 'doctor', 'kind', 'weekday', 'start_date', 'end_date', 'start_time', 'end_time', 'note')
+
+    def validate(self, attrs):
+        entry = ScheduleEntry(**{
+            field: attrs.get(field, getattr(self.instance, field, None))
+            for field in self.Meta.fields if field != 'id'
+        })
+        try:
+            entry.clean()
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.message_dict if hasattr(e, 'error_dict') else e.messages)
+        return attrs
+
+class AppointmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     patient_name = serializers.ReadOnlyField(source='patient.get_full_name')
     doctor_name = serializers.ReadOnlyField(source='doctor.name')
     doctor = serializers.PrimaryKeyRelatedField(queryset=Doctor.objects.all())
     date = serializers.DateTimeField()
+    field_columns = {'patient_name': ('patient__first_name', 'patient__last_name')}
 
     class Meta:
         model = Appointment
         fields = ['id', 'patient', 'patient_name', 'doctor', 'doctor_name', 'date', 'notes', 'status']
         read_only_fields = ['patient', 'status']
+        # Double bookings are rejected by the unique_scheduled_doctor_slot constraint
+        # at insert time; a pre-check query here would only reintroduce the race.
+        validators = []
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # Join the related rows the read-only name fields use and skip every
+        # column the representation does not need.
+        return queryset.select_related('doctor', 'patient').only(
+            'id', 'date', 'notes', 'status',
+            'doctor__name',
+            'patient__first_name', 'patient__last_name',
+        )
+
+    def value_patient_name(self, row):
+        # As User.get_full_name
+        return f"{row['patient__first_name']} {row['patient__last_name']}".strip()
+
+    def validate(self, attrs):
+        if 'doctor' in attrs or 'date' in attrs:
+            doctor = attrs.get('doctor', getattr(self.instance, 'doctor', None))
+            date = attrs.get('date', getattr(self.instance, 'date', None))
+            if not availability.is_slot_start(doctor, date):
+                raise serializers.ValidationError({'date': "Appointments must start on one of the doctor's slots."})
+        return attrs
 
     def create(self, validated_data):
         # Get the current user from the context
         user = self.context['request'].user
         validated_data['patient'] = user
         validated_data['status'] = 'scheduled'
+        booking.check_slot(validated_data['doctor'], validated_data['date'])
         return super().create(validated_data)
 
+    def update(self, instance, validated_data):
+        doctor = validated_data.get('doctor', instance.doctor)
+        date = validated_data.get('date', instance.date)
+        if instance.status == 'scheduled' and (doctor.pk, date) != (instance.doctor_id, instance.date):
+            booking.check_slot(doctor, date, exclude_id=instance.pk)
+        return super().update(instance, validated_data)
+
 class RegistrationSerializer(serializers.ModelSerializer):
+    USERNAME_ATTEMPTS = 5
+
     password = serializers.CharField(write_only=True)
     username = serializers.CharField(required=False)
 
@@ -50,19 +134,7 @@ class RegistrationSerializer(serializers.ModelSerializer):
         fields = ('username', 'email', 'password', 'first_name', 'last_name', 'phone', 'birthday', 'medical_history')
 
     def create(self, validated_data):
-        # Generate username from email if not provided
-        if 'username' not in validated_data:
-            email = validated_data['email']
-            username = email.split('@')[0]
-            base_username = username
-            counter = 1
-            while User.objects.filter(username=username).exists():
-                username = f"{base_username}{counter}"
-                counter += 1
-            validated_data['username'] = username
-
-        user = User.objects.create_user(
-            username=validated_data['username'],
+        fields = dict(
             email=validated_data['email'],
             password=validated_data['password'],
             first_name=validated_data.get('first_name', ''),
@@ -71,7 +143,24 @@ class RegistrationSerializer(serializers.ModelSerializer):
             birthday=validated_data.get('birthday'),
             medical_history=validated_data.get('medical_history', '')
         )
-        return user
+        if 'username' in validated_data:
+            return User.objects.create_user(username=validated_data['username'], **fields)
+
+        # Generate username from email. The unique constraint on username decides
+        # races: if a concurrent registration claims the same name first, allocate
+        # again and retry.
+        base_username = validated_data['email'].split('@')[0]
+        for _ in range(self.USERNAME_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    return User.objects.create_user(
+                        username=User.objects.next_username(base_username),
+                        **fields
+                    )
+            except IntegrityError:
+                if User.objects.filter(email__iexact=validated_data['email']).exists():
+                    raise serializers.ValidationError({'email': ['user with this email already exists.']})
+        raise serializers.ValidationError({'username': ['Could not allocate a username, please try again.']})
 
 class LoginSerializer(serializers.Serializer):
     email = serializers.EmailField()
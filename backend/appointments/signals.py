@@ -0,0 +1,120 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from . import availability, events, schedules, search, stats, transitions
+from .authentication import token_cache
+from .caching import appointment_versions, doctor_directory
+from .models import Appointment, Doctor, ScheduleEntry, User
+
+
+def _affected_slots(instance):
+    slots = {(instance.doctor_id, instance.date)}
+    loaded = getattr(instance, '_loaded_slot', None)
+    if loaded and None not in loaded:
+        slots.add(loaded)
+    return slots
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def invalidate_availability(sender, instance, **kwargs):
+    for doctor_id, date in _affected_slots(instance):
+        # Wait for the commit so a concurrent reader cannot re-cache the old state
+        transaction.on_commit(lambda d=doctor_id, dt=date: availability.invalidate(d, dt))
+        transaction.on_commit(lambda d=doctor_id, dt=date: events.publish_slot_change(d, dt))
+    instance._loaded_slot = (instance.doctor_id, instance.date)
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def bump_appointment_version(sender, instance, **kwargs):
+    transaction.on_commit(lambda: appointment_versions.bump(instance.patient_id))
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def count_daily_stats(sender, instance, signal, **kwargs):
+    # Written in the same transaction as the appointment, so the counts cannot drift
+    stats.record(instance, deleted=signal is post_delete)
+
+
+@receiver(transitions.appointments_completed)
+def follow_completed_appointments(sender, rows, **kwargs):
+    tz = timezone.get_current_timezone()
+    current_day = timezone.localdate()
+    changes = Counter()
+    today = []
+    for _, _, doctor_id, date in rows:
+        day = date.astimezone(tz).date()
+        changes[doctor_id, day, 'scheduled'] -= 1
+        changes[doctor_id, day, 'completed'] += 1
+        if day == current_day:
+            today.append((doctor_id, date))
+    stats.apply(changes)
+    doctor_days = {(doctor_id, day) for doctor_id, day, _ in changes}
+    patient_ids = {patient_id for _, patient_id, _, _ in rows}
+
+    def after_commit():
+        availability.invalidate_days(doctor_days)
+        for patient_id in patient_ids:
+            appointment_versions.bump(patient_id)
+        # Streams only show today onwards, and only today can hold expired slots
+        for doctor_id, date in today:
+            events.publish_slot_change(doctor_id, date)
+
+    transaction.on_commit(after_commit)
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def invalidate_doctor_directory(sender, instance, **kwargs):
+    transaction.on_commit(doctor_directory.bump)
+    # Appointment lists show the doctor's name
+    transaction.on_commit(appointment_versions.bump)
+
+
+@receiver(post_save, sender=ScheduleEntry)
+@receiver(post_delete, sender=ScheduleEntry)
+def invalidate_schedules(sender, instance, **kwargs):
+    transaction.on_commit(schedules.entry_cache.bump)
+
+
+@receiver(post_save, sender=Doctor)
+def index_doctor(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'name', 'specialization'} & set(update_fields):
+        return
+    search.index([instance])
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    # After the commit, or a concurrent request could re-cache the token
+    transaction.on_commit(lambda key=instance.key: token_cache.evict(key))
+
+
+@receiver(post_save, sender=User)
+def evict_user_tokens(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login, which nothing reads from the cached user
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    keys = list(Token.objects.filter(user=instance).values_list('key', flat=True))
+
+    def evict():
+        for key in keys:
+            token_cache.evict(key)
+    # After the commit, or a concurrent request could re-cache the old row
+    transaction.on_commit(evict)
+
+
+@receiver(post_save, sender=User)
+def bump_patient_name(sender, instance, update_fields=None, **kwargs):
+    # Appointment lists show the patient's name
+    if update_fields is not None and not {'first_name', 'last_name'} & set(update_fields):
+        return
+    transaction.on_commit(lambda: appointment_versions.bump(instance.id))
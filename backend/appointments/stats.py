@@ -0,0 +1,183 @@
+"""
+Appointment counts per doctor and local day, for the clinic dashboards.
+
+DailyStats holds one row per (doctor, day) with the number of appointments in
+each status. The Appointment signals move a count whenever a row is booked,
+cancelled, completed, moved or deleted, inside the same transaction; bulk
+writes that send no signals pass their changes to ``apply`` or call
+``rebuild``. Dashboard reads then cover days x doctors rollup rows, never the
+appointments themselves.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from . import availability, schedules
+from .models import Appointment, DailyStats
+
+STATUSES = ('scheduled', 'completed', 'cancelled')
+# Longest range of days one dashboard request may cover
+MAX_RANGE_DAYS = getattr(settings, 'STATS_MAX_RANGE_DAYS', 366)
+BATCH_SIZE = 2000
+
+
+def _key(doctor_id, date, status):
+    return doctor_id, timezone.localdate(date), status
+
+
+def _add(doctor_id, day, deltas):
+    rows = DailyStats.objects.filter(doctor_id=doctor_id, day=day)
+    # Clamped so a count that drifted (a bulk write nobody recorded) cannot fail a booking
+    changes = {status: Greatest(F(status) + delta, 0) for status, delta in deltas.items()}
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailyStats.objects.create(
+                doctor_id=doctor_id, day=day, **{status: max(delta, 0) for status, delta in deltas.items()}
+            )
+    except IntegrityError:
+        # Another transaction created the row first
+        rows.update(**changes)
+
+
+def record(appointment, deleted=False):
+    """Move the appointment's count to its current state; called by the signals."""
+    old = getattr(appointment, '_counted_as', None)
+    new = None if deleted else (appointment.doctor_id, appointment.date, appointment.status)
+    appointment._counted_as = new
+    if old == new:
+        return
+    changes = Counter()
+    if old and None not in old:
+        changes[_key(*old)] -= 1
+    if new:
+        changes[_key(*new)] += 1
+    by_day = defaultdict(dict)
+    for (doctor_id, day, status), delta in changes.items():
+        if delta:
+            by_day[doctor_id, day][status] = delta
+    for (doctor_id, day), deltas in by_day.items():
+        _add(doctor_id, day, deltas)
+
+
+def apply(changes):
+    """
+    Add ``{(doctor_id, day, status): delta}`` to the rollup in bulk, for writes
+    that bypassed the model signals. Rows getting the same deltas share one
+    UPDATE, so a batch costs a handful of statements however many rows it moves.
+    """
+    by_day = defaultdict(Counter)
+    for (doctor_id, day, status), delta in changes.items():
+        if delta:
+            by_day[doctor_id, day][status] += delta
+    if not by_day:
+        return
+    with transaction.atomic(savepoint=False):
+        existing = {
+            (doctor_id, day): row_id
+            for row_id, doctor_id, day in DailyStats.objects.select_for_update().filter(
+                doctor_id__in={doctor_id for doctor_id, _ in by_day},
+                day__in={day for _, day in by_day},
+            ).values_list('id', 'doctor_id', 'day')
+        }
+        created = []
+        same_deltas = defaultdict(list)
+        for (doctor_id, day), deltas in by_day.items():
+            row_id = existing.get((doctor_id, day))
+            if row_id is None:
+                created.append(DailyStats(
+                    doctor_id=doctor_id, day=day, **{status: max(delta, 0) for status, delta in deltas.items()}
+                ))
+            else:
+                same_deltas[tuple(sorted(deltas.items()))].append(row_id)
+        for deltas, row_ids in same_deltas.items():
+            DailyStats.objects.filter(id__in=row_ids).update(
+                **{status: Greatest(F(status) + delta, 0) for status, delta in deltas}
+            )
+        DailyStats.objects.bulk_create(created, batch_size=BATCH_SIZE)
+
+
+def changes_of(appointments):
+    """The ``apply`` changes for appointments inserted without signals."""
+    return Counter(_key(a.doctor_id, a.date, a.status) for a in appointments)
+
+
+def rebuild(start_day=None, end_day=None):
+    """Recount the rollup from Appointment, for every day or the given range of days."""
+    appointments = Appointment.objects.order_by()
+    rows = DailyStats.objects.all()
+    if start_day:
+        appointments = appointments.filter(date__gte=availability.day_range(start_day)[0])
+        rows = rows.filter(day__gte=start_day)
+    if end_day:
+        appointments = appointments.filter(date__lt=availability.day_range(end_day)[1])
+        rows = rows.filter(day__lte=end_day)
+    counts = defaultdict(dict)
+    grouped = appointments.values('doctor_id', 'status', day=TruncDate('date')).annotate(count=Count('id'))
+    for row in grouped.iterator(chunk_size=BATCH_SIZE):
+        counts[row['doctor_id'], row['day']][row['status']] = row['count']
+    with transaction.atomic():
+        rows.delete()
+        DailyStats.objects.bulk_create(
+            (DailyStats(doctor_id=doctor_id, day=day, **found) for (doctor_id, day), found in counts.items()),
+            batch_size=BATCH_SIZE,
+        )
+    return len(counts)
+
+
+def _rates(totals, capacity):
+    booked = totals['scheduled'] + totals['completed']
+    total = booked + totals['cancelled']
+    return {
+        **totals,
+        'capacity': capacity,
+        'utilization': round(100 * booked / capacity, 1) if capacity else None,
+        'cancellation_rate': round(100 * totals['cancelled'] / total, 1) if total else None,
+    }
+
+
+def _days(start_day, end_day):
+    return [start_day + timedelta(days=offset) for offset in range((end_day - start_day).days + 1)]
+
+
+def by_doctor(doctors, start_day, end_day):
+    """Totals and rates over the range for each of ``doctors`` (a list)."""
+    days = _days(start_day, end_day)
+    totals = {
+        row['doctor_id']: row
+        for row in DailyStats.objects.filter(
+            doctor_id__in=[doctor.id for doctor in doctors], day__gte=start_day, day__lte=end_day,
+        ).order_by().values('doctor_id').annotate(**{status: Sum(status) for status in STATUSES})
+    }
+    capacity = schedules.capacity(doctors, days)
+    empty = dict.fromkeys(STATUSES, 0)
+    return {
+        doctor.id: _rates(
+            {status: totals.get(doctor.id, empty)[status] for status in STATUSES},
+            sum(capacity[doctor.id]),
+        )
+        for doctor in doctors
+    }
+
+
+def by_day(doctors, start_day, end_day):
+    """Clinic totals and rates per day, over the doctors of the ``doctors`` queryset."""
+    days = _days(start_day, end_day)
+    totals = {
+        row['day']: row
+        for row in DailyStats.objects.filter(
+            doctor__in=doctors, day__gte=start_day, day__lte=end_day,
+        ).order_by().values('day').annotate(**{status: Sum(status) for status in STATUSES})
+    }
+    capacity = schedules.total_capacity(doctors, days)
+    empty = dict.fromkeys(STATUSES, 0)
+    return [
+        {'day': day, **_rates({status: totals.get(day, empty)[status] for status in STATUSES}, slots)}
+        for day, slots in zip(days, capacity)
+    ]
@@ -1,3 +1,1826 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, time, timedelta
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from asgiref.sync import sync_to_async
+from unittest import mock, skipUnless
+
+from . import availability, avatars, benchmark, booking, bulk, caching, compression, events, metrics, outbox, reminders, schedules, search, stats, transitions
+from .authentication import token_cache
+from .management.commands.cleanup_duplicate_appointments import Command as CleanupCommand
+from .models import User, Doctor, Appointment, DailyStats, OutboxEmail, ScheduleEntry
+
+
+def make_user(email='patient@example.com', **extra):
+    extra.setdefault('username', email.split('@')[0])
+    return User.objects.create_user(email=email, **extra)
+
+
+def make_doctor(email='doc@example.com', **extra):
+    extra.setdefault('name', 'House')
+    extra.setdefault('specialization', 'Diagnostics')
+    extra.setdefault('phone', '555-0100')
+    return Doctor.objects.create(email=email, **extra)
+
+
+def treat_cache_as_shared(test):
+    # The test cache is local memory; these tests stand it in for a shared one
+    patcher = mock.patch.object(caching, 'process_local', return_value=False)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+def next_weekday(days=7):
+    day = timezone.localdate() + timedelta(days=days)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+
+def at(day, hour, minute=0):
+    return timezone.make_aware(datetime.combine(day, time(hour, minute)))
+
+
+class AvailabilityTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.doctor = make_doctor()
+        self.day = next_weekday()
+        self.client.force_authenticate(self.user)
+
+    def get_slots(self, doctor=None, day=None):
+        response = self.client.get('/api/appointments/available_slots/', {
+            'doctor_id': (doctor or self.doctor).id,
+            'date': (day or self.day).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        return {slot['time']: slot['is_available'] for slot in response.data}
+
+    def test_default_grid(self):
+        slots = self.get_slots()
+        self.assertEqual(len(slots), 16)
+        self.assertEqual(next(iter(slots)), '09:00')
+        self.assertTrue(all(slots.values()))
+
+    def test_booked_slot_is_unavailable(self):
+        Appointment.objects.create(patient=self.user, doctor=self.doctor, date=at(self.day, 10, 10))
+        slots = self.get_slots()
+        # An off-grid booking blocks every slot it overlaps
+        self.assertFalse(slots['10:00'])
+        self.assertFalse(slots['10:30'])
+        self.assertTrue(slots['11:00'])
+
+    def test_doctor_working_hours(self):
+        doctor = make_doctor('short@example.com', slot_minutes=20, work_start=time(8), work_end=time(10))
+        slots = self.get_slots(doctor)
+        self.assertEqual(list(slots), ['08:00', '08:20', '08:40', '09:00', '09:20', '09:40'])
+
+    def test_cached_day_is_refreshed_on_booking_and_cancel(self):
+        self.get_slots()
+        with self.assertNumQueries(1):
+            self.assertTrue(self.get_slots()['11:00'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = Appointment.objects.create(patient=self.user, doctor=self.doctor, date=at(self.day, 11))
+        self.assertFalse(self.get_slots()['11:00'])
+
+        appointment.status = 'cancelled'
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.save()
+        self.assertTrue(self.get_slots()['11:00'])
+
+    def test_process_local_cache_expires_quickly(self):
+        self.get_slots()
+        # Booked through another worker, whose invalidation never reaches this process's cache
+        Appointment.objects.bulk_create([Appointment(patient=self.user, doctor=self.doctor, date=at(self.day, 11))])
+        self.assertTrue(self.get_slots()['11:00'])
+        later = timezone.now().timestamp() + caching.LOCAL_TIMEOUT + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertFalse(self.get_slots()['11:00'])
+
+    def test_moving_appointment_frees_old_slot(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = Appointment.objects.create(patient=self.user, doctor=self.doctor, date=at(self.day, 9))
+        self.assertFalse(self.get_slots()['09:00'])
+
+        appointment = Appointment.objects.get(pk=appointment.pk)
+        appointment.date = at(self.day, 15)
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.save()
+        slots = self.get_slots()
+        self.assertTrue(slots['09:00'])
+        self.assertFalse(slots['15:00'])
+
+
+class AvailabilityRangeTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.cardio = make_doctor('heart@example.com', name='Heart', specialization='Cardiology')
+        self.other = make_doctor('heart2@example.com', name='Beat', specialization='cardiology')
+        self.skin = make_doctor('skin@example.com', name='Skin', specialization='Dermatology')
+        self.day = next_weekday()
+        self.client.force_authenticate(self.user)
+
+    def test_matrix_for_specialization_uses_one_appointment_query(self):
+        Appointment.objects.create(patient=self.user, doctor=self.cardio, date=at(self.day, 9))
+        end = self.day + timedelta(days=2)
+        # Doctors, their schedule entries and their appointments
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/appointments/availability/', {
+                'start': self.day.isoformat(),
+                'end': end.isoformat(),
+                'specialization': 'cardiology',
+            })
+        self.assertEqual(response.status_code, 200)
+        doctors = {doctor['id']: doctor['days'] for doctor in response.data['doctors']}
+        self.assertEqual(set(doctors), {self.cardio.id, self.other.id})
+        self.assertEqual(len(doctors[self.cardio.id]), 3)
+        self.assertNotIn('09:00', doctors[self.cardio.id][self.day.isoformat()])
+        self.assertIn('09:00', doctors[self.other.id][self.day.isoformat()])
+
+        # The range query warmed the per-day cache used by available_slots
+        with self.assertNumQueries(1):
+            self.client.get('/api/appointments/available_slots/', {
+                'doctor_id': self.cardio.id, 'date': self.day.isoformat(),
+            })
+
+    def test_first_free_slots(self):
+        Appointment.objects.create(patient=self.user, doctor=self.cardio, date=at(self.day, 9))
+        response = self.client.get('/api/appointments/availability/', {
+            'start': self.day.isoformat(),
+            'end': (self.day + timedelta(days=6)).isoformat(),
+            'doctor_ids': f'{self.cardio.id},{self.skin.id}',
+            'first': 3,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(slot['doctor_id'], slot['time']) for slot in response.data['slots']],
+            [(self.skin.id, '09:00'), (self.cardio.id, '09:30'), (self.skin.id, '09:30')],
+        )
+
+    def test_invalid_range(self):
+        response = self.client.get('/api/appointments/availability/', {
+            'start': self.day.isoformat(),
+            'end': (self.day - timedelta(days=1)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/appointments/availability/', {'start': 'tomorrow'})
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch.object(availability, 'MAX_RANGE_DOCTORS', 2)
+    def test_unfiltered_range_over_doctor_limit(self):
+        response = self.client.get('/api/appointments/availability/', {'start': self.day.isoformat()})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('doctor_ids or specialization', response.data['error'])
+        response = self.client.get('/api/appointments/availability/', {
+            'start': self.day.isoformat(), 'specialization': 'cardiology',
+        })
+        self.assertEqual(len(response.data['doctors']), 2)
+
+
+class BookingTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.doctor = make_doctor()
+        self.day = next_weekday()
+        self.client.force_authenticate(self.user)
+
+    def book(self, hour, minute=0, doctor=None):
+        return self.client.post('/api/appointments/', {
+            'doctor': (doctor or self.doctor).id,
+            'date': at(self.day, hour, minute).isoformat(),
+        }, format='json')
+
+    def test_double_booking_returns_conflict(self):
+        self.assertEqual(self.book(10).status_code, 201)
+        response = self.book(10)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['error'], 'This time slot is already booked')
+        self.assertEqual(Appointment.objects.filter(status='scheduled').count(), 1)
+
+    def test_moving_onto_a_booked_slot_returns_conflict(self):
+        self.book(10)
+        appointment_id = self.book(11).data['id']
+        response = self.client.patch(
+            f'/api/appointments/{appointment_id}/', {'date': at(self.day, 10).isoformat()}, format='json'
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['error'], 'This time slot is already booked')
+        self.assertEqual(Appointment.objects.get(pk=appointment_id).date, at(self.day, 11))
+
+    def test_bookings_overlapping_the_old_grid_are_conflicts(self):
+        self.book(10)
+        moving = self.book(11).data['id']
+        # 45-minute slots from 9:00 put 9:45 over the 10:00-10:30 booking
+        self.doctor.slot_minutes = 45
+        self.doctor.save()
+        response = self.book(9, 45)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['error'], 'This time slot is already booked')
+        response = self.client.patch(
+            f'/api/appointments/{moving}/', {'date': at(self.day, 9, 45).isoformat()}, format='json'
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.book(12, 0).status_code, 201)
+
+    def test_cancelled_slot_can_be_rebooked(self):
+        self.book(10)
+        Appointment.objects.update(status='cancelled')
+        self.assertEqual(self.book(10).status_code, 201)
+
+    def test_off_grid_start_is_rejected(self):
+        response = self.book(10, 10)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date', response.data)
+
+    def test_new_appointment_view_conflict(self):
+        payload = {'doctor': self.doctor.id, 'date': self.day.isoformat(), 'time': '11:00'}
+        self.assertEqual(self.client.post('/api/appointments/new/', payload, format='json').status_code, 201)
+        self.assertEqual(self.client.post('/api/appointments/new/', payload, format='json').status_code, 409)
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    attempts = 200
+
+    def test_simultaneous_bookings_claim_slot_once(self):
+        doctor = make_doctor()
+        patients = [make_user(f'p{i}@example.com') for i in range(20)]
+        date = at(next_weekday(), 14).isoformat()
+        barrier = threading.Barrier(self.attempts)
+        statuses = []
+
+        def book(patient):
+            client = APIClient()
+            client.force_authenticate(patient)
+            barrier.wait()
+            try:
+                response = client.post('/api/appointments/', {'doctor': doctor.id, 'date': date}, format='json')
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=book, args=(patients[i % len(patients)],))
+            for i in range(self.attempts)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses.count(201), 1)
+        self.assertEqual(statuses.count(409), self.attempts - 1)
+        self.assertEqual(Appointment.objects.filter(doctor=doctor, status='scheduled').count(), 1)
+
+
+class SQLiteConcurrencyTests(TransactionTestCase):
+    writers = 64
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('exercises the SQLite configuration')
+
+    def test_connections_use_wal_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA mmap_size')
+            self.assertGreater(cursor.fetchone()[0], 0)
+
+    def test_simultaneous_writers_and_readers_never_see_locked_errors(self):
+        doctors = [make_doctor(f'doc{i}@example.com') for i in range(4)]
+        patients = [make_user(f'p{i}@example.com') for i in range(8)]
+        day = next_weekday()
+        slots = [(doctor, at(day, 9) + timedelta(minutes=30 * i)) for doctor in doctors for i in range(16)]
+        barrier = threading.Barrier(self.writers * 2)
+        statuses = []
+
+        def request(index, write):
+            client = APIClient()
+            client.force_authenticate(patients[index % len(patients)])
+            doctor, date = slots[index]
+            barrier.wait()
+            try:
+                if write:
+                    response = client.post('/api/appointments/', {'doctor': doctor.id, 'date': date.isoformat()}, format='json')
+                else:
+                    response = client.get('/api/appointments/available_slots/', {'doctor_id': doctor.id, 'date': day.isoformat()})
+                statuses.append((write, response.status_code))
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=request, args=(i, write))
+            for i in range(self.writers)
+            for write in (True, False)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(code for write, code in statuses if write), [201] * self.writers)
+        self.assertEqual(sorted(code for write, code in statuses if not write), [200] * self.writers)
+        self.assertEqual(Appointment.objects.filter(status='scheduled').count(), self.writers)
+
+
+class FlakyBackend(EmailBackend):
+    def send_messages(self, messages):
+        if any('bounce' in address for message in messages for address in message.to):
+            raise ConnectionError('mailbox unavailable')
+        return super().send_messages(messages)
+
+
+class OutboxTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.doctor = make_doctor()
+        self.client.force_authenticate(self.user)
+
+    def test_booking_queues_email_instead_of_sending(self):
+        response = self.client.post('/api/appointments/', {
+            'doctor': self.doctor.id,
+            'date': at(next_weekday(), 10).isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxEmail.objects.get().to, self.user.email)
+
+        call_command('send_outbox_emails', stdout=io.StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Appointment Confirmation')
+        self.assertEqual(OutboxEmail.objects.get().status, 'sent')
+
+    def test_failed_booking_queues_nothing(self):
+        date = at(next_weekday(), 10).isoformat()
+        self.client.post('/api/appointments/', {'doctor': self.doctor.id, 'date': date}, format='json')
+        self.client.post('/api/appointments/', {'doctor': self.doctor.id, 'date': date}, format='json')
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+    def test_drain_batches_and_backs_off_failures(self):
+        outbox.enqueue('Hello', 'Body', [f'p{i}@example.com' for i in range(5)] + ['bounce@example.com'])
+        sent, failed = outbox.drain(batch_size=2, connection=FlakyBackend())
+        self.assertEqual((sent, failed), (5, 1))
+
+        failure = OutboxEmail.objects.get(to='bounce@example.com')
+        self.assertEqual(failure.status, 'pending')
+        self.assertEqual(failure.attempts, 1)
+        self.assertGreater(failure.next_attempt_at, timezone.now())
+
+        # Not due yet, so a second pass sends nothing
+        self.assertEqual(outbox.drain(connection=FlakyBackend()), (0, 0))
+
+    def test_gives_up_after_max_attempts(self):
+        email, = outbox.enqueue('Hello', 'Body', ['bounce@example.com'])
+        for _ in range(outbox.MAX_ATTEMPTS):
+            OutboxEmail.objects.filter(id=email.id).update(next_attempt_at=timezone.now())
+            outbox.drain(connection=FlakyBackend())
+        email.refresh_from_db()
+        self.assertEqual(email.status, 'failed')
+        self.assertEqual(email.last_error, 'mailbox unavailable')
+
+
+class ReminderTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.tomorrow = timezone.localdate() + timedelta(days=1)
+        self.patients = [make_user(f'p{i}@example.com') for i in range(7)]
+        for i, patient in enumerate(self.patients):
+            Appointment.objects.create(patient=patient, doctor=self.doctor, date=at(self.tomorrow, 9, i))
+        Appointment.objects.create(
+            patient=self.patients[0], doctor=self.doctor, date=at(self.tomorrow, 16), status='cancelled'
+        )
+
+    def test_streams_with_constant_queries_and_is_idempotent(self):
+        # One SELECT plus one UPDATE per batch of three
+        with self.assertNumQueries(4):
+            stats = reminders.send_reminders(batch_size=3)
+        self.assertEqual(stats['appointments'], 7)
+        self.assertEqual(stats['emails'], 7)
+        self.assertEqual(len(mail.outbox), 7)
+        self.assertEqual(
+            {message.to[0] for message in mail.outbox},
+            {patient.email for patient in self.patients},
+        )
+        self.assertIn('Dr. House', mail.outbox[0].body)
+
+        out = io.StringIO()
+        call_command('send_appointment_reminders', stdout=out)
+        self.assertEqual(len(mail.outbox), 7)
+        self.assertIn('Sent 0 reminders for 0 appointments', out.getvalue())
+        self.assertIn('emails/sec', out.getvalue())
+
+    def test_failed_batch_is_retried_on_rerun(self):
+        Appointment.objects.filter(patient=self.patients[0]).update(
+            patient=make_user('bounce@example.com')
+        )
+        stats = reminders.send_reminders(batch_size=100, connection=FlakyBackend())
+        self.assertEqual((stats['emails'], stats['failed_batches']), (0, 1))
+        self.assertFalse(Appointment.objects.exclude(reminder_sent_at=None).exists())
+
+        stats = reminders.send_reminders(batch_size=100)
+        self.assertEqual(stats['emails'], 7)
+
+
+class CleanupCommandTests(TestCase):
+    def setUp(self):
+        self.patient = make_user()
+        self.doctor = make_doctor()
+        self.day = next_weekday()
+
+    def test_removes_duplicates_in_batches_keeping_oldest(self):
+        groups = []
+        for hour in (9, 10, 11):
+            rows = [
+                Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=at(self.day, hour), status='cancelled')
+                for _ in range(3)
+            ]
+            groups.append(rows[0].id)
+        unique = Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=at(self.day, 12))
+
+        out = io.StringIO()
+        call_command('cleanup_duplicate_appointments', '--dry-run', stdout=out)
+        self.assertIn('Found 6 duplicate appointments', out.getvalue())
+        self.assertEqual(Appointment.objects.count(), 10)
+
+        out = io.StringIO()
+        call_command('cleanup_duplicate_appointments', '--batch-size', '4', stdout=out)
+        self.assertIn('Successfully removed 6 duplicate appointments', out.getvalue())
+        self.assertEqual(
+            set(Appointment.objects.values_list('id', flat=True)),
+            set(groups) | {unique.id},
+        )
+
+    def test_completes_past_appointments_with_bulk_updates(self):
+        past = timezone.now() - timedelta(days=3)
+        Appointment.objects.bulk_create([
+            Appointment(patient=self.patient, doctor=self.doctor, date=past + timedelta(minutes=i))
+            for i in range(5)
+        ])
+        future = Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=at(self.day, 9))
+
+        # One duplicate delete, then per batch of 2 + 2 + 1 rows a savepoint-wrapped
+        # locked select, update, and daily stats read and write
+        with self.assertNumQueries(1 + 3 * 6):
+            call_command('cleanup_duplicate_appointments', '--batch-size', '2', stdout=io.StringIO())
+        self.assertEqual(Appointment.objects.filter(status='completed').count(), 5)
+        future.refresh_from_db()
+        self.assertEqual(future.status, 'scheduled')
+
+
+class StatusTransitionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.patient = make_user()
+        self.doctor = make_doctor()
+        self.today = timezone.localdate()
+
+    def test_completes_expired_appointments_and_notifies(self):
+        now = at(self.today, 12)
+        for hour in (9, 10, 11, 12, 13):
+            booking.book(self.patient, self.doctor, at(self.today, hour))
+        self.assertEqual(availability.booked_minutes(self.doctor.id, self.today), (540, 600, 660, 720, 780))
+
+        received = []
+
+        def receive(rows, **kwargs):
+            received.append(len(rows))
+
+        transitions.appointments_completed.connect(receive)
+        self.addCleanup(transitions.appointments_completed.disconnect, receive)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(transitions.complete_past(now, batch_size=2), 3)
+        self.assertEqual(received, [2, 1])
+
+        self.assertEqual(
+            list(Appointment.objects.order_by('date').values_list('status', flat=True)),
+            ['completed'] * 3 + ['scheduled'] * 2,
+        )
+        self.assertEqual(availability.booked_minutes(self.doctor.id, self.today), (720, 780))
+        row = DailyStats.objects.get(doctor=self.doctor, day=self.today)
+        self.assertEqual((row.scheduled, row.completed), (2, 3))
+
+    def test_saving_a_past_appointment_keeps_its_status(self):
+        appointment = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, date=timezone.now() - timedelta(hours=2),
+        )
+        appointment.notes = 'Late'
+        appointment.save()
+        self.assertEqual(Appointment.objects.get().status, 'scheduled')
+
+        stop = threading.Event()
+        stop.set()
+        counts = []
+        transitions.run(stop=stop, report=counts.append)
+        self.assertEqual(counts, [1])
+        self.assertEqual(Appointment.objects.get().status, 'completed')
+
+
+class PaginationTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+
+    def collect(self, url, params):
+        response = self.client.get(url, params)
+        pages = [response.data]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(response.data)
+        return pages
+
+    def test_appointments_walk_newest_first_with_id_tiebreak(self):
+        doctors = [make_doctor(f'd{i}@example.com') for i in range(5)]
+        day = next_weekday()
+        Appointment.objects.bulk_create([
+            Appointment(patient=self.user, doctor=doctor, date=at(day, hour))
+            for hour in (9, 10, 11, 12, 13)
+            for doctor in doctors
+        ])
+        pages = self.collect('/api/appointments/', {'page_size': 7})
+        self.assertEqual([len(page['results']) for page in pages], [7, 7, 7, 4])
+
+        rows = [(row['date'], row['id']) for page in pages for row in page['results']]
+        self.assertEqual(rows, sorted(rows, reverse=True))
+        self.assertEqual(len(set(rows)), 25)
+
+    def test_doctors_keyed_on_id_and_page_size_capped(self):
+        Doctor.objects.bulk_create([
+            Doctor(name=f'Doc {i}', specialization='GP', email=f'd{i}@example.com', phone='1')
+            for i in range(120)
+        ])
+        response = self.client.get('/api/doctors/', {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 100)
+        ids = [doctor['id'] for doctor in response.data['results']]
+        self.assertEqual(ids, sorted(ids))
+
+        pages = self.collect('/api/doctors/', {})
+        self.assertEqual(sum(len(page['results']) for page in pages), 120)
+
+
+class SparseFieldsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = make_user(
+            is_staff=True, first_name='Ada', last_name='Lovelace',
+            birthday=datetime(1990, 5, 1).date(), medical_history='x' * 5000,
+        )
+        User.objects.filter(pk=self.user.pk).update(avatar='avatars/ada.png')
+        make_user('other@example.com')
+        self.client.force_authenticate(self.user)
+        day = next_weekday()
+        doctors = [make_doctor(f'd{i}@example.com', name=f'Doc {i}') for i in range(3)]
+        Appointment.objects.bulk_create([
+            Appointment(patient=self.user, doctor=doctor, date=at(day, 9 + i), notes=f'note {i}')
+            for i, doctor in enumerate(doctors)
+        ])
+
+    def test_list_rows_match_the_serializer(self):
+        for url in ('/api/users/', '/api/appointments/', '/api/doctors/'):
+            with self.subTest(url=url):
+                rows = self.client.get(url).json()['results']
+                self.assertGreater(len(rows), 1)
+                for row in rows:
+                    self.assertEqual(row, self.client.get(f"{url}{row['id']}/").json())
+
+    def test_fields_and_omit_select_the_columns_loaded(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/', {'omit': 'medical_history,avatar_thumbnails'})
+        self.assertNotIn('medical_history', response.json()['results'][0])
+        self.assertIn('avatar', response.json()['results'][0])
+        self.assertNotIn('medical_history', queries.captured_queries[-1]['sql'])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/appointments/', {'fields': 'id,doctor_name,date', 'page_size': 2})
+        page = response.json()
+        self.assertEqual([list(row) for row in page['results']], [['id', 'doctor_name', 'date']] * 2)
+        self.assertNotIn('notes', queries.captured_queries[-1]['sql'])
+        # The cursor still walks on the unselected ordering columns
+        self.assertEqual(len(self.client.get(page['next']).json()['results']), 1)
+
+        response = self.client.get(f"/api/appointments/{page['results'][0]['id']}/", {'omit': 'notes'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('notes', response.json())
+
+    def test_cached_doctor_detail_is_kept_per_selection(self):
+        doctor = Doctor.objects.first()
+        self.client.get(f'/api/doctors/{doctor.id}/')
+        response = self.client.get(f'/api/doctors/{doctor.id}/', {'fields': 'name'})
+        self.assertEqual(response.json(), {'name': doctor.name})
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/doctors/', {'fields': 'id,salary'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('salary', response.json()['error'])
+
+
+class QueryBudgetTests(APITestCase):
+    """
+    Maximum queries per endpoint. Each budget is checked with one and with many
+    rows, so a lazy relation that turns into N+1 queries fails here.
+    """
+    budgets = [
+        ('get', '/api/appointments/', 1),
+        ('get', '/api/appointments/{appointment}/', 1),
+        ('get', '/api/appointments/available_slots/?doctor_id={doctor}&date={day}', 3),
+        ('get', '/api/appointments/availability/?start={day}&end={day}', 3),
+        ('get', '/api/doctors/', 1),
+        ('get', '/api/users/', 1),
+        ('post', '/api/appointments/{appointment}/cancel/', 6),
+    ]
+
+    def setUp(self):
+        self.user = make_user(is_staff=True)
+        self.day = next_weekday()
+        self.client.force_authenticate(self.user)
+
+    def seed(self, rows):
+        doctors = [make_doctor(f'doc{i}@example.com') for i in range(rows)]
+        others = [make_user(f'other{i}@example.com') for i in range(rows)]
+        Appointment.objects.bulk_create(
+            [Appointment(patient=self.user, doctor=doctor, date=at(self.day, 10)) for doctor in doctors]
+            + [Appointment(patient=other, doctor=doctor, date=at(self.day, 11)) for other, doctor in zip(others, doctors)]
+        )
+        stats.rebuild()
+        self.doctor = doctors[0]
+
+    def assertQueryBudgets(self):
+        for method, url, budget in self.budgets:
+            cache.clear()
+            appointment = Appointment.objects.filter(patient=self.user, status='scheduled').first()
+            url = url.format(appointment=appointment.id, doctor=self.doctor.id, day=self.day)
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                response = getattr(self.client, method)(url)
+                self.assertLess(response.status_code, 400)
+                self.assertLessEqual(
+                    len(queries), budget,
+                    '\n'.join(query['sql'] for query in queries.captured_queries),
+                )
+
+    def test_budgets_with_one_row(self):
+        self.seed(1)
+        self.assertQueryBudgets()
+
+    def test_budgets_with_many_rows(self):
+        self.seed(30)
+        self.assertQueryBudgets()
+
+
+class DoctorDirectoryCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        treat_cache_as_shared(self)
+        self.doctor = make_doctor()
+        self.client.force_authenticate(make_user())
+
+    def test_list_and_detail_are_served_from_cache(self):
+        first = self.client.get('/api/doctors/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/doctors/')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+        self.assertEqual(self.client.get(f'/api/doctors/{self.doctor.id}/').status_code, 200)
+        with self.assertNumQueries(0):
+            detail = self.client.get(f'/api/doctors/{self.doctor.id}/')
+        self.assertEqual(detail.data['name'], 'House')
+
+    def test_if_none_match_returns_304_until_directory_changes(self):
+        etag = self.client.get('/api/doctors/')['ETag']
+        response = self.client.get('/api/doctors/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_doctor('new@example.com', name='Grey')
+        response = self.client.get('/api/doctors/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_new_appointment_form_reuses_directory(self):
+        self.client.get('/api/appointments/new/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.name = 'Wilson'
+            self.doctor.save()
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/appointments/new/')
+        self.assertEqual(response.data['doctors'][0]['name'], 'Wilson')
+        with self.assertNumQueries(0):
+            self.client.get('/api/appointments/new/')
+
+    def test_missing_doctor_is_404(self):
+        self.assertEqual(self.client.get('/api/doctors/999/').status_code, 404)
+
+
+class ConditionalAppointmentListTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        treat_cache_as_shared(self)
+        self.user = make_user()
+        self.doctor = make_doctor()
+        self.day = next_weekday()
+        self.client.force_authenticate(self.user)
+
+    def book(self, patient, hour):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Appointment.objects.create(patient=patient, doctor=self.doctor, date=at(self.day, hour))
+
+    def test_unchanged_list_is_304_without_queries(self):
+        self.book(self.user, 10)
+        response = self.client.get('/api/appointments/')
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        with self.assertNumQueries(0):
+            again = self.client.get('/api/appointments/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], response['ETag'])
+        self.assertEqual(
+            self.client.get('/api/appointments/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+
+    def test_version_follows_the_patients_appointments(self):
+        appointment = self.book(self.user, 10)
+        etag = self.client.get('/api/appointments/')['ETag']
+
+        # Other patients' bookings leave the list alone
+        self.book(make_user('other@example.com'), 11)
+        response = self.client.get('/api/appointments/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/appointments/{appointment.id}/cancel/')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/api/appointments/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['status'], 'cancelled')
+
+        etag = response['ETag']
+        self.book(self.user, 12)
+        with self.captureOnCommitCallbacks(execute=True):
+            transitions.complete_past(now=at(self.day, 13))
+        self.assertEqual(self.client.get('/api/appointments/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_second_change_within_a_second_is_not_304_on_if_modified_since(self):
+        with mock.patch('appointments.caching.time.time', return_value=1_800_000_000.2):
+            self.book(self.user, 10)
+            modified = self.client.get('/api/appointments/')['Last-Modified']
+            self.book(self.user, 11)
+            response = self.client.get('/api/appointments/', HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(
+            self.client.get('/api/appointments/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+
+    def test_doctor_rename_changes_every_list(self):
+        self.book(self.user, 10)
+        etag = self.client.get('/api/appointments/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.name = 'Wilson'
+            self.doctor.save()
+        response = self.client.get('/api/appointments/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['doctor_name'], 'Wilson')
+
+    def test_process_local_cache_sends_no_validators(self):
+        self.book(self.user, 10)
+        etag = self.client.get('/api/appointments/')['ETag']
+        # Bumps made by other workers would never reach these counters
+        with mock.patch.object(caching, 'process_local', return_value=True):
+            response = self.client.get('/api/appointments/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+
+class CompressionTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        treat_cache_as_shared(self)
+        Doctor.objects.bulk_create([
+            Doctor(name=f'Doc {i}', specialization='GP', email=f'd{i}@example.com', phone='1')
+            for i in range(50)
+        ])
+
+    def test_large_responses_are_gzipped_when_accepted(self):
+        plain = self.client.get('/api/doctors/')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        response = self.client.get('/api/doctors/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content)), plain.json())
+        # A weakened ETag still revalidates
+        self.assertEqual(
+            self.client.get('/api/doctors/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304
+        )
+
+    def test_small_responses_are_sent_as_is(self):
+        response = self.client.get('/api/doctors/', {'page_size': 1}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    @skipUnless(compression.brotli, 'brotli is not installed')
+    def test_brotli_is_preferred_when_accepted(self):
+        response = self.client.get('/api/doctors/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(json.loads(compression.brotli.decompress(response.content)), self.client.get('/api/doctors/').json())
+
+
+class DoctorSearchTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.house = make_doctor(name='Gregory House', specialization='Diagnostics')
+        self.garcia = make_doctor('jose@example.com', name='José García', specialization='Cardiology')
+        self.cuddy = make_doctor('cuddy@example.com', name='Lisa Cuddy', specialization='Cardiology')
+
+    def names(self, **params):
+        response = self.client.get('/api/doctors/', params)
+        self.assertEqual(response.status_code, 200)
+        return [doctor['name'] for doctor in response.data['results']]
+
+    def test_matches_word_prefixes_ignoring_case_and_accents(self):
+        self.assertEqual(self.names(q='garc'), ['José García'])
+        self.assertEqual(self.names(q='JOSE gar'), ['José García'])
+        self.assertEqual(self.names(q='greg hou'), ['Gregory House'])
+        self.assertEqual(self.names(q='cardio'), ['José García', 'Lisa Cuddy'])
+        self.assertEqual(self.names(q='cardio lisa'), ['Lisa Cuddy'])
+        self.assertEqual(self.names(q='zzz'), [])
+
+    def test_misspelled_word_falls_back_to_trigrams(self):
+        self.assertEqual(self.names(q='housse'), ['Gregory House'])
+        self.assertEqual(self.names(q='gregory cudy'), [])
+        self.assertEqual(self.names(q='lisa cuddi'), ['Lisa Cuddy'])
+        self.assertEqual(self.names(q='xq'), [])
+
+    def test_renamed_doctor_is_reindexed(self):
+        self.garcia.name = 'James Wilson'
+        self.garcia.save()
+        self.assertEqual(self.names(q='wil'), ['James Wilson'])
+        self.assertEqual(self.names(q='garcia'), [])
+
+        search.reindex()
+        self.assertEqual(self.names(q='wilson'), ['James Wilson'])
+
+    def test_specialization_filter_and_facets(self):
+        self.assertEqual(self.names(specialization='Cardiology', q='l'), ['Lisa Cuddy'])
+        # The facet counts ignore the selected specialization
+        response = self.client.get('/api/doctors/facets/', {'specialization': 'Cardiology'})
+        self.assertEqual(list(response.data), [
+            {'specialization': 'Cardiology', 'count': 2},
+            {'specialization': 'Diagnostics', 'count': 1},
+        ])
+        response = self.client.get('/api/doctors/facets/', {'q': 'lisa'})
+        self.assertEqual(list(response.data), [{'specialization': 'Cardiology', 'count': 1}])
+
+    def test_ordering_by_next_available(self):
+        # House is booked solid for the whole look-ahead window
+        today = timezone.localdate()
+        patient = make_user()
+        schedule = schedules.for_doctor(self.house)
+        days = [today + timedelta(days=offset) for offset in range(search.RANK_DAYS)]
+        Appointment.objects.bulk_create(
+            Appointment(patient=patient, doctor=self.house, date=at(day, minutes // 60, minutes % 60))
+            for day in days
+            for minutes in schedule.starts(day)
+        )
+        response = self.client.get('/api/doctors/', {'ordering': 'next_available'})
+        results = response.data['results']
+        self.assertEqual([doctor['name'] for doctor in results], ['José García', 'Lisa Cuddy', 'Gregory House'])
+        self.assertIsNone(results[-1]['next_available'])
+        self.assertEqual(set(results[0]['next_available']), {'date', 'time'})
+        self.assertIsNone(response.data['next'])
+
+    def test_ranking_more_than_the_limit_asks_for_a_filter(self):
+        with mock.patch.object(search, 'RANK_LIMIT', 2):
+            response = self.client.get('/api/doctors/', {'ordering': 'next_available'})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('specialization', response.data['error'])
+            response = self.client.get('/api/doctors/', {'ordering': 'next_available', 'specialization': 'Cardiology'})
+        self.assertEqual(len(response.data['results']), 2)
+
+
+class TokenCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.user = make_user(first_name='Ada')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_repeat_requests_skip_token_lookup(self):
+        self.assertEqual(self.client.get('/api/profile/').status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/profile/')
+        self.assertEqual(response.data['first_name'], 'Ada')
+        stats = token_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_shared_tier_fills_empty_process_cache(self):
+        self.client.get('/api/profile/')
+        token_cache.clear()
+        with self.assertNumQueries(0):
+            self.client.get('/api/profile/')
+        self.assertEqual(token_cache.stats()['shared_hits'], 1)
+
+    def test_logout_invalidates_token(self):
+        self.client.get('/api/profile/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/api/logout/').status_code, 200)
+        self.assertEqual(self.client.get('/api/profile/').status_code, 401)
+
+    def test_deactivation_and_profile_changes_invalidate(self):
+        self.client.get('/api/profile/')
+        self.user.first_name = 'Grace'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get('/api/profile/').data['first_name'], 'Grace')
+
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get('/api/profile/').status_code, 401)
+
+    def test_evictions_reach_other_processes_local_tier(self):
+        other = type(token_cache)(max_size=10, ttl=60, shared_ttl=60, check_interval=0)
+        self.assertIsNone(other.get(self.token.key))
+        other.set(self.token.key, self.user)
+        # Evicted by another worker: the shared entry goes, and the generation moves
+        token_cache.evict(self.token.key)
+        self.assertIsNone(other.get(self.token.key))
+
+    def test_evictions_wait_for_the_commit(self):
+        self.client.get('/api/profile/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Grace'
+            self.user.save()
+            self.assertIsNotNone(token_cache.get(self.token.key))
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    def test_cached_user_is_copied_and_rechecked(self):
+        self.client.get('/api/profile/')
+        first = token_cache.get(self.token.key)
+        first.first_name = 'Unsaved'
+        self.assertEqual(token_cache.get(self.token.key).first_name, 'Ada')
+        self.assertEqual(self.client.get('/api/profile/').data['first_name'], 'Ada')
+
+        # Cache hits are held to the same is_active rule as the database path
+        self.user.is_active = False
+        token_cache.set(self.token.key, self.user)
+        self.assertEqual(self.client.get('/api/profile/').status_code, 401)
+
+    def test_profile_update_writes_only_submitted_fields(self):
+        self.client.get('/api/profile/')
+        # The avatar worker saved a new avatar after the token cache copied the user
+        User.objects.filter(pk=self.user.pk).update(avatar='avatars/new.png')
+        response = self.client.patch('/api/profile/', {'first_name': 'Grace'}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['avatar'].endswith('avatars/new.png'))
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.first_name, self.user.avatar.name), ('Grace', 'avatars/new.png'))
+
+    def test_lru_bound(self):
+        small = type(token_cache)(max_size=2, ttl=60, shared_ttl=60, check_interval=1)
+        for key in ('a', 'b', 'c'):
+            small.set(key, self.user)
+        self.assertEqual(small.stats()['size'], 2)
+
+    def test_stats_endpoint_is_admin_only(self):
+        self.assertEqual(self.client.get('/api/auth/cache-stats/').status_code, 403)
+        self.user.is_staff = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        response = self.client.get('/api/auth/cache-stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hit_rate', response.data)
+
+
+class UsernameAllocationTests(APITestCase):
+    def register(self, email):
+        return self.client.post('/api/register/', {
+            'email': email,
+            'password': 'a-long-password-123',
+            'first_name': 'John',
+            'last_name': 'Doe',
+        }, format='json')
+
+    def test_next_username_uses_one_query(self):
+        self.assertEqual(User.objects.next_username('john'), 'john')
+        for name in ('john', 'john1', 'john2', 'john9', 'john10', 'johnny', 'john05', 'john3x'):
+            make_user(f'{name}@other.com', username=name)
+        with self.assertNumQueries(1):
+            self.assertEqual(User.objects.next_username('john'), 'john11')
+        self.assertEqual(User.objects.next_username('johnny'), 'johnny1')
+        self.assertEqual(User.objects.next_username('jo.n'), 'jo.n')
+
+    def test_registration_derives_username(self):
+        self.assertEqual(self.register('john@example.com').data['user']['username'], 'john')
+        self.assertEqual(self.register('john@example.org').data['user']['username'], 'john1')
+
+    def test_registration_retries_when_name_is_taken_concurrently(self):
+        make_user('john@other.com', username='john')
+        # The first allocation loses the race to a registration that already holds 'john'
+        with mock.patch.object(
+            type(User.objects), 'next_username', side_effect=['john', 'john1'], autospec=True
+        ):
+            response = self.register('john@example.com')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['user']['username'], 'john1')
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command('bench_username_allocation', '--count', '50', stdout=out)
+        self.assertIn('Registered 50 users', out.getvalue())
+        self.assertFalse(User.objects.exists())
+
+
+class BulkImportExportTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.admin = make_user('admin@example.com', is_staff=True)
+        self.patient = make_user()
+        self.doctor = make_doctor()
+        self.day = next_weekday()
+        self.client.force_authenticate(self.admin)
+
+    def test_command_imports_csv_in_chunks_without_email(self):
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=at(self.day, 9))
+        lines = ['patient_email,doctor,date,status,notes']
+        for hour in range(9, 15):
+            lines.append(f'{self.patient.email},{self.doctor.id},{at(self.day, hour).isoformat()},scheduled,hour {hour}')
+        lines.append(f'{self.patient.email},999,{at(self.day, 15).isoformat()},scheduled,')
+        lines.append(f'nobody@example.com,{self.doctor.id},{at(self.day, 16).isoformat()},,')
+        lines.append(f'{self.patient.email},{self.doctor.id},{at(self.day, 10).isoformat()},scheduled,twin')
+        lines.append(f'{self.patient.email},{self.doctor.id},yesterday,scheduled,')
+
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'import.csv')
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        out, err = io.StringIO(), io.StringIO()
+        # Per chunk: doctors, patients, booked slots, and a savepoint-wrapped
+        # insert plus the daily stats read and write; the first chunk also
+        # loads the doctor's schedule, which the second finds cached
+        with self.assertNumQueries(2 * 8 + 1):
+            call_command('import_appointments', path, '--chunk-size', '5', stdout=out, stderr=err)
+        self.assertIn('Imported 5 appointments, rejected 5', out.getvalue())
+        self.assertIn('doctor 999 does not exist', err.getvalue())
+        self.assertIn('slot is already booked', err.getvalue())
+        self.assertEqual(Appointment.objects.count(), 6)
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_patient_emails_match_case_insensitively(self):
+        self.patient.email = 'John.Smith@example.com'
+        self.patient.save()
+        report = bulk.import_appointments([
+            (2, {'patient_email': 'John.Smith@example.com', 'doctor': self.doctor.id, 'date': at(self.day, 9).isoformat()}),
+        ])
+        self.assertEqual((report.imported, report.rejected), (1, 0))
+        self.assertEqual(Appointment.objects.get().patient, self.patient)
+
+    def test_scheduled_rows_must_start_on_a_free_slot(self):
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=at(self.day, 10))
+        # An off-grid booking from before the slot rule still blocks the slots it overlaps
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=at(self.day, 13, 10))
+        row = lambda hour, minute=0, status='scheduled': {
+            'patient': self.patient.id, 'doctor': self.doctor.id,
+            'date': at(self.day, hour, minute).isoformat(), 'status': status,
+        }
+        report = bulk.import_appointments(enumerate([
+            row(10, 10),
+            row(11),
+            row(11),
+            row(12, 10, 'completed'),
+            row(13),
+        ], start=2))
+        self.assertEqual((report.imported, report.rejected), (2, 3))
+        self.assertEqual(
+            [error['error'] for error in report.errors],
+            ["date is not one of the doctor's slots", 'slot is already booked', 'slot is already booked'],
+        )
+
+    def test_api_imports_jsonl(self):
+        rows = [
+            {'patient': self.patient.id, 'doctor': self.doctor.id, 'date': at(self.day, 11).isoformat(), 'status': 'completed'},
+            {'patient': 12345, 'doctor': self.doctor.id, 'date': at(self.day, 12).isoformat()},
+        ]
+        upload = SimpleUploadedFile('rows.jsonl', ('\n'.join(json.dumps(row) for row in rows) + '\nnot json\n').encode())
+        response = self.client.post('/api/appointments/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['imported'], response.data['rejected']), (1, 2))
+        self.assertEqual(Appointment.objects.get().status, 'completed')
+
+    def test_import_requires_admin(self):
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.post('/api/appointments/import/').status_code, 403)
+        self.assertEqual(self.client.get('/api/appointments/export/').status_code, 403)
+
+    def test_export_streams_and_round_trips(self):
+        for hour in (9, 10, 11):
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=at(self.day, hour), notes='a, "quoted" note')
+
+        response = self.client.get('/api/appointments/export/', {'type': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content).decode()
+        records = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[0]['notes'], 'a, "quoted" note')
+        self.assertEqual(records[0]['patient_email'], self.patient.email)
+
+        response = self.client.get('/api/appointments/export/', {'type': 'jsonl'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(json.loads(lines[0])['doctor_name'], 'House')
+
+        # The export can be fed back in; every slot is already taken
+        report = bulk.import_appointments(bulk.read_rows(io.StringIO(body), 'csv'))
+        self.assertEqual((report.imported, report.rejected), (0, 3))
+
+
+class DailyStatsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.admin = make_user('admin@example.com', is_staff=True)
+        self.patient = make_user()
+        self.doctor = make_doctor()
+        self.other = make_doctor('other@example.com', specialization='Cardiology')
+        self.day = next_weekday()
+        self.client.force_authenticate(self.admin)
+
+    def counts(self, doctor=None, day=None):
+        row = DailyStats.objects.filter(doctor=doctor or self.doctor, day=day or self.day).first()
+        return (row.scheduled, row.completed, row.cancelled) if row else None
+
+    def test_counts_follow_booking_cancel_move_and_delete(self):
+        first = booking.book(self.patient, self.doctor, at(self.day, 9))
+        booking.book(self.patient, self.doctor, at(self.day, 10))
+        self.assertEqual(self.counts(), (2, 0, 0))
+
+        booking.cancel(Appointment.objects.get(pk=first.pk))
+        self.assertEqual(self.counts(), (1, 0, 1))
+
+        moved = Appointment.objects.get(date=at(self.day, 10))
+        moved.doctor = self.other
+        moved.save()
+        self.assertEqual(self.counts(), (0, 0, 1))
+        self.assertEqual(self.counts(self.other), (1, 0, 0))
+
+        moved.delete()
+        self.assertEqual(self.counts(self.other), (0, 0, 0))
+        # Saving with nothing counted changed writes no stats
+        first.notes = 'Rescheduled by phone'
+        with self.assertNumQueries(1):
+            first.save(update_fields=['notes'])
+
+        incremental = set(DailyStats.objects.values_list('doctor_id', 'day', 'scheduled', 'completed', 'cancelled'))
+        stats.rebuild()
+        rebuilt = set(DailyStats.objects.values_list('doctor_id', 'day', 'scheduled', 'completed', 'cancelled'))
+        self.assertEqual({row for row in incremental if any(row[2:])}, rebuilt)
+
+    def test_bulk_writes_update_counts(self):
+        past = timezone.now() - timedelta(days=3)
+        Appointment.objects.bulk_create([
+            Appointment(patient=self.patient, doctor=self.doctor, date=past + timedelta(minutes=30 * i)) for i in range(3)
+        ])
+        stats.rebuild()
+        call_command('cleanup_duplicate_appointments', stdout=io.StringIO())
+        self.assertEqual(self.counts(day=timezone.localdate(past)), (0, 3, 0))
+
+        rows = bulk.read_rows(io.StringIO(
+            f'patient_email,doctor,date\n{self.patient.email},{self.doctor.id},{at(self.day, 9).isoformat()}\n'
+        ), 'csv')
+        bulk.import_appointments(rows)
+        self.assertEqual(self.counts(), (1, 0, 0))
+
+        DailyStats.objects.all().delete()
+        out = io.StringIO()
+        call_command('rebuild_daily_stats', '--start', self.day.isoformat(), stdout=out)
+        self.assertIn('Rebuilt 1 daily statistics rows', out.getvalue())
+        self.assertEqual(self.counts(), (1, 0, 0))
+        self.assertIsNone(self.counts(day=timezone.localdate(past)))
+
+    def test_dashboard_endpoints_read_only_the_rollup(self):
+        for hour in (9, 10, 11, 12):
+            booking.book(self.patient, self.doctor, at(self.day, hour))
+        booking.cancel(Appointment.objects.get(date=at(self.day, 12)))
+        booking.book(self.patient, self.other, at(self.day, 9))
+        end = self.day + timedelta(days=1)
+        params = {'start': self.day.isoformat(), 'end': end.isoformat()}
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/stats/days/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('appointments_appointment' in query['sql'] for query in queries.captured_queries))
+        day = response.data['days'][0]
+        self.assertEqual((day['scheduled'], day['cancelled'], day['capacity']), (4, 1, 32))
+        self.assertEqual((day['utilization'], day['cancellation_rate']), (12.5, 20.0))
+
+        response = self.client.get('/api/stats/doctors/', {**params, 'specialization': 'Diagnostics'})
+        self.assertEqual(response.status_code, 200)
+        [doctor] = response.data['results']
+        self.assertEqual(doctor['id'], self.doctor.id)
+        # Three of the 16 slots each day, over two days
+        self.assertEqual((doctor['scheduled'], doctor['capacity'], doctor['utilization']), (3, 32, 9.4))
+
+        self.assertEqual(self.client.get('/api/stats/days/', {'start': 'today'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/stats/days/', {**params, 'end': '2000-01-01'}).status_code, 400)
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.get('/api/stats/days/', params).status_code, 403)
+
+
+class ScheduleTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.admin = make_user('admin@example.com', is_staff=True)
+        self.doctor = make_doctor()
+        self.day = next_weekday()
+        self.client.force_authenticate(self.admin)
+
+    def add(self, **fields):
+        fields.setdefault('doctor', self.doctor)
+        with self.captureOnCommitCallbacks(execute=True):
+            return ScheduleEntry.objects.create(**fields)
+
+    def working(self, day=None):
+        return schedules.for_doctor(self.doctor).working(day or self.day)
+
+    def test_interval_arithmetic(self):
+        self.assertEqual(schedules.merge([(60, 90), (0, 30), (30, 45), (80, 120)]), [(0, 45), (60, 120)])
+        self.assertEqual(schedules.subtract([(0, 100), (200, 300)], [(50, 60), (90, 210)]), [(0, 50), (60, 90), (210, 300)])
+        doctor = Doctor(slot_minutes=30, work_start=time(9), work_end=time(11))
+        slots = schedules.Schedule(doctor, []).slots(self.day, booked=(9 * 60 + 45, 10 * 60 + 30))
+        self.assertEqual(slots, [(540, True), (570, False), (600, False), (630, False)])
+
+    def test_weekdays_by_default(self):
+        self.assertEqual(self.working(), [(9 * 60, 17 * 60)])
+        saturday = self.day + timedelta(days=5 - self.day.weekday())
+        self.assertEqual(self.working(saturday), [])
+
+    def test_weekly_split_shift_with_extra_hours_and_leave(self):
+        weekday = self.day.weekday()
+        self.add(kind='weekly', weekday=weekday, start_time=time(8), end_time=time(12))
+        self.add(kind='weekly', weekday=weekday, start_time=time(13), end_time=time(16))
+        self.add(kind='extra', start_date=self.day, end_date=self.day, start_time=time(12), end_time=time(13))
+        self.add(kind='leave', start_date=self.day, end_date=self.day, start_time=time(14), end_time=time(15))
+        self.assertEqual(self.working(), [(8 * 60, 14 * 60), (15 * 60, 16 * 60)])
+        # Weekly entries replace the default days, so other weekdays are off
+        self.assertEqual(self.working(self.day + timedelta(days=1)), [])
+
+    def test_clinic_wide_leave_blocks_booking(self):
+        self.add(doctor=None, kind='leave', start_date=self.day, end_date=self.day, note='Holiday')
+        self.assertEqual(self.working(), [])
+        self.client.force_authenticate(make_user())
+        response = self.client.post('/api/appointments/', {'doctor': self.doctor.id, 'date': at(self.day, 10).isoformat()})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/appointments/available_slots/', {
+            'doctor_id': self.doctor.id, 'date': self.day.isoformat(),
+        })
+        self.assertEqual(response.data, [])
+
+    def test_entries_are_cached_until_changed(self):
+        other = make_doctor('other@example.com')
+        with self.assertNumQueries(1):
+            schedules.load([self.doctor, other])
+        with self.assertNumQueries(0):
+            schedules.load([self.doctor, other])
+        self.add(kind='leave', start_date=self.day, end_date=self.day)
+        self.assertEqual(self.working(), [])
+
+    def test_schedule_endpoint(self):
+        self.add(kind='leave', start_date=self.day, end_date=self.day, start_time=time(12), end_time=time(13))
+        response = self.client.get(f'/api/doctors/{self.doctor.id}/schedule/', {
+            'start': self.day.isoformat(), 'end': (self.day + timedelta(days=1)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['slot_minutes'], 30)
+        self.assertEqual(response.data['days'][self.day.isoformat()], [
+            {'start': '09:00', 'end': '12:00'}, {'start': '13:00', 'end': '17:00'},
+        ])
+        response = self.client.get(f'/api/doctors/{self.doctor.id}/schedule/', {'start': 'soon'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_admin_manages_entries(self):
+        response = self.client.post('/api/schedule-entries/', {
+            'doctor': self.doctor.id, 'kind': 'weekly', 'weekday': 2, 'start_time': '10:00', 'end_time': '09:00',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('end_time', response.data)
+        response = self.client.post('/api/schedule-entries/', {'kind': 'extra', 'start_date': self.day, 'end_date': self.day})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/schedule-entries/', {
+            'doctor': self.doctor.id, 'kind': 'weekly', 'weekday': 2, 'start_time': '09:00', 'end_time': '13:00',
+        })
+        self.assertEqual(response.status_code, 201)
+
+        self.client.force_authenticate(make_user())
+        self.assertEqual(self.client.get('/api/schedule-entries/').status_code, 403)
+
+
+def image_upload(name='avatar.png', size=(600, 400), color='teal'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class AvatarTests(APITestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        overrides = override_settings(MEDIA_ROOT=self.media.name, AVATAR_PROCESS_SYNC=True)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, upload=None):
+        return self.client.post('/api/profile/', {'avatar': upload or image_upload()}, format='multipart')
+
+    def test_upload_stores_square_thumbnails(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertRegex(self.user.avatar.name, avatars.NAME_RE)
+        self.assertEqual(set(response.data['avatar_thumbnails']), {'64', '256'})
+        for size, name in avatars.thumbnail_names(self.user.avatar.name).items():
+            with Image.open(os.path.join(self.media.name, name)) as image:
+                self.assertEqual(image.size, (size, size))
+            self.assertTrue(response.data['avatar_thumbnails'][str(size)].endswith(name))
+
+    def test_identical_uploads_share_files(self):
+        self.upload()
+        other = make_user('other@example.com')
+        self.client.force_authenticate(other)
+        self.upload(image_upload('copy.png'))
+        other.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(other.avatar.name, self.user.avatar.name)
+        shard = os.path.dirname(os.path.join(self.media.name, self.user.avatar.name))
+        self.assertEqual(len(os.listdir(shard)), len(avatars.SIZES))
+
+    def test_replaces_legacy_upload(self):
+        legacy = os.path.join(self.media.name, 'avatars', f'user_{self.user.id}_old.png')
+        os.makedirs(os.path.dirname(legacy))
+        Image.new('RGB', (10, 10)).save(legacy)
+        self.user.avatar = f'avatars/user_{self.user.id}_old.png'
+        self.user.save()
+        self.assertEqual(self.client.get('/api/profile/').data['avatar_thumbnails'], {})
+
+        self.upload()
+        self.assertFalse(os.path.exists(legacy))
+
+    def test_rejects_invalid_images(self):
+        fake = SimpleUploadedFile('fake.png', b'not really a png', content_type='image/png')
+        self.assertEqual(self.upload(fake).status_code, 400)
+        pdf = SimpleUploadedFile('doc.pdf', b'%PDF-1.4', content_type='application/pdf')
+        self.assertEqual(self.upload(pdf).status_code, 400)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.avatar)
+
+    def test_rejects_decompression_bombs(self):
+        # Pillow raises past twice MAX_IMAGE_PIXELS; 600x400 is well past 2 * 1000
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            response = self.upload()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('too many pixels', response.data['error'])
+        self.assertEqual(os.listdir(self.media.name), [])
+
+    def test_viewset_action_uses_pipeline(self):
+        response = self.client.post(f'/api/users/{self.user.id}/avatar/', {'avatar': image_upload()}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response.data['avatar'], avatars.NAME_RE.pattern.strip('^$'))
+
+    def test_background_processing_returns_accepted(self):
+        with override_settings(AVATAR_PROCESS_SYNC=False), \
+                mock.patch.object(avatars, '_pool') as pool:
+            pool.return_value.submit.return_value.done.return_value = False
+            response = self.upload()
+        self.assertEqual(response.status_code, 202)
+        job, user_id, path, digest = pool.return_value.submit.call_args.args
+        self.assertEqual(user_id, self.user.id)
+        self.assertEqual(avatars.process(user_id, path, digest), avatars.thumbnail_name(digest, avatars.SIZES[-1]))
+        self.assertFalse(os.path.exists(path))
+
+    def test_thumbnails_are_served_immutable(self):
+        from backend.urls import serve_avatar
+        self.upload()
+        self.user.refresh_from_db()
+        request = RequestFactory().get('/media/' + self.user.avatar.name)
+        response = serve_avatar(request, self.user.avatar.name, document_root=self.media.name)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+
+class MetricsTests(APITestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        metrics.traces.clear()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+
+    def scrape(self):
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_records_requests_queries_and_render_time(self):
+        Appointment.objects.create(patient=self.user, doctor=make_doctor(), date=at(next_weekday(), 10))
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/appointments/').status_code, 200)
+
+        samples = self.scrape()
+        labels = 'route="appointment-list",method="GET"'
+        self.assertEqual(samples[f'http_requests_total{{{labels},status="200"}}'], 2)
+        self.assertEqual(samples[f'http_request_duration_seconds_count{{{labels}}}'], 2)
+        self.assertEqual(samples[f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}}'], 2)
+        self.assertGreaterEqual(samples[f'db_queries_total{{{labels}}}'], 2)
+        self.assertEqual(samples[f'serialization_duration_seconds_count{{{labels}}}'], 2)
+        self.assertIn('token_cache_lookups_total{result="miss"}', samples)
+
+    def test_sampled_requests_keep_their_sql(self):
+        with mock.patch.object(metrics, 'TRACE_SAMPLE_RATE', 1):
+            self.client.get('/api/doctors/')
+        trace = metrics.traces[-1]
+        self.assertEqual(trace['route'], 'doctor-list')
+        self.assertIn('appointments_doctor', trace['queries'][0]['sql'])
+
+        self.assertEqual(self.client.get('/api/metrics/traces/').status_code, 403)
+        self.client.force_authenticate(make_user('admin@example.com', is_staff=True))
+        self.assertEqual(self.client.get('/api/metrics/traces/').data[0]['route'], 'doctor-list')
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token_protects_scrapes(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_counters_from_all_threads_are_summed(self):
+        def work():
+            for _ in range(100):
+                metrics.registry.inc('http_requests_total', (('route', 'x'),))
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counters, _ = metrics.registry.collect()
+        self.assertEqual(counters[('http_requests_total', (('route', 'x'),))], 400)
+
+    def test_outbox_records_email_sends(self):
+        outbox.enqueue('Hi', 'Body', ['a@example.com', 'b@example.com'])
+        outbox.drain()
+        samples = self.scrape()
+        self.assertEqual(samples['emails_sent_total{result="sent"}'], 2)
+        self.assertEqual(samples['email_send_duration_seconds_count'], 1)
+
+
+class BenchmarkTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.dataset = benchmark.Dataset(seed=7, doctors=3, patients=10, appointments=100)
+        self.dataset.generate()
+
+    def snapshot(self):
+        return list(Appointment.objects.order_by('doctor__email', 'date').values_list(
+            'doctor__email', 'patient__username', 'date', 'status',
+        ))
+
+    def test_generates_exact_deterministic_dataset(self):
+        self.assertTrue(self.dataset.is_loaded())
+        first = self.snapshot()
+        self.assertEqual(len(first), 100)
+        self.assertEqual(len({(doctor, date) for doctor, _, date, _ in first}), 100)
+
+        Appointment.objects.all().delete()
+        Doctor.objects.all().delete()
+        User.objects.all().delete()
+        benchmark.Dataset(seed=7, doctors=3, patients=10, appointments=100).generate()
+        self.assertEqual(self.snapshot(), first)
+
+    def test_kept_data_keeps_its_window(self):
+        later = self.dataset.start + timedelta(days=30)
+        with mock.patch('appointments.benchmark.timezone.localdate', return_value=later):
+            today = benchmark.Dataset(seed=7, doctors=3, patients=10, appointments=100)
+        # Same sizes, but a window around the later day is not what was generated
+        self.assertFalse(today.is_loaded())
+        kept = today.kept()
+        self.assertTrue(kept.is_loaded())
+        self.assertEqual(kept.workdays, self.dataset.workdays)
+        self.assertEqual(kept.end, self.dataset.end)
+
+    def test_scenarios_hit_the_api(self):
+        runner = benchmark.Runner(self.dataset, clients=3)
+        for scenario in benchmark.Runner.SCENARIOS:
+            result = runner.run(scenario, requests=5)
+            self.assertEqual(result['requests'], 5, scenario)
+            self.assertEqual(result['errors'], 0, scenario)
+            self.assertGreater(result['queries_per_request'], 0, scenario)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(Appointment.objects.filter(status='cancelled', date__gt=at(self.dataset.end, 0)).count(), 5)
+        runner.cleanup()
+        self.assertEqual(Appointment.objects.count(), 100)
+
+    def test_asgi_transport_uses_async_views(self):
+        runner = benchmark.Runner(self.dataset, clients=3)
+        for scenario in benchmark.Runner.ASYNC_SCENARIOS:
+            result = runner.run(scenario, requests=4, concurrency=2, transport='asgi')
+            self.assertEqual((result['requests'], result['errors']), (4, 0), scenario)
+            self.assertGreater(result['queries_per_request'], 0, scenario)
+        self.assertEqual(Appointment.objects.filter(status='cancelled', date__gt=at(self.dataset.end, 0)).count(), 4)
+        with self.assertRaises(ValueError):
+            runner.run('doctor_list', requests=1, transport='asgi')
+
+    def test_compare_flags_regressions(self):
+        baseline = {'scenarios': {'create@1': {
+            'p95_ms': 10.0, 'throughput_rps': 100.0, 'queries_per_request': 4.0, 'errors': 0,
+        }}}
+        same = {'scenarios': {'create@1': dict(baseline['scenarios']['create@1'], p95_ms=11.0)}}
+        self.assertEqual(benchmark.compare(same, baseline, tolerance=0.25), [])
+        worse = {'scenarios': {'create@1': dict(baseline['scenarios']['create@1'], p95_ms=20.0, queries_per_request=5.0)}}
+        self.assertEqual(len(benchmark.compare(worse, baseline, tolerance=0.25)), 2)
+
+
+class QueryPlanTests(APITestCase):
+    """
+    EXPLAIN every hot query as it is actually issued and check it is answered
+    from the index meant for it rather than a table scan.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = make_user()
+        self.doctor = make_doctor()
+        self.day = next_weekday()
+        Appointment.objects.create(patient=self.user, doctor=self.doctor, date=at(self.day, 10))
+        self.client.force_authenticate(self.user)
+
+    def plans(self, run, table='appointments_appointment'):
+        """Query plans of the statements ``run`` issues against ``table``."""
+        if connection.vendor != 'sqlite':
+            self.skipTest('plan assertions are written for SQLite')
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        plans = []
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if f'"{table}"' not in sql or not sql.startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plans.append(' | '.join(row[-1] for row in cursor.fetchall()))
+        self.assertTrue(plans, 'no matching query was issued')
+        return plans
+
+    def assertUsesIndex(self, run, *indexes):
+        plans = self.plans(run)
+        for plan in plans:
+            self.assertNotRegex(plan, r'SCAN appointments_appointment( |$)')
+        self.assertTrue(any(f'INDEX {index} ' in plan for plan in plans for index in indexes), plans)
+
+    def test_day_slots_use_scheduled_slot_index(self):
+        self.assertUsesIndex(
+            lambda: self.client.get('/api/appointments/available_slots/', {
+                'doctor_id': self.doctor.id, 'date': self.day.isoformat(),
+            }),
+            'unique_scheduled_doctor_slot',
+        )
+
+    def test_range_matrix_uses_scheduled_slot_index(self):
+        self.assertUsesIndex(
+            lambda: list(availability.range_matrix([self.doctor], self.day, self.day + timedelta(days=6))),
+            'unique_scheduled_doctor_slot', 'appt_status_date_idx',
+        )
+
+    def test_patient_list_uses_patient_date_index(self):
+        self.assertUsesIndex(lambda: self.client.get('/api/appointments/'), 'appt_patient_date_idx')
+
+    def test_reminders_use_status_date_index(self):
+        self.assertUsesIndex(lambda: reminders.send_reminders(self.day), 'appt_status_date_idx')
+
+    def test_closing_past_appointments_uses_status_date_index(self):
+        command = CleanupCommand(stdout=io.StringIO())
+        self.assertUsesIndex(
+            lambda: command.update_past_appointments(dry_run=False, batch_size=100),
+            'appt_status_date_idx',
+        )
+
+    def test_doctor_search_reads_term_index(self):
+        queryset = Doctor.objects.order_by('id')
+        for query in ('hou', 'housse'):
+            plans = self.plans(lambda: list(search.filter_doctors(queryset, query)[:20]), 'appointments_doctorsearchterm')
+            for plan in plans:
+                self.assertNotRegex(plan, r'SCAN (appointments_doctorsearchterm|U0)( |$)')
+                self.assertIn('COVERING INDEX', plan)
+
+
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        token_cache.clear()
+        self.user = make_user()
+        self.doctor = make_doctor()
+        self.day = next_weekday()
+        self.headers = {'Authorization': f'Token {Token.objects.create(user=self.user).key}'}
+
+    async def test_requires_token(self):
+        response = await self.async_client.get('/api/async/appointments/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+    async def test_book_then_cancel(self):
+        date = at(self.day, 11).isoformat()
+        response = await self.async_client.post(
+            '/api/async/appointments/', {'doctor': self.doctor.id, 'date': date},
+            content_type='application/json', headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 201)
+        appointment_id = response.json()['id']
+        self.assertEqual(response.json()['doctor_name'], 'House')
+        self.assertTrue(await OutboxEmail.objects.filter(subject='Appointment Confirmation').aexists())
+
+        again = await self.async_client.post(
+            '/api/async/appointments/', {'doctor': self.doctor.id, 'date': date},
+            content_type='application/json', headers=self.headers,
+        )
+        self.assertEqual(again.status_code, 409)
+
+        response = await self.async_client.post(f'/api/async/appointments/{appointment_id}/cancel/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await Appointment.objects.aget(pk=appointment_id)).status, 'cancelled')
+        response = await self.async_client.post(f'/api/async/appointments/{appointment_id}/cancel/', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_rejects_misaligned_and_past_dates(self):
+        for date, field in ((at(self.day, 11, 10), 'date'), (at(self.day - timedelta(days=28), 11), 'error')):
+            response = await self.async_client.post(
+                '/api/async/appointments/', {'doctor': self.doctor.id, 'date': date.isoformat()},
+                content_type='application/json', headers=self.headers,
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(field, response.json())
+
+    async def test_slots_match_sync_endpoint(self):
+        await Appointment.objects.acreate(patient=self.user, doctor=self.doctor, date=at(self.day, 10))
+        params = {'doctor_id': self.doctor.id, 'date': self.day.isoformat()}
+        response = await self.async_client.get('/api/async/appointments/available_slots/', params, headers=self.headers)
+        sync_response = await self.async_client.get('/api/appointments/available_slots/', params, headers=self.headers)
+        self.assertEqual(response.json(), sync_response.json())
+        self.assertFalse({slot['time']: slot['is_available'] for slot in response.json()}['10:00'])
+
+    def test_list_pages_like_sync_endpoint(self):
+        other = make_user('other@example.com')
+        Appointment.objects.bulk_create(
+            [Appointment(patient=self.user, doctor=self.doctor, date=at(self.day, 9) + timedelta(minutes=30 * i)) for i in range(7)]
+            + [Appointment(patient=other, doctor=self.doctor, date=at(self.day + timedelta(days=1), 9))]
+        )
+        rows = []
+        url = '/api/async/appointments/?page_size=3'
+        while url:
+            page = self.client.get(url, headers=self.headers).json()
+            rows.extend(page['results'])
+            url = page['next']
+        expected = self.client.get('/api/appointments/', {'page_size': 100}, headers=self.headers).json()['results']
+        self.assertEqual(rows, expected)
+        self.assertEqual(len(rows), 7)
+
+
+class SlotEventTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        token_cache.clear()
+        self.user = make_user()
+        self.doctor = make_doctor()
+        self.day = next_weekday()
+        self.channel = events.slot_channel(self.doctor.id, self.day)
+        self.headers = {'Authorization': f'Token {Token.objects.create(user=self.user).key}'}
+
+    def book(self, hour):
+        with self.captureOnCommitCallbacks(execute=True):
+            return booking.book(self.user, self.doctor, at(self.day, hour))
+
+    def cancel(self, appointment):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.cancel(appointment)
+
+    async def test_booking_and_cancel_publish_after_commit(self):
+        subscription = events.broker.subscribe(self.channel)
+        self.addCleanup(subscription.close)
+        appointment = await sync_to_async(self.book)(11)
+        taken = await subscription.get(1)
+        self.assertEqual(taken['type'], 'taken')
+        self.assertEqual(taken['data'], {
+            'doctor_id': self.doctor.id, 'date': self.day.isoformat(), 'time': '11:00', 'is_available': False,
+        })
+
+        await sync_to_async(self.cancel)(appointment)
+        freed = await subscription.get(1)
+        self.assertEqual((freed['type'], freed['data']['time']), ('freed', '11:00'))
+        self.assertIsNone(await subscription.get(0.01))
+
+    async def test_reports_slot_state_not_the_write(self):
+        # Cancelling a duplicate must not free a slot another booking still holds
+        kept = await sync_to_async(self.book)(10)
+        duplicate = await Appointment.objects.acreate(patient=self.user, doctor=self.doctor, date=kept.date, status='cancelled')
+        subscription = events.broker.subscribe(self.channel)
+        self.addCleanup(subscription.close)
+        await sync_to_async(self.cancel)(duplicate)
+        self.assertEqual((await subscription.get(1))['type'], 'taken')
+
+    def test_unwatched_channels_are_skipped(self):
+        self.assertFalse(events.broker.watched(self.channel))
+        with CaptureQueriesContext(connection) as queries:
+            events.publish_slot_change(self.doctor.id, at(self.day, 11))
+        self.assertEqual(len(queries), 0)
+
+    async def test_slow_stream_is_told_to_resync(self):
+        with mock.patch.object(events, 'QUEUE_SIZE', 2):
+            subscription = events.broker.subscribe(self.channel)
+        self.addCleanup(subscription.close)
+        for _ in range(3):
+            events.broker.publish(self.channel, {'type': 'taken', 'data': {}})
+        self.assertIs(await subscription.get(1), events.RESYNC)
+        self.assertIsNone(await subscription.get(0.01))
+
+    @mock.patch('appointments.async_views.SLOT_STREAM_ENABLED', True)
+    @mock.patch('appointments.async_views.SLOT_STREAM_SECONDS', 1)
+    async def test_stream_sends_snapshot_then_changes(self):
+        response = await self.async_client.get(
+            '/api/async/appointments/available_slots/stream/',
+            {'doctor_id': self.doctor.id, 'date': self.day.isoformat()},
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        try:
+            self.assertEqual(await anext(chunks), b'retry: 3000\n\n')
+            snapshot = (await anext(chunks)).decode()
+            self.assertTrue(snapshot.startswith('event: snapshot\ndata: '))
+            slots = json.loads(snapshot.split('data: ', 1)[1])
+            self.assertTrue(all(slot['is_available'] for slot in slots))
+
+            await sync_to_async(self.book)(9)
+            change = (await anext(chunks)).decode()
+            self.assertTrue(change.startswith('event: taken\n'))
+            self.assertEqual(json.loads(change.split('data: ', 1)[1])['time'], '09:00')
+            # The stream closes itself once its time is up
+            self.assertEqual([chunk async for chunk in chunks], [b': keep-alive\n\n'])
+        finally:
+            await chunks.aclose()
+        self.assertFalse(events.broker.watched(self.channel))
+
+    @mock.patch('appointments.async_views.SLOT_STREAM_ENABLED', True)
+    async def test_stream_requires_token_and_params(self):
+        url = '/api/async/appointments/available_slots/stream/'
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        self.assertEqual((await self.async_client.get(url, {'doctor_id': self.doctor.id}, headers=self.headers)).status_code, 400)
+
+    async def test_stream_is_off_unless_enabled(self):
+        # Under WSGI the stream would be buffered to its end, so it is opt-in
+        response = await self.async_client.get(
+            '/api/async/appointments/available_slots/stream/',
+            {'doctor_id': self.doctor.id, 'date': self.day.isoformat()},
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('poll', response.json()['error'])
@@ -0,0 +1,70 @@
+"""
+Time-based status changes, applied in bulk by a periodic job.
+
+A scheduled appointment becomes 'completed' once its start time has passed.
+Rather than saves comparing each row against the clock, the
+``complete_past_appointments`` command (one pass, or every interval with
+``--loop``) flips every expired row in batches through the (status, date)
+index and sends ``appointments_completed`` for each batch, so the
+availability cache, the daily stats and the slot streams follow.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Appointment
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, 'STATUS_TRANSITION_BATCH_SIZE', 1000)
+INTERVAL_SECONDS = getattr(settings, 'STATUS_TRANSITION_INTERVAL', 60)
+
+# Sent inside the transaction of each batch with rows=[(id, patient_id, doctor_id, date), ...]
+appointments_completed = Signal()
+
+
+def expired(now=None):
+    return Appointment.objects.filter(status='scheduled', date__lt=now or timezone.now()).order_by()
+
+
+def complete_past(now=None, batch_size=BATCH_SIZE):
+    """Mark every scheduled appointment that started before ``now`` completed; returns the count."""
+    now = now or timezone.now()
+    total = 0
+    while True:
+        with transaction.atomic():
+            # Rows a cancel is holding are left for the next run
+            batch = list(
+                expired(now).select_for_update(skip_locked=True)
+                .values_list('id', 'patient_id', 'doctor_id', 'date')[:batch_size]
+            )
+            if batch:
+                Appointment.objects.filter(id__in=[row[0] for row in batch]).update(status='completed')
+                appointments_completed.send(sender=Appointment, rows=batch)
+        total += len(batch)
+        if len(batch) < batch_size:
+            return total
+
+
+def run(interval=INTERVAL_SECONDS, batch_size=BATCH_SIZE, stop=None, report=None):
+    """
+    Complete expired appointments every ``interval`` seconds until ``stop``
+    (a threading.Event) is set. ``report`` is called with each run's count.
+    """
+    stop = stop or threading.Event()
+    while True:
+        try:
+            completed = complete_past(batch_size=batch_size)
+        except DatabaseError:
+            # Try again on the next tick rather than stopping the loop
+            logger.exception('Completing past appointments failed')
+        else:
+            if report:
+                report(completed)
+        if stop.wait(interval):
+            return
+
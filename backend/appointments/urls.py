@@ -1,13 +1,21 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import (
     UserViewSet,
     DoctorViewSet, 
     AppointmentViewSet,
+    ScheduleEntryViewSet,
+    DailyStatsViewSet,
     RegistrationView, 
     LoginView,
     LogoutView,
     UserProfileView,
+    AuthCacheStatsView,
+    MetricsView,
+    MetricsTracesView,
+    AppointmentImportView,
+    AppointmentExportView,
     NewDoctorView,
     NewAppointmentView
 )
@@ -16,15 +24,27 @@ router = DefaultRouter()
 router.register(r'users', UserViewSet)
 router.register(r'doctors', DoctorViewSet)
 router.register(r'appointments', AppointmentViewSet, basename='appointment')
+router.register(r'schedule-entries', ScheduleEntryViewSet, basename='schedule-entry')
+router.register(r'stats', DailyStatsViewSet, basename='daily-stats')
 
 urlpatterns = [
-    path('', include(router.urls)),
+    # Listed before the router so 'new' is not captured as a detail pk
     path('doctors/new/', NewDoctorView.as_view(), name='new-doctor'),
     path('appointments/new/', NewAppointmentView.as_view(), name='new-appointment'),
+    path('appointments/import/', AppointmentImportView.as_view(), name='appointment-import'),
+    path('appointments/export/', AppointmentExportView.as_view(), name='appointment-export'),
+    path('async/appointments/', async_views.appointments, name='async-appointments'),
+    path('async/appointments/available_slots/', async_views.available_slots, name='async-available-slots'),
+    path('async/appointments/available_slots/stream/', async_views.slot_stream, name='async-slot-stream'),
+    path('async/appointments/<int:pk>/cancel/', async_views.cancel_appointment, name='async-appointment-cancel'),
+    path('', include(router.urls)),
     path('register/', RegistrationView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
     path('logout/', LogoutView.as_view(), name='logout'),
     
     path('profile/', UserProfileView.as_view(), name='user-profile'),
+    path('auth/cache-stats/', AuthCacheStatsView.as_view(), name='auth-cache-stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('metrics/traces/', MetricsTracesView.as_view(), name='metrics-traces'),
 ]
 
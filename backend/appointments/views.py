@@ -8,16 +8,21 @@ from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
-from django.core.mail import send_mail
 from django.utils import timezone
+from django.db import IntegrityError, transaction
 from django.conf import settings
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
+from django.db.models import Count, Q
+from django.http import HttpResponse, StreamingHttpResponse
 from datetime import datetime, timedelta
-import os
+import io
 from django.views.decorators.csrf import csrf_exempt
-from .models import User, Doctor, Appointment
-from .serializers import UserSerializer, DoctorSerializer, AppointmentSerializer, RegistrationSerializer, LoginSerializer
+from .models import User, Doctor, Appointment, ScheduleEntry
+from . import availability, avatars, booking, bulk, metrics, reminders, schedules, search, stats
+from .authentication import token_cache
+from .caching import appointment_versions, doctor_directory
+from .fieldsets import SparseFieldsViewMixin
+from .pagination import AppointmentCursorPagination, IdCursorPagination
+from .serializers import UserSerializer, DoctorSerializer, AppointmentSerializer, RegistrationSerializer, LoginSerializer, ScheduleEntrySerializer
 
 class RegistrationView(APIView):
     permission_classes = [AllowAny]
@@ -61,11 +66,43 @@ class LogoutView(APIView):
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class UserViewSet(viewsets.ModelViewSet):
+class AuthCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(token_cache.stats())
+
+class MetricsView(APIView):
+    # Scraped by Prometheus, so no session or token lookups on this path
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        token = settings.METRICS_TOKEN
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return Response({'error': 'Invalid metrics token'}, status=status.HTTP_403_FORBIDDEN)
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class MetricsTracesView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(list(metrics.traces))
+
+def avatar_response(user, future):
+    # 202 while thumbnails are still being generated; clients re-read the profile
+    if not future.done():
+        return Response(UserSerializer(user).data, status=status.HTTP_202_ACCEPTED)
+    future.result()
+    user.refresh_from_db(fields=['avatar'])
+    return Response(UserSerializer(user).data)
+
+class UserViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser, JSONParser)
+    pagination_class = IdCursorPagination
 
     def get_queryset(self):
         if self.request.user.is_staff:
@@ -78,38 +115,228 @@ class UserViewSet(viewsets.ModelViewSet):
         if 'avatar' not in request.FILES:
             return Response({'error': 'No avatar file provided'}, status=status.HTTP_400_BAD_REQUEST)
 
-        file = request.FILES['avatar']
-        if user.avatar:
-            if os.path.isfile(user.avatar.path):
-                os.remove(user.avatar.path)
-
-        filename = f'avatars/user_{user.id}_{file.name}'
-        user.avatar = filename
-        path = default_storage.save(filename, ContentFile(file.read()))
-        user.save()
-
-        return Response(UserSerializer(user).data)
-
-class DoctorViewSet(viewsets.ModelViewSet):
+        try:
+            future = avatars.submit(user, request.FILES['avatar'])
+        except avatars.InvalidAvatar as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return avatar_response(user, future)
+
+class DoctorViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
+    """
+    Doctors in id order. ``?q=`` searches names and specializations by word
+    prefix (falling back to trigram matches), ``?specialization=`` filters on
+    one facet, and ``?ordering=next_available`` puts the soonest free first.
+    """
     queryset = Doctor.objects.all()
     serializer_class = DoctorSerializer
     permission_classes = [AllowAny]
+    pagination_class = IdCursorPagination
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [IsAdminUser()]
         return super().get_permissions()
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'facets'):
+            return queryset
+        specialization = self.request.query_params.get('specialization')
+        # Facet counts stay unfiltered by the facet itself so the other choices keep their counts
+        if specialization and self.action == 'list':
+            queryset = queryset.filter(specialization=specialization)
+        return search.filter_doctors(queryset, self.request.query_params.get('q', ''))
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('ordering') == 'next_available':
+            return self.list_by_next_available(request)
+        return doctor_directory.response(
+            request,
+            f'list:{request.build_absolute_uri()}',
+            lambda: super(DoctorViewSet, self).list(request, *args, **kwargs).data,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return doctor_directory.response(
+            request,
+            f'detail:{kwargs["pk"]}:{request.query_params.urlencode()}',
+            lambda: super(DoctorViewSet, self).retrieve(request, *args, **kwargs).data,
+        )
+
+    def list_by_next_available(self, request):
+        # Not cached: the order changes with every booking. Ranking reads every
+        # match's schedule and bookings, so it needs a filter narrowing the
+        # matches to RANK_LIMIT, and the result is a single page.
+        doctors = list(self.get_queryset().order_by('id')[:search.RANK_LIMIT + 1])
+        if len(doctors) > search.RANK_LIMIT:
+            return Response(
+                {"error": f"Too many doctors to rank by next availability; narrow the list to at most "
+                          f"{search.RANK_LIMIT} with q or specialization"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        today = timezone.localdate()
+        free = availability.next_free(doctors, today, today + timedelta(days=search.RANK_DAYS - 1))
+        doctors.sort(key=lambda doctor: (doctor.id not in free, free.get(doctor.id, ()), doctor.id))
+        results = DoctorSerializer(doctors[:self.paginator.get_page_size(request)], many=True).data
+        for row in results:
+            day, start = free.get(row['id'], (None, None))
+            row['next_available'] = day and {'date': day.isoformat(), 'time': schedules.hhmm(start)}
+        return Response({'next': None, 'previous': None, 'results': results})
+
+    @action(detail=True, methods=['get'])
+    def schedule(self, request, pk=None):
+        """Working hours per day between ?start= and ?end=, after weekly hours, extra hours and leave."""
+        doctor = self.get_object()
+        try:
+            start_date = datetime.strptime(request.query_params['start'], '%Y-%m-%d').date()
+            end_date = datetime.strptime(request.query_params.get('end', request.query_params['start']), '%Y-%m-%d').date()
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "start is required; start/end must be YYYY-MM-DD"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if end_date < start_date or (end_date - start_date).days >= availability.MAX_RANGE_DAYS:
+            return Response(
+                {"error": f"end must be on or after start and within {availability.MAX_RANGE_DAYS} days of it"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        schedule = schedules.for_doctor(doctor)
+        days = {}
+        day = start_date
+        while day <= end_date:
+            days[day.isoformat()] = [
+                {"start": schedules.hhmm(start), "end": schedules.hhmm(end)}
+                for start, end in schedule.working(day)
+            ]
+            day += timedelta(days=1)
+        return Response({"slot_minutes": doctor.slot_minutes, "days": days})
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Doctor counts per specialization among the doctors matching ``?q=``."""
+        return doctor_directory.response(
+            request,
+            f'facets:{request.build_absolute_uri()}',
+            lambda: list(
+                self.get_queryset().order_by('specialization')
+                .values('specialization').annotate(count=Count('id'))
+            ),
+        )
+
+class ScheduleEntryViewSet(viewsets.ModelViewSet):
+    """Weekly hours, extra hours and leave; ``?doctor_id=`` narrows to one doctor and the clinic-wide entries."""
+    serializer_class = ScheduleEntrySerializer
+    permission_classes = [IsAdminUser]
+    pagination_class = IdCursorPagination
+
+    def get_queryset(self):
+        queryset = ScheduleEntry.objects.all()
+        doctor_id = self.request.query_params.get('doctor_id')
+        if doctor_id:
+            queryset = queryset.filter(Q(doctor_id=doctor_id) | Q(doctor__isnull=True))
+        return queryset
+
+class DailyStatsViewSet(viewsets.GenericViewSet):
+    """
+    Appointment counts, utilization and cancellation rates between ``?start=``
+    and ``?end=``, read from the DailyStats rollup. ``?specialization=`` or
+    ``?doctor_id=`` narrow the doctors counted.
+    """
+    permission_classes = [IsAdminUser]
+    pagination_class = IdCursorPagination
+
+    def get_queryset(self):
+        queryset = Doctor.objects.all()
+        if self.request.query_params.get('specialization'):
+            queryset = queryset.filter(specialization=self.request.query_params['specialization'])
+        if self.request.query_params.get('doctor_id'):
+            queryset = queryset.filter(id=self.request.query_params['doctor_id'])
+        return queryset
+
+    def date_range(self, request):
+        """The requested (start, end) days, or an error Response."""
+        try:
+            start_date = datetime.strptime(request.query_params['start'], '%Y-%m-%d').date()
+            end_date = datetime.strptime(request.query_params.get('end', request.query_params['start']), '%Y-%m-%d').date()
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "start is required; start/end must be YYYY-MM-DD"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if end_date < start_date or (end_date - start_date).days >= stats.MAX_RANGE_DAYS:
+            return Response(
+                {"error": f"end must be on or after start and within {stats.MAX_RANGE_DAYS} days of it"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return start_date, end_date
+
+    @action(detail=False, methods=['get'])
+    def doctors(self, request):
+        """Totals over the range per doctor, one page of doctors at a time."""
+        found = self.date_range(request)
+        if isinstance(found, Response):
+            return found
+        try:
+            page = self.paginate_queryset(self.get_queryset())
+        except ValueError:
+            return Response({"error": "doctor_id must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        totals = stats.by_doctor(page, *found)
+        return self.get_paginated_response([
+            {"id": doctor.id, "name": doctor.name, "specialization": doctor.specialization, **totals[doctor.id]}
+            for doctor in page
+        ])
+
+    @action(detail=False, methods=['get'])
+    def days(self, request):
+        """Totals per day across the selected doctors."""
+        found = self.date_range(request)
+        if isinstance(found, Response):
+            return found
+        try:
+            days = stats.by_day(self.get_queryset(), *found)
+        except ValueError:
+            return Response({"error": "doctor_id must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"start": found[0], "end": found[1], "days": days})
+
+class AppointmentViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated]
-    
+    pagination_class = AppointmentCursorPagination
+
     def get_queryset(self):
-        return Appointment.objects.filter(patient=self.request.user)
+        queryset = Appointment.objects.filter(patient=self.request.user)
+        if self.action in self.sparse_actions:
+            # filter_queryset loads the columns the selected fields need
+            return queryset
+        # Actions such as cancel also read the patient's email
+        return queryset.select_related('doctor', 'patient')
+
+    def list(self, request, *args, **kwargs):
+        # Validated against the patient's version counter: an unchanged list is
+        # a 304 without a query or any serialization
+        return appointment_versions.conditional(
+            request,
+            lambda: super(AppointmentViewSet, self).list(request, *args, **kwargs),
+            (request.user.id, ''),
+            private=True,
+        )
 
     def perform_create(self, serializer):
         serializer.save(patient=self.request.user)
 
+    def update(self, request, *args, **kwargs):
+        # Moving onto a booked slot trips the same constraint as creating on one
+        try:
+            with transaction.atomic():
+                return super().update(request, *args, **kwargs)
+        except IntegrityError:
+            return Response(
+                {"error": "This time slot is already booked"},
+                status=status.HTTP_409_CONFLICT
+            )
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
@@ -119,80 +346,30 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            doctor = serializer.validated_data['doctor']
-            appointment_date = serializer.validated_data['date']
-            existing_appointment = Appointment.objects.filter(
-                doctor=doctor,
-                date__date=appointment_date.date(),
-                date__hour=appointment_date.hour,
-                date__minute=appointment_date.minute,
-                status='scheduled'
-            ).first()
-
-            if existing_appointment:
+            serializer.validated_data['status'] = 'scheduled'
+            try:
+                with transaction.atomic():
+                    self.perform_create(serializer)
+                    booking.confirm(serializer.instance)
+            except IntegrityError:
                 return Response(
                     {"error": "This time slot is already booked"},
-                    status=status.HTTP_400_BAD_REQUEST
+                    status=status.HTTP_409_CONFLICT
                 )
 
-            serializer.validated_data['status'] = 'scheduled'
-            appointment = self.perform_create(serializer)
-            
-            # Send confirmation email
-            try:
-                send_mail(
-                    'Appointment Confirmation',
-                    f'Your appointment with Dr. {doctor.name} has been scheduled for {appointment_date.strftime("%B %d, %Y at %I:%M %p")}.',
-                    settings.DEFAULT_FROM_EMAIL,
-                    [request.user.email],
-                    fail_silently=True,
-                )
-            except Exception as e:
-                print(f"Failed to send confirmation email: {str(e)}")
-            
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         appointment = self.get_object()
-        
-        if appointment.status != 'scheduled':
-            return Response(
-                {"error": f"Cannot cancel appointment with status '{appointment.status}'"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        current_time = timezone.now()
-        appointment_datetime = timezone.localtime(appointment.date)
-        
-        if appointment_datetime < current_time:
-            return Response(
-                {"error": "Cannot cancel past appointments"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        time_difference = appointment_datetime - current_time
-        if time_difference.total_seconds() < 3600:
-            return Response(
-                {"error": "Cannot cancel appointments less than 1 hour before the scheduled time"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        appointment.status = 'cancelled'
-        appointment.save()
-        
-        try:
-            send_mail(
-                'Appointment Cancelled',
-                f'Your appointment with Dr. {appointment.doctor.name} on {appointment.date.strftime("%B %d, %Y at %I:%M %p")} has been cancelled.',
-                settings.DEFAULT_FROM_EMAIL,
-                [appointment.patient.email],
-                fail_silently=True,
-            )
-        except Exception as e:
-            print(f"Failed to send cancellation email: {str(e)}")
-        
+
+        error = booking.cancellation_error(appointment)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        booking.cancel(appointment)
+
         return Response({
             "message": "Appointment cancelled successfully",
             "status": "cancelled"
@@ -218,31 +395,66 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        all_slots = []
-        start_time = datetime.combine(selected_date, datetime.min.time().replace(hour=9))
-        end_time = datetime.combine(selected_date, datetime.min.time().replace(hour=17))
-
-        existing_appointments = Appointment.objects.filter(
-            doctor=doctor,
-            date__date=selected_date,
-            status='scheduled'
-        ).values_list('date', flat=True)
-
-        current_slot = start_time
-        while current_slot < end_time:
-            slot_end = current_slot + timedelta(minutes=30)
-            is_available = not any(
-                appointment.time() >= current_slot.time() and appointment.time() < slot_end.time()
-                for appointment in existing_appointments
+        all_slots = availability.day_slots(doctor, selected_date)
+
+        return Response(all_slots)
+
+    @action(detail=False, methods=['get'], url_path='availability')
+    def availability_range(self, request):
+        params = request.query_params
+        try:
+            start_date = datetime.strptime(params['start'], '%Y-%m-%d').date()
+            end_date = datetime.strptime(params.get('end', params['start']), '%Y-%m-%d').date()
+            doctor_ids = [int(pk) for pk in params['doctor_ids'].split(',')] if params.get('doctor_ids') else None
+            first = int(params['first']) if params.get('first') else None
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "start is required; start/end must be YYYY-MM-DD, doctor_ids a comma separated list of ids and first a number"},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-            all_slots.append({
-                'time': current_slot.strftime('%H:%M'),
-                'is_available': is_available
+        if end_date < start_date or (end_date - start_date).days >= availability.MAX_RANGE_DAYS:
+            return Response(
+                {"error": f"end must be on or after start and within {availability.MAX_RANGE_DAYS} days of it"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if first is not None and first < 1:
+            return Response({"error": "first must be positive"}, status=status.HTTP_400_BAD_REQUEST)
+
+        doctors = Doctor.objects.order_by('id')
+        if doctor_ids:
+            doctors = doctors.filter(id__in=doctor_ids)
+        if params.get('specialization'):
+            doctors = doctors.filter(specialization__iexact=params['specialization'])
+        doctors = list(doctors[:availability.MAX_RANGE_DOCTORS + 1])
+        if len(doctors) > availability.MAX_RANGE_DOCTORS:
+            return Response(
+                {"error": f"Too many doctors for one availability query; narrow them to at most "
+                          f"{availability.MAX_RANGE_DOCTORS} with doctor_ids or specialization"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if first is not None:
+            return Response({
+                "start": start_date,
+                "end": end_date,
+                "slots": availability.first_free(doctors, start_date, end_date, first),
             })
-            current_slot += timedelta(minutes=30)
 
-        return Response(all_slots)
+        matrix = availability.range_matrix(doctors, start_date, end_date)
+        return Response({
+            "start": start_date,
+            "end": end_date,
+            "doctors": [
+                {
+                    "id": doctor.id,
+                    "name": doctor.name,
+                    "specialization": doctor.specialization,
+                    "days": matrix[doctor.id],
+                }
+                for doctor in doctors
+            ],
+        })
 
 class UserProfileView(APIView):
     permission_classes = [IsAuthenticated]
@@ -253,7 +465,9 @@ class UserProfileView(APIView):
         return Response(serializer.data)
 
     def patch(self, request):
-        serializer = UserSerializer(request.user, data=request.data, partial=True)
+        # request.user may be a copy from the token cache; edit the current row
+        user = User.objects.get(pk=request.user.pk)
+        serializer = UserSerializer(user, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
@@ -267,31 +481,12 @@ class UserProfileView(APIView):
             )
 
         try:
-            file = request.FILES['avatar']
-            
-            # Validate file type
-            allowed_types = ['image/jpeg', 'image/png', 'image/gif']
-            if file.content_type not in allowed_types:
-                return Response(
-                    {'error': 'Unsupported file type. Please upload JPEG, PNG, or GIF'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            # Delete old avatar if it exists
-            if request.user.avatar:
-                old_path = request.user.avatar.path
-                if os.path.isfile(old_path):
-                    os.remove(old_path)
-
-            # Save new avatar
-            filename = f'avatars/user_{request.user.id}_{file.name}'
-            request.user.avatar = filename
-            request.user.save()
-            
-            # Save the file using default storage
-            default_storage.save(filename, ContentFile(file.read()))
-
-            return Response(UserSerializer(request.user).data)
+            # Resizing happens in the avatar worker pool; only validation and
+            # streaming the upload to disk happen here
+            future = avatars.submit(request.user, request.FILES['avatar'])
+            return avatar_response(request.user, future)
+        except avatars.InvalidAvatar as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response(
                 {'error': f'Failed to upload avatar: {str(e)}'}, 
@@ -302,8 +497,11 @@ class NewAppointmentView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        doctors = Doctor.objects.all()
-        
+        doctors = doctor_directory.get_or_build(
+            'all',
+            lambda: DoctorSerializer(Doctor.objects.all(), many=True).data,
+        )
+
         return Response({
             "message": "Ready to create new appointment",
             "fields": [
@@ -312,7 +510,7 @@ class NewAppointmentView(APIView):
                 {"name": "time", "type": "time", "required": True},
                 {"name": "notes", "type": "text", "required": False}
             ],
-            "doctors": DoctorSerializer(doctors, many=True).data,
+            "doctors": doctors,
         })
 
     def post(self, request):
@@ -338,7 +536,7 @@ class NewAppointmentView(APIView):
         request.data['date'] = appointment_datetime
         request.data['patient'] = request.user.id
 
-        serializer = AppointmentSerializer(data=request.data)
+        serializer = AppointmentSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             if appointment_datetime < timezone.now():
                 return Response(
@@ -346,35 +544,59 @@ class NewAppointmentView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            existing_appointment = Appointment.objects.filter(
-                doctor=serializer.validated_data['doctor'],
-                date=appointment_datetime,
-                status='scheduled'
-            ).exists()
-
-            if existing_appointment:
+            try:
+                with transaction.atomic():
+                    appointment = serializer.save()
+                    booking.confirm(appointment)
+            except IntegrityError:
                 return Response(
                     {"error": "This time slot is already booked"},
-                    status=status.HTTP_400_BAD_REQUEST
+                    status=status.HTTP_409_CONFLICT
                 )
 
-            appointment = serializer.save()
-            
-            # Send confirmation email
-            try:
-                send_mail(
-                    'Appointment Confirmation',
-                    f'Your appointment with Dr. {appointment.doctor.name} has been scheduled for {appointment_datetime.strftime("%B %d, %Y at %I:%M %p")}.',
-                    settings.DEFAULT_FROM_EMAIL,
-                    [request.user.email],
-                    fail_silently=True,
-                )
-            except Exception as e:
-                print(f"Failed to send confirmation email: {str(e)}")
-            
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class AppointmentImportView(APIView):
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+        fmt = request.data.get('type') or upload.name.rsplit('.', 1)[-1].lower()
+        if fmt not in bulk.FORMATS:
+            return Response(
+                {'error': f'type must be one of {", ".join(bulk.FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+        report = bulk.import_appointments(bulk.read_rows(stream, fmt))
+        return Response(report.as_dict())
+
+class AppointmentExportView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        fmt = request.query_params.get('type', 'csv')
+        if fmt not in bulk.FORMATS:
+            return Response(
+                {'error': f'type must be one of {", ".join(bulk.FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        appointments = Appointment.objects.all()
+        if request.query_params.get('status'):
+            appointments = appointments.filter(status=request.query_params['status'])
+
+        content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(bulk.export_rows(appointments, fmt), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="appointments.{fmt}"'
+        return response
+
 class NewDoctorView(APIView):
     permission_classes = [IsAdminUser]
 
@@ -397,18 +619,5 @@ class NewDoctorView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 def send_appointment_reminders():
-    tomorrow = timezone.now().date() + timedelta(days=1)
-    appointments = Appointment.objects.filter(date__date=tomorrow, status='scheduled')
-    
-    for appointment in appointments:
-        try:
-            send_mail(
-                'Appointment Reminder',
-                f'You have an appointment with Dr. {appointment.doctor.name} tomorrow at {appointment.date.strftime("%I:%M %p")}.',
-                settings.DEFAULT_FROM_EMAIL,
-                [appointment.patient.email],
-                fail_silently=True,
-            )
-        except Exception as e:
-            print(f"Failed to send reminder for appointment {appointment.id}: {str(e)}")
-
+    # Kept for existing callers; the work lives in `manage.py send_appointment_reminders`
+    return reminders.send_reminders()
\ No newline at end of file
@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'appointments.metrics.MetricsMiddleware',
+    'appointments.compression.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -56,13 +58,30 @@ MIDDLEWARE = [
 ]
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'appointments.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'appointments.metrics.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
+# /api/metrics/ is open unless a token is set; scrapers then send "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Fraction of requests whose SQL is kept in /api/metrics/traces/
+METRICS_TRACE_SAMPLE_RATE = float(os.environ.get('METRICS_TRACE_SAMPLE_RATE', '0.01'))
+# Token -> user lookups are cached per process (TTL in seconds) and in the shared cache
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = 60
+TOKEN_CACHE_SHARED_TTL = 300
+# Seconds a worker may serve a logged-out or deactivated user from its own tier
+TOKEN_CACHE_CHECK_INTERVAL = 1
+# Cursor pagination defaults for the list endpoints (see appointments/pagination.py)
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 CORS_ALLOW_ALL_ORIGINS = True
@@ -89,6 +108,9 @@ CORS_ALLOW_HEADERS = [
     'x-requested-with',
     'cache-control',
 ]
+# Emails are queued in appointments.OutboxEmail and sent by `manage.py send_outbox_emails`.
+# Use django.core.mail.backends.console.EmailBackend to print them locally.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
 CSRF_COOKIE_NAME = 'csrftoken'
 CSRF_HEADER_NAME = 'HTTP_X_CSRFTOKEN'
 TEMPLATES = [
@@ -112,14 +134,91 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+# SQLite by default. Set DB_ENGINE=postgresql with DB_NAME, DB_USER, DB_PASSWORD,
+# DB_HOST and DB_PORT for production. Connections are kept open for
+# DB_CONN_MAX_AGE seconds and checked before reuse; DB_POOL=1 switches
+# PostgreSQL to psycopg's connection pool instead.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite3')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+
+if DB_ENGINE in ('postgresql', 'postgres'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'appointments'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('DB_POOL'):
+        # Pooled connections replace persistent ones (requires psycopg[pool])
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Seconds to wait for a lock before failing (SQLite's busy_timeout)
+                'timeout': int(os.environ.get('DB_BUSY_TIMEOUT', '20')),
+                # Take the write lock when a transaction starts: concurrent writers
+                # then queue on the busy timeout instead of failing with
+                # "database is locked" when a read lock cannot be upgraded.
+                'transaction_mode': 'IMMEDIATE',
+                # Run on every new connection. WAL lets readers continue during a
+                # write, and synchronous=NORMAL is still crash safe in WAL mode.
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    f"PRAGMA mmap_size={int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024))};"
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+            },
+            # A file-backed test database so threaded tests see real SQLite locking
+            # instead of the table locks of a shared in-memory database.
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        }
+    }
 
-DATABASES = {
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at Redis or
+# Memcached to share availability and directory caches between workers.
+# Multi-worker deployments need a shared cache: invalidations made in one
+# worker never reach another's local memory, so there cached entries only
+# live for PROCESS_LOCAL_CACHE_TIMEOUT seconds.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
+# Live slot updates (/api/async/appointments/available_slots/stream/) need an
+# ASGI server: under WSGI Django buffers the stream to its end. The endpoint
+# answers 404 unless enabled, and clients poll available_slots instead.
+SLOT_STREAM_ENABLED = os.environ.get('SLOT_STREAM_ENABLED', '') == '1'
+# Events reach streams in the publishing process only; run a single ASGI
+# worker or set a backend that relays events between workers.
+SLOT_EVENTS_BACKEND = os.environ.get('SLOT_EVENTS_BACKEND', 'appointments.events.LocalBackend')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -1,8 +1,28 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from django.views.static import serve
+
+
+def serve_avatar(request, path, document_root=None):
+    # Thumbnail names contain the image hash, so browsers never need to revalidate.
+    # Production servers should send the same header for /media/avatars/<xx>/.
+    response = serve(request, path, document_root=document_root)
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('appointments.urls')),  # This includes all routes from the appointments app
-]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+]
+if settings.DEBUG:
+    urlpatterns += [
+        re_path(
+            r'^%s(?P<path>avatars/[0-9a-f]{2}/[0-9a-f]{64}_\d+\.(?:webp|jpg))$' % settings.MEDIA_URL.lstrip('/'),
+            serve_avatar,
+            {'document_root': settings.MEDIA_ROOT},
+        ),
+    ]
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -1,6 +1,6 @@
 "use client"
 
-import { useEffect, useState } from "react"
+import { useState } from "react"
 import { useRouter } from "next/navigation"
 import type { Appointment } from "@/types"
 import { ENDPOINTS } from "@/config/api"
@@ -22,32 +22,25 @@ import {
 import { useToast } from "@/hooks/use-toast"
 import { fetchWithAuth } from "@/utils/api"
 import { useAuth } from "@/hooks/useAuth"
+import { useCursorList } from "@/hooks/useCursorList"
+
+// Only the columns the table shows
+const APPOINTMENT_FIELDS = "id,doctor_name,date,notes,status"
 
 export function AppointmentList() {
   const router = useRouter()
   const { toast } = useToast()
-  const [appointments, setAppointments] = useState<Appointment[]>([])
-  const [error, setError] = useState<string | null>(null)
   const [isLoading, setIsLoading] = useState(false)
   const [cancellingId, setCancellingId] = useState<number | null>(null)
   const { isAuthenticated, isLoading: authIsLoading } = useAuth()
-
-  useEffect(() => {
-    if (isAuthenticated) {
-      fetchAppointments()
-    }
-  }, [isAuthenticated])
-
-  async function fetchAppointments() {
-    try {
-      const response = await fetchWithAuth(ENDPOINTS.appointments())
-      if (!response.ok) throw new Error("Failed to fetch appointments")
-      const data = await response.json()
-      setAppointments(data)
-    } catch (err) {
-      setError(err instanceof Error ? err.message : "An error occurred")
-    }
-  }
+  const {
+    items: appointments,
+    setItems: setAppointments,
+    error,
+    isLoading: pageIsLoading,
+    hasMore,
+    sentinelRef,
+  } = useCursorList<Appointment>(isAuthenticated ? `${ENDPOINTS.appointments()}?fields=${APPOINTMENT_FIELDS}` : null)
 
   async function cancelAppointment(id: number) {
     setIsLoading(true)
@@ -151,6 +144,8 @@ export function AppointmentList() {
           ))}
         </TableBody>
       </Table>
+      {hasMore && <div ref={sentinelRef} className="h-8" />}
+      {pageIsLoading && <div className="p-4 text-sm text-muted-foreground">Loading...</div>}
     </div>
   )
 }
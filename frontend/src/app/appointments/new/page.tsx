@@ -5,30 +5,27 @@ import { useRouter } from "next/navigation"
 import { Button } from "@/components/ui/button"
 import { Label } from "@/components/ui/label"
 import { Textarea } from "@/components/ui/textarea"
+import { Input } from "@/components/ui/input"
 import { Calendar } from "@/components/ui/calendar"
 import { format } from "date-fns"
 import { cn } from "@/lib/utils"
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select"
 import { ENDPOINTS } from "@/config/api"
-import type { Doctor } from "@/types"
+import type { CursorPage, Doctor } from "@/types"
 import { fetchWithAuth } from "@/utils/api"
 import { useAuth } from "@/hooks/useAuth"
+import { useLiveSlots } from "@/hooks/useLiveSlots"
 import { useToast } from "@/hooks/use-toast"
 
-interface TimeSlot {
-  time: string
-  is_available: boolean
-}
-
 export default function NewAppointment() {
   const router = useRouter()
   const { toast } = useToast()
   const { isAuthenticated, isLoading } = useAuth()
   const [isSubmitting, setIsSubmitting] = useState(false)
   const [doctors, setDoctors] = useState<Doctor[]>([])
+  const [doctorQuery, setDoctorQuery] = useState("")
   const [selectedDate, setSelectedDate] = useState<Date>()
   const [selectedDoctor, setSelectedDoctor] = useState<string>("")
-  const [availableSlots, setAvailableSlots] = useState<TimeSlot[]>([])
   const [selectedTime, setSelectedTime] = useState<string>("")
   const [notes, setNotes] = useState<string>("")
   const [error, setError] = useState<string | null>(null)
@@ -39,46 +36,45 @@ export default function NewAppointment() {
     }
   }, [isAuthenticated, isLoading, router])
 
+  // The directory is searched server-side; only the best matches are loaded
   useEffect(() => {
-    if (isAuthenticated) {
-      fetchDoctors()
-    }
-  }, [isAuthenticated])
-
-  async function fetchDoctors() {
-    try {
-      const response = await fetchWithAuth(ENDPOINTS.doctors())
-      const data = await response.json()
-      setDoctors(data)
-    } catch (error) {
-      console.error("Error:", error)
-      setError("Failed to load doctors data")
-    }
-  }
-
-  useEffect(() => {
-    async function fetchAvailableSlots() {
-      if (!selectedDoctor || !selectedDate) return
-
+    if (!isAuthenticated) return
+    let cancelled = false
+    const timer = setTimeout(async () => {
       try {
-        const response = await fetchWithAuth(
-          `${ENDPOINTS.appointments()}available_slots/?doctor_id=${selectedDoctor}&date=${format(selectedDate, "yyyy-MM-dd")}`,
-        )
-
-        if (!response.ok) {
-          throw new Error("Failed to fetch available slots")
-        }
-
-        const data = await response.json()
-        setAvailableSlots(data)
+        const params = new URLSearchParams({ page_size: "50" })
+        if (doctorQuery.trim()) params.set("q", doctorQuery.trim())
+        const response = await fetchWithAuth(`${ENDPOINTS.doctors()}?${params}`)
+        if (!response.ok) throw new Error("Failed to fetch doctors")
+        const page: CursorPage<Doctor> = await response.json()
+        if (!cancelled) setDoctors(page.results)
       } catch (error) {
         console.error("Error:", error)
-        setError("Failed to load available time slots")
+        setError("Failed to load doctors data")
       }
+    }, 250)
+    return () => {
+      cancelled = true
+      clearTimeout(timer)
     }
+  }, [isAuthenticated, doctorQuery])
 
-    fetchAvailableSlots()
-  }, [selectedDoctor, selectedDate])
+  const { slots: availableSlots, error: slotsError } = useLiveSlots(
+    selectedDoctor,
+    selectedDate ? format(selectedDate, "yyyy-MM-dd") : null,
+  )
+
+  // Someone else booked the chosen slot while this page was open
+  useEffect(() => {
+    if (selectedTime && availableSlots.some((slot) => slot.time === selectedTime && !slot.is_available)) {
+      setSelectedTime("")
+      toast({
+        title: "Slot taken",
+        description: `${selectedTime} was just booked by someone else. Please pick another time.`,
+        variant: "destructive",
+      })
+    }
+  }, [availableSlots, selectedTime, toast])
 
   async function onSubmit(event: React.FormEvent<HTMLFormElement>) {
     event.preventDefault()
@@ -141,6 +137,11 @@ export default function NewAppointment() {
       <form onSubmit={onSubmit} className="space-y-6">
         <div className="space-y-2">
           <Label htmlFor="doctor">Doctor</Label>
+          <Input
+            placeholder="Search doctors by name or specialization"
+            value={doctorQuery}
+            onChange={(e) => setDoctorQuery(e.target.value)}
+          />
           <Select
             name="doctor"
             required
@@ -193,6 +194,9 @@ export default function NewAppointment() {
                 </Button>
               ))}
             </div>
+            {availableSlots.length === 0 && (
+              <p className="text-sm text-muted-foreground">The doctor is not working on this day.</p>
+            )}
           </div>
         )}
 
@@ -201,9 +205,9 @@ export default function NewAppointment() {
           <Textarea id="notes" name="notes" value={notes} onChange={(e) => setNotes(e.target.value)} />
         </div>
 
-        {error && (
+        {(error || slotsError) && (
           <div className="rounded-md bg-destructive/15 p-4">
-            <div className="text-sm text-destructive">{error}</div>
+            <div className="text-sm text-destructive">{error || slotsError}</div>
           </div>
         )}
 
@@ -1,33 +1,62 @@
 "use client"
 
 import { useEffect, useState } from "react"
-import type { Doctor } from "@/types"
+import type { Doctor, SpecializationFacet } from "@/types"
 import { ENDPOINTS } from "@/config/api"
+import { Input } from "@/components/ui/input"
+import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select"
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from "@/components/ui/table"
-import { fetchWithAuth } from "@/utils/api"
 import { useAuth } from "@/hooks/useAuth"
+import { useCursorList } from "@/hooks/useCursorList"
+import { fetchWithAuth } from "@/utils/api"
+
+const ALL = "all"
 
 export function DoctorList() {
-  const [doctors, setDoctors] = useState<Doctor[]>([])
-  const [error, setError] = useState<string | null>(null)
   const { isAuthenticated, isLoading: authIsLoading } = useAuth()
+  const [query, setQuery] = useState("")
+  const [debouncedQuery, setDebouncedQuery] = useState("")
+  const [specialization, setSpecialization] = useState(ALL)
+  const [ordering, setOrdering] = useState("name")
+  const [facets, setFacets] = useState<SpecializationFacet[]>([])
 
+  // Search once typing pauses rather than on every keystroke
   useEffect(() => {
-    if (isAuthenticated) {
-      fetchDoctors()
-    }
-  }, [isAuthenticated])
+    const timer = setTimeout(() => setDebouncedQuery(query.trim()), 250)
+    return () => clearTimeout(timer)
+  }, [query])
+
+  // Ranking reads every match's schedule, so it needs a filter narrowing the list
+  const canRank = debouncedQuery !== "" || specialization !== ALL
+  const sortBy = canRank ? ordering : "name"
+
+  const params = new URLSearchParams()
+  if (debouncedQuery) params.set("q", debouncedQuery)
+  const facetUrl = `${ENDPOINTS.doctors()}facets/?${params}`
+  if (specialization !== ALL) params.set("specialization", specialization)
+  if (sortBy === "next_available") params.set("ordering", sortBy)
+
+  const {
+    items: doctors,
+    error,
+    isLoading,
+    hasMore,
+    sentinelRef,
+  } = useCursorList<Doctor>(isAuthenticated ? `${ENDPOINTS.doctors()}?${params}` : null)
 
-  async function fetchDoctors() {
-    try {
-      const response = await fetchWithAuth(ENDPOINTS.doctors())
-      if (!response.ok) throw new Error("Failed to fetch doctors")
-      const data = await response.json()
-      setDoctors(data)
-    } catch (err) {
-      setError(err instanceof Error ? err.message : "An error occurred")
+  useEffect(() => {
+    if (!isAuthenticated) return
+    let cancelled = false
+    fetchWithAuth(facetUrl)
+      .then((response) => (response.ok ? response.json() : []))
+      .then((data: SpecializationFacet[]) => {
+        if (!cancelled) setFacets(data)
+      })
+      .catch((err) => console.error("Error:", err))
+    return () => {
+      cancelled = true
     }
-  }
+  }, [isAuthenticated, facetUrl])
 
   if (authIsLoading) {
     return <div>Loading...</div>
@@ -37,37 +66,78 @@ export function DoctorList() {
     return null
   }
 
-  if (error) {
-    return (
-      <div className="rounded-md bg-destructive/15 p-4">
-        <div className="text-sm text-destructive">Error: {error}</div>
-      </div>
-    )
-  }
-
   return (
-    <div className="rounded-md border">
-      <Table>
-        <TableHeader>
-          <TableRow>
-            <TableHead>Name</TableHead>
-            <TableHead>Specialization</TableHead>
-            <TableHead>Email</TableHead>
-            <TableHead>Phone</TableHead>
-          </TableRow>
-        </TableHeader>
-        <TableBody>
-          {doctors.map((doctor) => (
-            <TableRow key={doctor.id}>
-              <TableCell className="font-medium">Dr. {doctor.name}</TableCell>
-              <TableCell>{doctor.specialization}</TableCell>
-              <TableCell>{doctor.email}</TableCell>
-              <TableCell>{doctor.phone}</TableCell>
-            </TableRow>
-          ))}
-        </TableBody>
-      </Table>
+    <div className="space-y-4">
+      <div className="flex flex-col gap-2 md:flex-row">
+        <Input
+          placeholder="Search by name or specialization"
+          value={query}
+          onChange={(e) => setQuery(e.target.value)}
+        />
+        <Select value={specialization} onValueChange={setSpecialization}>
+          <SelectTrigger className="md:w-64">
+            <SelectValue placeholder="Specialization" />
+          </SelectTrigger>
+          <SelectContent>
+            <SelectItem value={ALL}>All specializations</SelectItem>
+            {facets.map((facet) => (
+              <SelectItem key={facet.specialization} value={facet.specialization}>
+                {facet.specialization} ({facet.count})
+              </SelectItem>
+            ))}
+          </SelectContent>
+        </Select>
+        <Select value={sortBy} onValueChange={setOrdering}>
+          <SelectTrigger className="md:w-56">
+            <SelectValue />
+          </SelectTrigger>
+          <SelectContent>
+            <SelectItem value="name">Directory order</SelectItem>
+            <SelectItem value="next_available" disabled={!canRank}>
+              {canRank ? "Soonest available" : "Soonest available (search or pick a specialization)"}
+            </SelectItem>
+          </SelectContent>
+        </Select>
+      </div>
+      {error ? (
+        <div className="rounded-md bg-destructive/15 p-4">
+          <div className="text-sm text-destructive">Error: {error}</div>
+        </div>
+      ) : (
+        <div className="rounded-md border">
+          <Table>
+            <TableHeader>
+              <TableRow>
+                <TableHead>Name</TableHead>
+                <TableHead>Specialization</TableHead>
+                <TableHead>Email</TableHead>
+                <TableHead>Phone</TableHead>
+                {sortBy === "next_available" && <TableHead>Next available</TableHead>}
+              </TableRow>
+            </TableHeader>
+            <TableBody>
+              {doctors.map((doctor) => (
+                <TableRow key={doctor.id}>
+                  <TableCell className="font-medium">Dr. {doctor.name}</TableCell>
+                  <TableCell>{doctor.specialization}</TableCell>
+                  <TableCell>{doctor.email}</TableCell>
+                  <TableCell>{doctor.phone}</TableCell>
+                  {sortBy === "next_available" && (
+                    <TableCell>
+                      {doctor.next_available ? `${doctor.next_available.date} ${doctor.next_available.time}` : "—"}
+                    </TableCell>
+                  )}
+                </TableRow>
+              ))}
+            </TableBody>
+          </Table>
+          {hasMore && <div ref={sentinelRef} className="h-8" />}
+          {isLoading && <div className="p-4 text-sm text-muted-foreground">Loading...</div>}
+          {!isLoading && doctors.length === 0 && (
+            <div className="p-4 text-sm text-muted-foreground">No doctors match your search.</div>
+          )}
+        </div>
+      )}
     </div>
   )
 }
-
@@ -1,28 +1,23 @@
 "use client"
 
-import { useEffect, useState } from "react"
-import type { Patient } from "@/types"
+import type { User } from "@/types"
 import { ENDPOINTS } from "@/config/api"
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from "@/components/ui/table"
+import { useAuth } from "@/hooks/useAuth"
+import { useCursorList } from "@/hooks/useCursorList"
 
-export function PatientList() {
-  const [patients, setPatients] = useState<Patient[]>([])
-  const [error, setError] = useState<string | null>(null)
-
-  useEffect(() => {
-    async function fetchPatients() {
-      try {
-        const response = await fetch(ENDPOINTS.patients)
-        if (!response.ok) throw new Error("Failed to fetch patients")
-        const data = await response.json()
-        setPatients(data)
-      } catch (err) {
-        setError(err instanceof Error ? err.message : "An error occurred")
-      }
-    }
+// Only the columns the table shows; avatars and birthdays stay out of the pages
+const PATIENT_FIELDS = "id,first_name,last_name,email,phone,medical_history"
 
-    fetchPatients()
-  }, [])
+export function PatientList() {
+  const { isAuthenticated } = useAuth()
+  const {
+    items: patients,
+    error,
+    isLoading,
+    hasMore,
+    sentinelRef,
+  } = useCursorList<User>(isAuthenticated ? `${ENDPOINTS.users()}?fields=${PATIENT_FIELDS}` : null)
 
   if (error) {
     return (
@@ -46,7 +41,9 @@ export function PatientList() {
         <TableBody>
           {patients.map((patient) => (
             <TableRow key={patient.id}>
-              <TableCell className="font-medium">{patient.name}</TableCell>
+              <TableCell className="font-medium">
+                {patient.first_name} {patient.last_name}
+              </TableCell>
               <TableCell>{patient.email}</TableCell>
               <TableCell>{patient.phone}</TableCell>
               <TableCell className="max-w-[300px] truncate">{patient.medical_history}</TableCell>
@@ -54,6 +51,8 @@ export function PatientList() {
           ))}
         </TableBody>
       </Table>
+      {hasMore && <div ref={sentinelRef} className="h-8" />}
+      {isLoading && <div className="p-4 text-sm text-muted-foreground">Loading...</div>}
     </div>
   )
 }
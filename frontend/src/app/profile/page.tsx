@@ -11,7 +11,7 @@ import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/com
 import { useToast } from "@/hooks/use-toast"
 import { ENDPOINTS } from "@/config/api"
 import { fetchWithAuth } from "@/utils/api"
-import { getMediaUrl } from "@/config/api"
+import { getAvatarUrl } from "@/config/api"
 import { useAuth } from "@/hooks/useAuth"
 import { Loader2, Camera } from "lucide-react"
 import {
@@ -35,6 +35,7 @@ interface UserProfile {
   birthday?: string
   medical_history?: string
   avatar?: string
+  avatar_thumbnails?: Record<string, string>
 }
 
 export default function ProfilePage() {
@@ -142,7 +143,17 @@ export default function ProfilePage() {
         throw new Error(errorData.error || "Failed to upload avatar")
       }
 
-      const updatedProfile = await response.json()
+      let updatedProfile = await response.json()
+      if (response.status === 202) {
+        // Thumbnails are generated in the background; wait for the profile to point at them
+        const previousAvatar = profile?.avatar
+        for (let attempt = 0; attempt < 10 && updatedProfile.avatar === previousAvatar; attempt++) {
+          await new Promise((resolve) => setTimeout(resolve, 500))
+          const refreshed = await fetchWithAuth(ENDPOINTS.userProfile)
+          if (!refreshed.ok) break
+          updatedProfile = await refreshed.json()
+        }
+      }
       setProfile(updatedProfile)
       localStorage.setItem("user", JSON.stringify(updatedProfile))
 
@@ -208,7 +219,7 @@ export default function ProfilePage() {
           <div className="flex items-center space-x-4">
             <div className="relative">
             <Avatar className="h-20 w-20">
-  <AvatarImage src={getMediaUrl(profile.avatar)} alt={profile.username} />
+  <AvatarImage src={getAvatarUrl(profile, 80)} alt={profile.username} />
   <AvatarFallback>
     {profile.first_name?.[0]}
     {profile.last_name?.[0]}
@@ -6,7 +6,7 @@ import { useEffect, useState } from "react"
 import { useRouter } from "next/navigation"
 import { Button } from "@/components/ui/button"
 import { ENDPOINTS } from "@/config/api"
-import { getMediaUrl } from "@/config/api"
+import { getAvatarUrl } from "@/config/api"
 import {
   DropdownMenu,
   DropdownMenuContent,
@@ -31,6 +31,7 @@ interface UserData {
   first_name: string
   last_name: string
   avatar?: string
+  avatar_thumbnails?: Record<string, string>
 }
 
 export function MainNav() {
@@ -114,7 +115,7 @@ export function MainNav() {
                   <DropdownMenuTrigger asChild>
                     <Button variant="ghost" className="relative h-10 w-10 rounded-full">
                     <Avatar className="h-10 w-10">
-  <AvatarImage src={getMediaUrl(userData?.avatar)} alt={userData?.username} />
+  <AvatarImage src={getAvatarUrl(userData, 40)} alt={userData?.username} />
   <AvatarFallback>{getInitials(userData)}</AvatarFallback>
 </Avatar>
                     </Button>
@@ -2,6 +2,8 @@
 export const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000/api"
 export const FRONTEND_BASE_URL = process.env.NEXT_PUBLIC_FRONTEND_URL || "http://localhost:3000"
 export const MEDIA_BASE_URL = process.env.NEXT_PUBLIC_MEDIA_URL || "http://localhost:8000"
+// The slot stream needs the backend under ASGI with SLOT_STREAM_ENABLED=1; otherwise slots are polled
+export const SLOT_STREAM_ENABLED = process.env.NEXT_PUBLIC_SLOT_STREAM === "1"
 const createResourceUrl = (baseUrl: string, id?: number | string) => {
   return id ? `${baseUrl}${id}/` : baseUrl
 }
@@ -15,6 +17,9 @@ export const ENDPOINTS = {
 
   // Action endpoints
   newAppointment: `${API_BASE_URL}/appointments/new/`,
+  availableSlots: `${API_BASE_URL}/appointments/available_slots/`,
+  slotStream: `${API_BASE_URL}/async/appointments/available_slots/stream/`,
+  availability: `${API_BASE_URL}/appointments/availability/`,
   newUser: `${API_BASE_URL}/users/new/`,
   newDoctor: `${API_BASE_URL}/doctors/new/`,
 
@@ -32,6 +37,20 @@ export const getMediaUrl = (path?: string) => {
   // Otherwise, combine it with the media base URL
   return `${MEDIA_BASE_URL}${path.startsWith("/") ? "" : "/"}${path}`
 }
+
+// Picks the smallest resized avatar that still covers `pixels` at 2x density,
+// falling back to the largest one and then to the original upload.
+export const getAvatarUrl = (
+  user?: { avatar?: string | null; avatar_thumbnails?: Record<string, string> } | null,
+  pixels = 40,
+) => {
+  const thumbnails = user?.avatar_thumbnails ?? {}
+  const sizes = Object.keys(thumbnails)
+    .map(Number)
+    .sort((a, b) => a - b)
+  const size = sizes.find((candidate) => candidate >= pixels * 2) ?? sizes[sizes.length - 1]
+  return getMediaUrl(size ? thumbnails[String(size)] : user?.avatar ?? undefined)
+}
 // Frontend routes
 export const ROUTES = {
   appointments: {
@@ -0,0 +1,74 @@
+"use client"
+
+import { useCallback, useEffect, useRef, useState } from "react"
+import type { CursorPage } from "@/types"
+import { fetchWithAuth } from "@/utils/api"
+
+// Loads a cursor-paginated list endpoint page by page. Attach `sentinelRef` to an
+// element below the list and the next page is fetched as it scrolls into view.
+export function useCursorList<T>(url: string | null) {
+  const [items, setItems] = useState<T[]>([])
+  const [nextUrl, setNextUrl] = useState<string | null>(null)
+  const [error, setError] = useState<string | null>(null)
+  const [isLoading, setIsLoading] = useState(false)
+  const loadingRef = useRef(false)
+  // Bumped whenever the list restarts, so pages of a superseded URL are dropped
+  const generationRef = useRef(0)
+  const sentinelRef = useRef<HTMLDivElement | null>(null)
+
+  const loadPage = useCallback(async (pageUrl: string, reset: boolean) => {
+    if (loadingRef.current && !reset) return
+    const generation = reset ? ++generationRef.current : generationRef.current
+    loadingRef.current = true
+    setIsLoading(true)
+    try {
+      const response = await fetchWithAuth(pageUrl)
+      if (!response.ok) {
+        // Show the API's own message when it sends one
+        const body = await response.json().catch(() => null)
+        throw new Error(body?.error || "Failed to fetch data")
+      }
+      const data: CursorPage<T> = await response.json()
+      if (generation !== generationRef.current) return
+      setItems((current) => (reset ? data.results : [...current, ...data.results]))
+      setNextUrl(data.next)
+      setError(null)
+    } catch (err) {
+      if (generation !== generationRef.current) return
+      setError(err instanceof Error ? err.message : "An error occurred")
+    } finally {
+      if (generation === generationRef.current) {
+        loadingRef.current = false
+        setIsLoading(false)
+      }
+    }
+  }, [])
+
+  useEffect(() => {
+    if (url) {
+      loadPage(url, true)
+    }
+  }, [url, loadPage])
+
+  const loadMore = useCallback(() => {
+    if (nextUrl) {
+      loadPage(nextUrl, false)
+    }
+  }, [nextUrl, loadPage])
+
+  useEffect(() => {
+    const node = sentinelRef.current
+    if (!node || !nextUrl) return
+
+    const observer = new IntersectionObserver(
+      (entries) => {
+        if (entries[0].isIntersecting) loadMore()
+      },
+      { rootMargin: "200px" },
+    )
+    observer.observe(node)
+    return () => observer.disconnect()
+  }, [nextUrl, loadMore])
+
+  return { items, setItems, error, isLoading, hasMore: nextUrl !== null, loadMore, sentinelRef }
+}
@@ -0,0 +1,113 @@
+"use client"
+
+import { useEffect, useState } from "react"
+import { ENDPOINTS, SLOT_STREAM_ENABLED } from "@/config/api"
+import { fetchWithAuth } from "@/utils/api"
+
+export interface TimeSlot {
+  time: string
+  is_available: boolean
+}
+
+interface SlotEvent {
+  event: string
+  data: string
+}
+
+const MAX_RETRY_MS = 30000
+const POLL_MS = 15000
+
+// Splits a server-sent events body into events, returning the unparsed remainder
+function parseEvents(buffer: string, onEvent: (event: SlotEvent) => void, onRetry: (ms: number) => void) {
+  const blocks = buffer.split("\n\n")
+  const rest = blocks.pop() ?? ""
+  for (const block of blocks) {
+    const event: SlotEvent = { event: "message", data: "" }
+    for (const line of block.split("\n")) {
+      if (line.startsWith("event: ")) event.event = line.slice(7)
+      else if (line.startsWith("data: ")) event.data += line.slice(6)
+      else if (line.startsWith("retry: ")) onRetry(Number(line.slice(7)))
+    }
+    if (event.data) onEvent(event)
+  }
+  return rest
+}
+
+// Slots of one doctor's day, kept current by polling available_slots or, where
+// the backend runs under ASGI with the stream enabled, by the server's slot
+// stream. The stream is read with fetch rather than EventSource so the token
+// can go in a header.
+export function useLiveSlots(doctorId: string, date: string | null) {
+  const [slots, setSlots] = useState<TimeSlot[]>([])
+  const [error, setError] = useState<string | null>(null)
+
+  useEffect(() => {
+    if (!doctorId || !date) return
+    const controller = new AbortController()
+    const query = `?doctor_id=${doctorId}&date=${date}`
+    let retryMs = 3000
+    let failures = 0
+    let timer: ReturnType<typeof setTimeout> | undefined
+    let interval: ReturnType<typeof setInterval> | undefined
+
+    function apply(event: SlotEvent) {
+      const data = JSON.parse(event.data)
+      if (event.event === "snapshot") {
+        setSlots(data)
+      } else if (event.event === "taken" || event.event === "freed") {
+        setSlots((current) =>
+          current.map((slot) => (slot.time === data.time ? { ...slot, is_available: data.is_available } : slot)),
+        )
+      }
+    }
+
+    async function load() {
+      try {
+        const response = await fetchWithAuth(`${ENDPOINTS.availableSlots}${query}`, { signal: controller.signal })
+        if (!response.ok) throw new Error("Failed to fetch available slots")
+        setSlots(await response.json())
+      } catch (err) {
+        if (controller.signal.aborted) return
+        console.error("Error:", err)
+        setError("Failed to load available time slots")
+      }
+    }
+
+    async function stream() {
+      try {
+        const response = await fetchWithAuth(`${ENDPOINTS.slotStream}${query}`, { signal: controller.signal })
+        // Client errors (404: stream not enabled) will not fix themselves; poll instead
+        if (response.status >= 400 && response.status < 500) return poll()
+        if (!response.ok || !response.body) throw new Error("Slot stream unavailable")
+        failures = 0
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+        let buffer = ""
+        for (;;) {
+          const { value, done } = await reader.read()
+          if (done) break
+          buffer = parseEvents(buffer + value.replace(/\r\n/g, "\n"), apply, (ms) => (retryMs = ms))
+        }
+      } catch (err) {
+        if (controller.signal.aborted) return
+        failures += 1
+      }
+      if (!controller.signal.aborted) {
+        timer = setTimeout(stream, Math.min(retryMs * 2 ** failures, MAX_RETRY_MS))
+      }
+    }
+
+    function poll() {
+      if (!controller.signal.aborted) interval = setInterval(load, POLL_MS)
+    }
+
+    setError(null)
+    load().then(SLOT_STREAM_ENABLED ? stream : poll)
+    return () => {
+      controller.abort()
+      clearTimeout(timer)
+      clearInterval(interval)
+    }
+  }, [doctorId, date])
+
+  return { slots, error }
+}
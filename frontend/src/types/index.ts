@@ -15,6 +15,32 @@ export interface Doctor {
   specialization: string
   email: string
   phone: string
+  // Only present when listed with ?ordering=next_available
+  next_available?: { date: string; time: string } | null
+}
+
+export interface SpecializationFacet {
+  specialization: string
+  count: number
+}
+
+export interface User {
+  id: number
+  username: string
+  email: string
+  first_name: string
+  last_name: string
+  phone: string
+  birthday: string | null
+  medical_history: string
+  avatar: string | null
+  avatar_thumbnails: Record<string, string>
+}
+
+export interface CursorPage<T> {
+  next: string | null
+  previous: string | null
+  results: T[]
 }
 
 export interface Appointment {
@@ -1,4 +1,5 @@
 import { ENDPOINTS } from "@/config/api"
+import type { Appointment, CursorPage } from "@/types"
 
 export async function fetchWithAuth(url: string, options: RequestInit = {}) {
   const token = localStorage.getItem("token")
@@ -27,7 +28,8 @@ export async function fetchWithAuth(url: string, options: RequestInit = {}) {
 
 export const getAppointments = async () => {
   const response = await fetchWithAuth(ENDPOINTS.appointments())
-  return response.json()
+  const page: CursorPage<Appointment> = await response.json()
+  return page.results
 }
 
 export const createAppointment = async (appointmentData: any) => {
@@ -38,12 +40,7 @@ export const createAppointment = async (appointmentData: any) => {
   return response.json()
 }
 
-export const getDoctors = async () => {
-    const response = await fetchWithAuth(ENDPOINTS.doctors())
-    return response.json()
-  }
-  
-  export const createDoctor = async (doctorData: any) => {
+export const createDoctor = async (doctorData: any) => {
     const response = await fetchWithAuth(ENDPOINTS.doctors(), {
       method: "POST",
       body: JSON.stringify(doctorData),